@@ -128,6 +128,19 @@ CREATE TABLE IF NOT EXISTS units (
   CONSTRAINT fk_units_parent FOREIGN KEY (parent_unit_id) REFERENCES units(id) ON DELETE SET NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+/* Clausura de la jerarquía de unidades: un par (ancestro, descendiente) por fila,
+   incluida la propia unidad con depth = 0. La mantiene ws/hierarchy.py. */
+CREATE TABLE IF NOT EXISTS unit_closure (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  ancestor_id INT NOT NULL,
+  descendant_id INT NOT NULL,
+  depth SMALLINT UNSIGNED NOT NULL,
+  CONSTRAINT fk_uc_ancestor FOREIGN KEY (ancestor_id) REFERENCES units(id) ON DELETE CASCADE,
+  CONSTRAINT fk_uc_descendant FOREIGN KEY (descendant_id) REFERENCES units(id) ON DELETE CASCADE,
+  UNIQUE KEY uk_unit_closure (ancestor_id, descendant_id),
+  INDEX idx_unit_closure_desc (descendant_id, depth)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 
 
 
@@ -192,6 +205,25 @@ FROM units u
 LEFT JOIN units p ON u.parent_unit_id = p.id
 ORDER BY COALESCE(p.code, u.code), u.code;
 
+-- Recalcular unit_closure (los INSERT de arriba no pasan por Django).
+-- Equivale a: python manage.py rebuild_unit_closure
+START TRANSACTION;
+
+DELETE FROM unit_closure;
+
+INSERT INTO unit_closure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+  SELECT id, id, 0 FROM units
+  UNION ALL
+  SELECT u.parent_unit_id, t.descendant_id, t.depth + 1
+  FROM tree t
+  JOIN units u ON u.id = t.ancestor_id
+  WHERE u.parent_unit_id IS NOT NULL
+)
+SELECT ancestor_id, descendant_id, depth FROM tree;
+
+COMMIT;
+
 
 
 
@@ -473,7 +505,9 @@ CREATE TABLE IF NOT EXISTS personnel_permissions (
   CONSTRAINT fk_pp_personnel FOREIGN KEY (personnel_id) REFERENCES personnel(id) ON DELETE CASCADE,
   CONSTRAINT fk_pp_permission FOREIGN KEY (permission_id) REFERENCES permissions(id) ON DELETE CASCADE,
   CONSTRAINT fk_pp_granted_by FOREIGN KEY (granted_by) REFERENCES personnel(id) ON DELETE SET NULL,
-  UNIQUE KEY uk_person_perm (personnel_id, permission_id)
+  UNIQUE KEY uk_person_perm (personnel_id, permission_id),
+  INDEX idx_pp_person_active_exp (personnel_id, active, expires_at, permission_id),
+  INDEX idx_pp_active_expires (active, expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 
@@ -1103,7 +1137,10 @@ CREATE TABLE IF NOT EXISTS special_access_grants (
   CONSTRAINT fk_sag_zone FOREIGN KEY (zone_id) REFERENCES restricted_zones(id) ON DELETE CASCADE,
   CONSTRAINT fk_sag_personnel FOREIGN KEY (personnel_id) REFERENCES personnel(id) ON DELETE CASCADE,
   CONSTRAINT fk_sag_granted_by FOREIGN KEY (granted_by) REFERENCES personnel(id) ON DELETE SET NULL,
-  INDEX idx_sag_zone_personnel (zone_id, personnel_id)
+  INDEX idx_sag_zone_personnel (zone_id, personnel_id),
+  INDEX idx_sag_zone_person_status (zone_id, personnel_id, status, expires_at),
+  INDEX idx_sag_person_status (personnel_id, status, expires_at),
+  INDEX idx_sag_status_expires (status, expires_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 
@@ -1327,7 +1364,8 @@ CREATE TABLE IF NOT EXISTS badges (
   revoked_at DATETIME NULL,
   status ENUM('issued','revoked','lost') NOT NULL DEFAULT 'issued',
   CONSTRAINT fk_badge_personnel FOREIGN KEY (personnel_id) REFERENCES personnel(id) ON DELETE SET NULL,
-  INDEX idx_badge_personnel (personnel_id)
+  INDEX idx_badge_personnel (personnel_id),
+  INDEX idx_badge_status_code (status, badge_code)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 
@@ -1478,18 +1516,42 @@ LIMIT 100;
 
 
 
--- /* Historial de cambios en políticas/reglas (opcional, útil para auditoría) */
--- CREATE TABLE IF NOT EXISTS audit_policy_changes (
---   id INT AUTO_INCREMENT PRIMARY KEY,
---   changed_by INT NULL,                -- quién hizo el cambio (personnel.id)
---   changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
---   entity VARCHAR(64) NOT NULL,        -- p.ej. 'restricted_zones'
---   entity_id INT NULL,
---   action VARCHAR(32) NOT NULL,        -- 'create'|'update'|'delete'
---   diff TEXT NULL,                     -- JSON con cambios (guardar como texto)
---   CONSTRAINT fk_audit_changed_by FOREIGN KEY (changed_by) REFERENCES personnel(id) ON DELETE SET NULL,
---   INDEX idx_audit_entity (entity, entity_id)
--- ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+/* Historial de cambios en políticas/reglas: change feed para invalidar cachés.
+   Lo escribe la app ws (ws/changelog.py) en la misma transacción que el cambio;
+   id es la versión que consultan los consumidores (?since=<id>); la asigna
+   audit_policy_version, no el AUTO_INCREMENT, para que crezca en orden de commit.
+   entity_id NULL = operación masiva sobre toda la entidad. */
+CREATE TABLE IF NOT EXISTS audit_policy_changes (
+  id BIGINT AUTO_INCREMENT PRIMARY KEY,
+  changed_by INT NULL,                -- quién hizo el cambio (personnel.id)
+  changed_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+  entity VARCHAR(64) NOT NULL,        -- p.ej. 'restricted_zones'
+  entity_id INT NULL,
+  action VARCHAR(32) NOT NULL,        -- 'create'|'update'|'delete'
+  diff TEXT NULL,                     -- JSON con los valores de la fila
+  CONSTRAINT fk_audit_changed_by FOREIGN KEY (changed_by) REFERENCES personnel(id) ON DELETE SET NULL,
+  INDEX idx_audit_entity (entity, entity_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+/* Secuencia de versiones del change feed (una sola fila). ws/changelog.py la
+   bloquea con SELECT ... FOR UPDATE hasta el commit de cada cambio de política. */
+CREATE TABLE IF NOT EXISTS audit_policy_version (
+  id SMALLINT UNSIGNED PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT IGNORE INTO audit_policy_version (id, version)
+SELECT 1, COALESCE(MAX(id), 0) FROM audit_policy_changes;
+
+-- Los scripts de carga de este archivo (procedimientos seed_*) escriben con SQL
+-- directo y no pasan por el change feed: tras ejecutarlos, regenerar cachés y
+-- bundles (python manage.py export_policy_bundle --force).
+
+-- Los índices compuestos del control de acceso (idx_pp_person_active_exp,
+-- idx_sag_zone_person_status, ...) ya están en las tablas de arriba; en una base
+-- creada con una versión anterior de este script los agrega la migración
+-- ws 0002_hot_path_indexes. Para revisar los planes:
+-- python manage.py check_query_plans
 
 -- -- Índices adicionales recomendados (si los quieres crear explícitamente):
 -- CREATE INDEX IF NOT EXISTS idx_person_service_number ON personnel (service_number);
@@ -0,0 +1,194 @@
+# historial/breaker.py
+"""
+Circuit breaker para las llamadas al WS.
+
+Cada llamada pasa por CircuitBreaker.call() y queda registrada en una ventana
+de las últimas WS_BREAKER_WINDOW llamadas como correcta, fallida (excepción
+de requests o 5xx) o lenta (más de WS_BREAKER_SLOW_MS). Con al menos
+WS_BREAKER_MIN_CALLS en la ventana, el circuito se abre si la proporción de
+fallidas o la de lentas llega a su umbral.
+
+  closed     las llamadas pasan.
+  open       call() lanza CircuitOpenError sin tocar la red (fast-fail) durante
+             WS_BREAKER_OPEN_SECONDS.
+  half_open  pasado ese tiempo se deja pasar una sola llamada de prueba (las
+             demás siguen fallando rápido): si sale bien el circuito se
+             cierra, si falla o es lenta vuelve a abrirse.
+
+CircuitOpenError es una RequestException, así que quien ya maneja los
+errores de requests no cambia. El estado vive en memoria del proceso: cada
+worker abre su circuito con las llamadas que hace él.
+
+Quien tiene con qué responder sin el WS (las decisiones locales de
+historial/fallback.py) usa call_or_defer(fn): en half_open la llamada de
+prueba corre en un hilo y quien llama recibe CircuitOpenError al instante, en
+lugar de esperar a que la prueba termine.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from requests.exceptions import HTTPError, RequestException
+
+WS_BREAKER_WINDOW = getattr(settings, "WS_BREAKER_WINDOW", 20)
+WS_BREAKER_MIN_CALLS = getattr(settings, "WS_BREAKER_MIN_CALLS", 5)
+WS_BREAKER_FAILURE_RATE = getattr(settings, "WS_BREAKER_FAILURE_RATE", 0.5)
+WS_BREAKER_SLOW_MS = getattr(settings, "WS_BREAKER_SLOW_MS", 1000)
+WS_BREAKER_SLOW_RATE = getattr(settings, "WS_BREAKER_SLOW_RATE", 0.5)
+WS_BREAKER_OPEN_SECONDS = getattr(settings, "WS_BREAKER_OPEN_SECONDS", 10)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+OK = "ok"
+FAILED = "failed"
+SLOW = "slow"
+
+
+class CircuitOpenError(RequestException):
+    pass
+
+
+def is_failure(exc):
+    # un 4xx es una respuesta válida del WS; un 5xx o un error de red no
+    if isinstance(exc, HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return isinstance(exc, RequestException)
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, window=None, min_calls=None, failure_rate=None, slow_ms=None,
+                 slow_rate=None, open_seconds=None, clock=time.monotonic):
+        self.name = name
+        self.window = window or WS_BREAKER_WINDOW
+        self.min_calls = min_calls or WS_BREAKER_MIN_CALLS
+        self.failure_rate = failure_rate or WS_BREAKER_FAILURE_RATE
+        self.slow_ms = slow_ms or WS_BREAKER_SLOW_MS
+        self.slow_rate = slow_rate or WS_BREAKER_SLOW_RATE
+        self.open_seconds = open_seconds or WS_BREAKER_OPEN_SECONDS
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=self.window)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = False
+        self._counters = {"calls": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def _acquire(self):
+        """
+        CLOSED si la llamada puede pasar, HALF_OPEN si es la llamada de prueba
+        (una sola a la vez), None si no puede pasar.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED or (state == HALF_OPEN and not self._probing):
+                self._probing = state == HALF_OPEN
+                self._counters["calls"] += 1
+                return state
+            self._counters["rejected"] += 1
+            return None
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._probing = False
+        self._counters["opened"] += 1
+
+    def _record(self, outcome):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if outcome == OK:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open()
+                self._probing = False
+                return
+            if self._state != CLOSED:
+                return
+            self._calls.append(outcome)
+            n = len(self._calls)
+            if n < self.min_calls:
+                return
+            if (self._calls.count(FAILED) / n >= self.failure_rate
+                    or self._calls.count(SLOW) / n >= self.slow_rate):
+                self._open()
+                self._calls.clear()
+
+    @contextmanager
+    def _track(self):
+        start = self.clock()
+        try:
+            yield
+        except BaseException as exc:
+            # también GeneratorExit y similares: la prueba de half_open no puede quedar tomada
+            self._record(FAILED if is_failure(exc) else OK)
+            raise
+        self._record(SLOW if (self.clock() - start) * 1000 > self.slow_ms else OK)
+
+    @contextmanager
+    def call(self):
+        """Envuelve una llamada al WS; lanza CircuitOpenError si el circuito no la deja pasar."""
+        if self._acquire() is None:
+            raise CircuitOpenError(f"circuit {self.name} open: WS not called")
+        with self._track():
+            yield
+
+    def call_or_defer(self, fn):
+        """
+        Devuelve fn() pasando por el circuito. En half_open, si a esta llamada
+        le toca ser la prueba, fn() corre en un hilo y se lanza
+        CircuitOpenError sin esperarla (su resultado solo cierra o reabre el
+        circuito). fn no debe tener efectos que importen si se descarta.
+        """
+        state = self._acquire()
+        if state is None:
+            raise CircuitOpenError(f"circuit {self.name} open: WS not called")
+        if state == HALF_OPEN:
+            threading.Thread(target=self._probe, args=(fn,), name=f"{self.name}-breaker-probe", daemon=True).start()
+            raise CircuitOpenError(f"circuit {self.name} half open: probing the WS in the background")
+        with self._track():
+            return fn()
+
+    def _probe(self, fn):
+        try:
+            with self._track():
+                fn()
+        except Exception:
+            # el resultado ya quedó registrado: cerró o reabrió el circuito
+            pass
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            n = len(self._calls)
+            return {
+                "name": self.name,
+                "state": state,
+                "window": list(self._calls),
+                "failure_rate": round(self._calls.count(FAILED) / n, 3) if n else 0.0,
+                "slow_rate": round(self._calls.count(SLOW) / n, 3) if n else 0.0,
+                "open_for_seconds": (
+                    max(0.0, round(self.open_seconds - (self.clock() - self._opened_at), 3)) if state == OPEN else 0.0
+                ),
+                **self._counters,
+            }
+
+
+# llamadas de decisión y ocupación al WS (services.py)
+ws_breaker = CircuitBreaker("ws")
@@ -0,0 +1,359 @@
+# historial/coldstore.py
+"""
+Archivo frío de intentos en segmentos comprimidos e inmutables.
+
+archive_attempts mueve las particiones mensuales viejas (historial/partitions.py)
+a COLD_ARCHIVE_DIR y las borra de MongoDB. Cada segmento son dos archivos:
+
+  attempts-YYYYMM-NNN.seg       bloques de COLD_BLOCK_DOCS documentos BSON,
+                                ordenados por attempt.timestamp y comprimidos
+                                cada uno por separado (zstd, o gzip si no está
+                                instalado zstandard)
+  attempts-YYYYMM-NNN.idx.json  índice disperso: por bloque, offset, largo,
+                                rango de timestamps y zonas presentes; y un
+                                resumen del segmento (nombres de zonas y
+                                rangos) para las listas de valores distintos
+
+Un segmento no se reescribe nunca (se escribe a un .tmp y se renombra). Para
+leer se descomprimen solo los bloques cuyo rango de tiempo (y zonas, si el
+filtro las fija) se cruza con la consulta.
+
+archive_attempts escribe el índice como .idx.json.pending y lo publica
+(rename) recién después de borrar la partición: un segmento pendiente no
+existe para las lecturas, así un mes nunca se cuenta dos veces (con
+--keep-partition queda pendiente). Los segmentos de antes de este esquema
+("published" ausente) se publicaban antes del borrado: las lecturas los
+ignoran mientras su partición de origen exista.
+
+Las analíticas cuentan los meses archivados en proceso (count_by(), vía
+partitions.count_by()): se descomprimen solo los bloques de la ventana, de a
+uno, y se agrupan en un Counter; los documentos fríos no vuelven a MongoDB.
+Sin ventana no se lee el archivo frío (se leería entero); las listas de zonas
+y rangos usan summary().
+"""
+import gzip
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+import bson
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import partitions
+from .partitions import as_utc
+
+COLD_ARCHIVE_DIR = str(getattr(settings, "COLD_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "cold_archive")))
+# "zstd" (por defecto, si está instalado zstandard) o "gzip"
+COLD_ARCHIVE_CODEC = getattr(settings, "COLD_ARCHIVE_CODEC", "zstd")
+COLD_ZSTD_LEVEL = getattr(settings, "COLD_ZSTD_LEVEL", 10)
+# documentos por bloque comprimido (granularidad del índice disperso)
+COLD_BLOCK_DOCS = getattr(settings, "COLD_BLOCK_DOCS", 2000)
+# documentos por segmento; un mes grande se reparte en varios
+COLD_SEGMENT_DOCS = getattr(settings, "COLD_SEGMENT_DOCS", 200000)
+
+zstandard = None
+if COLD_ARCHIVE_CODEC == "zstd":
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+_SEGMENT_RE = re.compile(r"^attempts-(\d{6})-(\d{3})\.idx\.json$")
+PENDING_SUFFIX = ".pending"
+
+_lock = threading.Lock()
+_indexes = (None, [])  # (mtime del directorio, índices leídos)
+
+
+def default_codec():
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _compress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=COLD_ZSTD_LEVEL).compress(data)
+    return gzip.compress(data)
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImproperlyConfigured("El segmento está comprimido con zstd: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _ts(doc):
+    return as_utc((doc.get("attempt") or {}).get("timestamp") or doc.get("created_at"))
+
+
+def _iso(ts):
+    # ancho fijo: los rangos del índice se comparan como strings
+    return ts.isoformat(timespec="microseconds")
+
+
+def _zone(doc):
+    return (doc.get("zone") or {}).get("code")
+
+
+def _summary(docs):
+    """{"zones": {código: nombre}, "ranks": {código: nombre}} de los documentos."""
+    zones, ranks = {}, {}
+    for doc in docs:
+        zone = doc.get("zone") or {}
+        if zone.get("code"):
+            zones.setdefault(zone["code"], zone.get("name"))
+        rank = (doc.get("personnel_full") or {}).get("rank") or {}
+        if rank.get("code"):
+            ranks.setdefault(rank["code"], rank.get("name"))
+    return {"zones": zones, "ranks": ranks}
+
+
+def segment_names(month):
+    """Segmentos ya escritos de un mes (YYYYMM)."""
+    return sorted(i["segment"] for i in load_indexes() if i["month"] == month)
+
+
+def _idx_path(name, pending=False):
+    return os.path.join(COLD_ARCHIVE_DIR, name + ".idx.json" + (PENDING_SUFFIX if pending else ""))
+
+
+def write_segment(month, docs, source=None, codec=None, pending=False):
+    """
+    Escribe un segmento nuevo con `docs` (cualquier orden) y devuelve su índice.
+    El número de segmento es el siguiente libre del mes. Con pending el índice
+    queda sin publicar (ver publish()).
+    """
+    codec = codec or default_codec()
+    docs = sorted(docs, key=_ts)
+    os.makedirs(COLD_ARCHIVE_DIR, exist_ok=True)
+    seq = len(segment_names(month))
+    name = f"attempts-{month}-{seq:03d}"
+    while os.path.exists(_idx_path(name)) or os.path.exists(_idx_path(name, pending=True)):
+        seq += 1
+        name = f"attempts-{month}-{seq:03d}"
+    blocks = []
+    data_path = os.path.join(COLD_ARCHIVE_DIR, name + ".seg")
+    with open(data_path + ".tmp", "wb") as fh:
+        for i in range(0, len(docs), COLD_BLOCK_DOCS):
+            chunk = docs[i:i + COLD_BLOCK_DOCS]
+            payload = _compress(codec, b"".join(bson.encode(d) for d in chunk))
+            blocks.append({
+                "offset": fh.tell(),
+                "length": len(payload),
+                "count": len(chunk),
+                "ts_min": _iso(_ts(chunk[0])),
+                "ts_max": _iso(_ts(chunk[-1])),
+                "zones": sorted({z for z in map(_zone, chunk) if z}),
+            })
+            fh.write(payload)
+        fh.flush()
+        os.fsync(fh.fileno())
+    index = {
+        "segment": name,
+        "month": month,
+        "source": source,
+        "codec": codec,
+        "count": len(docs),
+        "ts_min": blocks[0]["ts_min"] if blocks else None,
+        "ts_max": blocks[-1]["ts_max"] if blocks else None,
+        "zones": sorted({z for b in blocks for z in b["zones"]}),
+        "summary": _summary(docs),
+        # se publica después de borrar la partición de origen (ver readable_indexes)
+        "published": "after_drop",
+        "blocks": blocks,
+    }
+    os.replace(data_path + ".tmp", data_path)
+    # el índice va último: un segmento sin .idx.json no existe para las lecturas
+    idx_path = _idx_path(name, pending)
+    with open(idx_path + ".tmp", "w") as fh:
+        json.dump(index, fh)
+    os.replace(idx_path + ".tmp", idx_path)
+    return index
+
+
+def pending_indexes(source=None):
+    """Índices escritos y no publicados (de esa partición de origen, o todos)."""
+    try:
+        names = sorted(os.listdir(COLD_ARCHIVE_DIR))
+    except FileNotFoundError:
+        return []
+    out = []
+    for fname in names:
+        if not fname.endswith(PENDING_SUFFIX) or not _SEGMENT_RE.match(fname[:-len(PENDING_SUFFIX)]):
+            continue
+        with open(os.path.join(COLD_ARCHIVE_DIR, fname)) as fh:
+            index = json.load(fh)
+        if source is None or index["source"] == source:
+            out.append(index)
+    return out
+
+
+def publish(source):
+    """Publica los segmentos pendientes de una partición ya borrada. Devuelve los documentos."""
+    published = 0
+    for index in pending_indexes(source):
+        os.replace(_idx_path(index["segment"], pending=True), _idx_path(index["segment"]))
+        published += index["count"]
+    return published
+
+
+def discard_pending(source):
+    """Borra los segmentos pendientes de una partición (corrida anterior que no terminó)."""
+    discarded = 0
+    for index in pending_indexes(source):
+        os.remove(_idx_path(index["segment"], pending=True))
+        try:
+            os.remove(os.path.join(COLD_ARCHIVE_DIR, index["segment"] + ".seg"))
+        except FileNotFoundError:
+            pass
+        discarded += index["count"]
+    return discarded
+
+
+def load_indexes():
+    """Índices de todos los segmentos (se releen cuando cambia el directorio)."""
+    global _indexes
+    try:
+        mtime = os.stat(COLD_ARCHIVE_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    read_at, indexes = _indexes
+    if read_at == mtime:
+        return indexes
+    with _lock:
+        indexes = []
+        for fname in sorted(os.listdir(COLD_ARCHIVE_DIR)):
+            if not _SEGMENT_RE.match(fname):
+                continue
+            with open(os.path.join(COLD_ARCHIVE_DIR, fname)) as fh:
+                indexes.append(json.load(fh))
+        _indexes = (mtime, indexes)
+    return indexes
+
+
+def _overlaps(entry, start, end, zones):
+    if entry["ts_min"] is None:
+        return False
+    if start is not None and entry["ts_max"] < _iso(start):
+        return False
+    if end is not None and entry["ts_min"] > _iso(end):
+        return False
+    return zones is None or bool(zones.intersection(entry["zones"]))
+
+
+def readable_indexes():
+    """
+    Índices publicados. Un segmento publicado antes del borrado (esquema
+    anterior) cuya partición sigue en MongoDB se omite: se leería dos veces.
+    Los publicados después del borrado valen aunque la partición se haya
+    vuelto a crear con intentos tardíos (son otros documentos).
+    """
+    live = partitions.existing_collections()
+    return [
+        i for i in load_indexes()
+        if i.get("published") == "after_drop" or i.get("source") not in live
+    ]
+
+
+def blocks_for(start=None, end=None, zones=None):
+    """[(índice del segmento, bloque)] que pueden tener intentos en [start, end] de esas zonas."""
+    start = as_utc(start) if start is not None else None
+    end = as_utc(end) if end is not None else None
+    zones = set(zones) if zones is not None else None
+    return [
+        (index, block)
+        for index in readable_indexes() if _overlaps(index, start, end, zones)
+        for block in index["blocks"] if _overlaps(block, start, end, zones)
+    ]
+
+
+def summary(key):
+    """
+    {código: nombre} de "zones" o "ranks" en todo el archivo frío, desde los
+    índices (sin descomprimir bloques). Los segmentos escritos antes del
+    resumen solo aportan códigos de zona, sin nombre.
+    """
+    out = {}
+    for index in readable_indexes():
+        values = (index.get("summary") or {}).get(key)
+        if values is None and key == "zones":
+            values = dict.fromkeys(index["zones"])
+        for code, name in (values or {}).items():
+            if out.get(code) is None:
+                out[code] = name
+    return out
+
+
+def iter_documents(start=None, end=None, zones=None):
+    """Intentos archivados con attempt.timestamp en [start, end] (y zone.code en zones)."""
+    lo = as_utc(start) if start is not None else None
+    hi = as_utc(end) if end is not None else None
+    handles = {}
+    try:
+        for index, block in blocks_for(start, end, zones):
+            fh = handles.get(index["segment"])
+            if fh is None:
+                fh = handles[index["segment"]] = open(os.path.join(COLD_ARCHIVE_DIR, index["segment"] + ".seg"), "rb")
+            fh.seek(block["offset"])
+            for doc in bson.decode_all(_decompress(index["codec"], fh.read(block["length"]))):
+                ts = _ts(doc)
+                if (lo is not None and ts < lo) or (hi is not None and ts > hi):
+                    continue
+                if zones is not None and _zone(doc) not in zones:
+                    continue
+                yield doc
+    finally:
+        for fh in handles.values():
+            fh.close()
+
+
+def _value(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def matches(doc, match):
+    """El subconjunto de $match que entiende count_by(): igualdad, $in, $nin y $exists."""
+    for path, cond in (match or {}).items():
+        value = _value(doc, path)
+        if not isinstance(cond, dict):
+            if value != cond:
+                return False
+            continue
+        for op, arg in cond.items():
+            if op == "$in":
+                ok = value in arg
+            elif op == "$nin":
+                ok = value not in arg
+            elif op == "$exists":
+                ok = (value is not None) == bool(arg)
+            else:
+                raise ValueError(f"Operador no soportado en el archivo frío: {op}")
+            if not ok:
+                return False
+    return True
+
+
+def count_by(keys, start=None, end=None, match=None):
+    """
+    Intentos archivados con attempt.timestamp en [start, end), agrupados en
+    proceso: {(valor de cada clave, en el orden de keys): cantidad}. keys y
+    match como en partitions.count_by(). La memoria depende de la cantidad de
+    grupos, no de documentos: los bloques se leen de a uno.
+    """
+    zones = partitions.zones_filter([{"$match": match or {}}])
+    hi = as_utc(end) if end is not None else None
+    counts = Counter()
+    for doc in iter_documents(start, end, zones):
+        ts = _ts(doc)
+        if (hi is not None and ts >= hi) or not matches(doc, match):
+            continue
+        counts[tuple(ts.strftime(path) if path.startswith("%") else _value(doc, path) for path in keys.values())] += 1
+    return counts
@@ -0,0 +1,163 @@
+# historial/detector.py
+"""
+Detector en streaming de ráfagas de accesos denegados.
+
+Cada intento denegado que pasa por save_access_attempt alimenta contadores de
+ventana deslizante (ring buffer de buckets fijos) por service_number, gate_id
+y device. Cuando un contador alcanza su umbral se inserta una alerta en la
+colección `access_alerts`, sin esperar a correr analytics_top_offenders.
+
+Los intentos se cuentan en el bucket de su attempt.timestamp, no en el de su
+llegada: un lote de la API de ingesta con intentos de hace horas no es una
+ráfaga actual. Lo que ya quedó fuera de la ventana de una regla no cuenta.
+
+Nota: el estado vive en memoria del proceso; con varios workers cada uno
+cuenta los intentos que atiende él mismo.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .mongo import access_alerts_col
+from .partitions import as_utc
+
+logger = logging.getLogger(__name__)
+
+# tamaño de cada bucket (segundos) y reglas por dimensión
+DENIAL_BURST_BUCKET_SECONDS = getattr(settings, "DENIAL_BURST_BUCKET_SECONDS", 10)
+DENIAL_BURST_RULES = getattr(settings, "DENIAL_BURST_RULES", {
+    "service_number": {"window": 300, "threshold": 5},
+    "gate_id": {"window": 60, "threshold": 20},
+    "device": {"window": 60, "threshold": 20},
+})
+# máximo de claves vigiladas por dimensión (se descartan las menos recientes)
+DENIAL_BURST_MAX_KEYS = getattr(settings, "DENIAL_BURST_MAX_KEYS", 10000)
+
+
+class RingCounter:
+    """
+    Cuenta eventos en una ventana deslizante de n buckets.
+    add() es O(1) amortizado: solo limpia los buckets que la ventana dejó atrás
+    desde la última llamada (como máximo n). Un evento anterior al último
+    bucket cuenta en el suyo si sigue dentro de la ventana; si no, se ignora.
+    """
+    __slots__ = ("buckets", "size", "last_idx", "total", "alerted_idx")
+
+    def __init__(self, size):
+        self.size = size
+        self.buckets = [0] * size
+        self.last_idx = None
+        self.total = 0
+        self.alerted_idx = None
+
+    def _advance(self, idx):
+        if self.last_idx is None or idx - self.last_idx >= self.size:
+            self.buckets = [0] * self.size
+            self.total = 0
+        else:
+            for i in range(self.last_idx + 1, idx + 1):
+                slot = i % self.size
+                self.total -= self.buckets[slot]
+                self.buckets[slot] = 0
+        self.last_idx = idx
+
+    def add(self, idx, amount=1):
+        if self.last_idx is None or idx > self.last_idx:
+            self._advance(idx)
+        elif self.last_idx - idx >= self.size:
+            return self.total
+        self.buckets[idx % self.size] += amount
+        self.total += amount
+        return self.total
+
+
+class DenialBurstDetector:
+    def __init__(self, rules=None, bucket_seconds=None, max_keys=None):
+        self.rules = rules if rules is not None else DENIAL_BURST_RULES
+        self.bucket_seconds = bucket_seconds or DENIAL_BURST_BUCKET_SECONDS
+        self.max_keys = max_keys or DENIAL_BURST_MAX_KEYS
+        self._counters = {dim: OrderedDict() for dim in self.rules}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, window):
+        return max(1, -(-int(window) // self.bucket_seconds))
+
+    def _counter(self, dim, key, window):
+        counters = self._counters[dim]
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = RingCounter(self._buckets_for(window))
+            if len(counters) > self.max_keys:
+                counters.popitem(last=False)
+        else:
+            counters.move_to_end(key)
+        return counter
+
+    @staticmethod
+    def _keys(doc):
+        attempt = doc.get("attempt") or {}
+        return {
+            "service_number": doc.get("personnel"),
+            "gate_id": attempt.get("gate_id"),
+            "device": attempt.get("device"),
+        }
+
+    def observe(self, doc, now=None):
+        """
+        Alimenta el detector con un documento de intento. Solo cuentan los
+        denegados, por attempt.timestamp (sin timestamp o en el futuro, now).
+        Devuelve la lista de alertas disparadas (ya insertadas).
+        """
+        validation = doc.get("validation") or {}
+        if validation.get("allowed", False):
+            return []
+        now = time.time() if now is None else now
+        ts = (doc.get("attempt") or {}).get("timestamp")
+        at = min(now, as_utc(ts).timestamp()) if ts else now
+        idx = int(at // self.bucket_seconds)
+
+        fired = []
+        keys = self._keys(doc)
+        with self._lock:
+            for dim, rule in self.rules.items():
+                key = keys.get(dim)
+                if not key or now - at >= rule["window"]:
+                    continue
+                counter = self._counter(dim, key, rule["window"])
+                count = counter.add(idx)
+                # una alerta por ventana y clave
+                if count >= rule["threshold"] and (
+                    counter.alerted_idx is None or idx - counter.alerted_idx >= counter.size
+                ):
+                    counter.alerted_idx = idx
+                    fired.append({
+                        "type": "denial_burst",
+                        "dimension": dim,
+                        "key": key,
+                        "count": count,
+                        "threshold": rule["threshold"],
+                        "window_seconds": rule["window"],
+                        "zone_code": (doc.get("zone") or {}).get("code"),
+                        "reason": validation.get("reason"),
+                        "attempt_id": doc.get("_id"),
+                        "triggered_at": timezone.now(),
+                    })
+        if fired:
+            access_alerts_col.insert_many(fired)
+        return fired
+
+
+burst_detector = DenialBurstDetector()
+
+
+def observe_attempt(doc):
+    """Punto de entrada desde el camino de registro; nunca interrumpe el guardado."""
+    try:
+        return burst_detector.observe(doc)
+    except Exception:
+        logger.exception("denial burst detector failed")
+        return []
@@ -0,0 +1,160 @@
+# historial/fallback.py
+"""
+Decisiones locales cuando el WS no responde.
+
+Se usa el mismo bundle de políticas que los gates offline (zonas, personal,
+permisos, grants, badges, grados y unidades) y el mismo evaluador,
+OfflinePolicy, que aplica rules.evaluate igual que evaluate_access.
+historial/offline.py es una copia de ws/offline.py: este proyecto no importa
+nada del WS.
+
+El bundle se mantiene al día mientras el WS responde: como mucho cada
+POLICY_FALLBACK_SYNC_SECONDS, en un hilo, se pide /ws/policy/delta/ desde la
+versión cargada (o el bundle completo si no hay ninguna o el WS responde 410).
+La última versión se guarda en POLICY_FALLBACK_FILE, así un worker que arranca
+durante una caída también puede decidir.
+
+La respuesta de decide() tiene la forma de /ws/access-info/ más
+"fallback": {"policy_version", "synced_at", "cause"}: persona (service_number,
+badge_id, rank, unit), zona y validation, sin nombre, clearance ni permisos.
+save_access_attempt guarda esos intentos con processed_by="fallback". La
+capacidad de la zona no se evalúa (la ocupación vive en el WS).
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.exceptions import RequestException
+
+from . import metrics
+from .jsoncodec import loads
+from .offline import BundleError, OfflinePolicy, encode_bundle
+from .wsauth import ws_headers
+
+logger = logging.getLogger(__name__)
+
+POLICY_FALLBACK_ENABLED = getattr(settings, "POLICY_FALLBACK_ENABLED", False)
+POLICY_BUNDLE_URL = getattr(settings, "POLICY_BUNDLE_URL", "http://127.0.0.1:8000/ws/policy/bundle/")
+POLICY_DELTA_URL = getattr(settings, "POLICY_DELTA_URL", "http://127.0.0.1:8000/ws/policy/delta/")
+POLICY_FALLBACK_FILE = getattr(settings, "POLICY_FALLBACK_FILE", os.path.join(settings.BASE_DIR, "policy_fallback.bin"))
+POLICY_FALLBACK_SYNC_SECONDS = getattr(settings, "POLICY_FALLBACK_SYNC_SECONDS", 60)
+
+
+class PolicyMirror:
+    """Copia local del bundle de políticas del WS (una por proceso)."""
+
+    def __init__(self, path=None):
+        self.path = path or POLICY_FALLBACK_FILE
+        self.policy = None
+        self.synced_at = None
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._next_sync = 0.0
+        self._loaded_from_disk = False
+
+    def _load_file(self):
+        # una sola vez por proceso; después manda lo sincronizado
+        self._loaded_from_disk = True
+        try:
+            policy = OfflinePolicy.load(self.path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, BundleError):
+            logger.warning("invalid fallback policy file %s", self.path, exc_info=True)
+            return
+        self.policy = policy
+        self.synced_at = os.path.getmtime(self.path)
+
+    def current(self):
+        """OfflinePolicy cargada (o None si nunca se sincronizó)."""
+        if self.policy is None and not self._loaded_from_disk:
+            with self._lock:
+                if self.policy is None and not self._loaded_from_disk:
+                    self._load_file()
+        return self.policy
+
+    def _save(self, policy):
+        tmp = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp, "wb") as fh:
+            fh.write(encode_bundle(policy.content, policy.version))
+        os.replace(tmp, self.path)
+
+    def sync(self):
+        """Trae el delta (o el bundle completo) del WS. Devuelve la versión cargada."""
+        policy = self.current()
+        if policy is not None:
+            with metrics.timed("ws"):
+                resp = requests.get(POLICY_DELTA_URL, params={"since": policy.version},
+                                    headers=ws_headers(), timeout=5)
+            if resp.status_code != 410:
+                resp.raise_for_status()
+                delta = loads(resp.content)
+                if delta["to_version"] == policy.version:
+                    self.synced_at = time.time()
+                    return policy.version
+                # se aplica sobre una copia: si el checksum no cuadra queda la anterior
+                updated = OfflinePolicy(policy.content, policy.version)
+                try:
+                    updated.apply_delta(delta)
+                except BundleError:
+                    logger.warning("fallback policy delta rejected, downloading full bundle", exc_info=True)
+                else:
+                    return self._install(updated)
+        with metrics.timed("ws"):
+            resp = requests.get(POLICY_BUNDLE_URL, headers=ws_headers(), timeout=30)
+        resp.raise_for_status()
+        return self._install(OfflinePolicy.from_bytes(resp.content))
+
+    def _install(self, policy):
+        self._save(policy)
+        self.policy = policy
+        self.synced_at = time.time()
+        return policy.version
+
+    def _sync_quietly(self):
+        try:
+            self.sync()
+        except (RequestException, ValueError, KeyError, OSError, BundleError):
+            logger.warning("fallback policy sync failed", exc_info=True)
+        finally:
+            self._syncing = False
+
+    def maybe_sync(self):
+        """Con el WS respondiendo: sincroniza en un hilo si pasó POLICY_FALLBACK_SYNC_SECONDS."""
+        now = time.monotonic()
+        with self._lock:
+            if self._syncing or now < self._next_sync:
+                return
+            self._syncing = True
+            self._next_sync = now + POLICY_FALLBACK_SYNC_SECONDS
+        threading.Thread(target=self._sync_quietly, name="policy-fallback-sync", daemon=True).start()
+
+    def decide(self, service_number=None, badge_id=None, zone_code=None, cause=None):
+        """
+        Respuesta con la forma de /ws/access-info/ decidida con el bundle local,
+        None si la persona o la zona no están en él (el WS respondería 404).
+        Lanza LookupError si no hay bundle cargado.
+        """
+        policy = self.current()
+        if policy is None:
+            raise LookupError("no fallback policy loaded")
+        validation = policy.evaluate(zone_code, service_number=service_number, badge_id=badge_id)
+        if validation is None:
+            return None
+        zone = policy.zones.get(zone_code) or {}
+        # badge revocado/perdido: la persona no se resuelve y quedan los datos del scan
+        info = policy.person(service_number=service_number, badge_id=badge_id) or {
+            "service_number": service_number, "badge_id": badge_id, "rank": None, "unit": None,
+        }
+        info.update(
+            zone={"id": zone.get("id"), "code": zone_code, "name": zone.get("name")},
+            validation=validation,
+            fallback={"policy_version": policy.version, "synced_at": self.synced_at, "cause": cause},
+        )
+        return info
+
+
+policy_mirror = PolicyMirror()
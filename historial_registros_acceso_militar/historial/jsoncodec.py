@@ -0,0 +1,75 @@
+# historial/jsoncodec.py
+"""
+Codec JSON rápido para las respuestas de analíticas y las respuestas del WS.
+
+Usa orjson si está instalado (pip install orjson) y JSON_CODEC lo permite; si
+no, json de la stdlib. datetime/date/UUID se serializan de forma nativa
+(RFC 3339, UTC con "Z"); ObjectId y demás tipos de bson salen como str y el
+resto pasa por DjangoJSONEncoder, igual que con JsonResponse.
+"""
+import json
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+# "orjson" (por defecto, si está instalado) o "json"
+JSON_CODEC = getattr(settings, "JSON_CODEC", "orjson")
+
+orjson = None
+if JSON_CODEC == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        return super().default(o)
+
+
+_default = _Encoder().default
+
+
+def dumps(obj):
+    """bytes UTF-8."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS)
+        except TypeError:
+            # p.ej. enteros de más de 64 bits
+            pass
+    return json.dumps(obj, cls=_Encoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    Reemplazo de JsonResponse sobre dumps(). Misma firma; json_dumps_params
+    y encoder solo se usan si se pasan explícitamente (van por json).
+    """
+
+    def __init__(self, data, encoder=None, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        if encoder is not None or json_dumps_params:
+            content = json.dumps(data, cls=encoder or _Encoder, **(json_dumps_params or {}))
+        else:
+            content = dumps(data)
+        super().__init__(content=content, **kwargs)
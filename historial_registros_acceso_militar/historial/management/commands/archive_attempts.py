@@ -0,0 +1,131 @@
+# uso
+# archivar en segmentos comprimidos los meses anteriores a 2024-01 y borrarlos de MongoDB
+# python manage.py archive_attempts --before 2024-01
+# ver qué se archivaría
+# python manage.py archive_attempts --before 2024-01 --dry-run
+# listar los segmentos archivados
+# python manage.py archive_attempts --list
+# escribir los segmentos sin borrar la partición (quedan pendientes; una corrida sin la opción la borra y los publica)
+# python manage.py archive_attempts --before 2024-01 --keep-partition
+
+# historial/management/commands/archive_attempts.py
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from historial import coldstore, partitions
+from historial.mongo import collection, get_db
+
+
+def _month(value):
+    try:
+        d = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise CommandError(f"mes inválido {value!r}: se espera YYYY-MM")
+    return d.year, d.month
+
+
+class Command(BaseCommand):
+    help = "Mueve las particiones mensuales viejas de access_attempts a segmentos comprimidos (archivo frío)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", type=_month, default=None, help="Archiva los meses anteriores a YYYY-MM.")
+        parser.add_argument("--keep-partition", action="store_true", help="No borrar la partición; los segmentos quedan pendientes (sin leerse) hasta borrarla.")
+        parser.add_argument("--list", action="store_true", help="Lista los segmentos archivados.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se haría.")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for index in coldstore.load_indexes():
+                self.stdout.write(
+                    f"{index['segment']}\t{index['codec']}\t{index['count']}\t"
+                    f"{index['ts_min']} .. {index['ts_max']}\t{len(index['blocks'])} bloques"
+                )
+            for index in coldstore.pending_indexes():
+                self.stdout.write(f"{index['segment']}\t{index['codec']}\t{index['count']}\tpendiente ({index['source']})")
+        before = options["before"]
+        if before is None:
+            if not options["list"]:
+                raise CommandError("Indique --before YYYY-MM o --list.")
+            return
+        now = timezone.now()
+        if before > (now.year, now.month):
+            raise CommandError("No se archiva el mes en curso: --before debe ser a lo sumo el mes actual.")
+        if partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION in partitions.existing_collections(refresh=True):
+            self.stdout.write(self.style.WARNING(
+                f"{partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION} no se archiva: "
+                "migrarla antes con manage_attempt_partitions --migrate-legacy"
+            ))
+        self._publish_dropped(options["dry_run"])
+        for name in partitions.list_partitions(refresh=True):
+            if partitions.month_of(name) < before:
+                self._archive(name, options["keep_partition"], options["dry_run"])
+
+    def _publish_dropped(self, dry_run):
+        """Corrida anterior que borró la partición pero no llegó a publicar sus segmentos."""
+        live = partitions.existing_collections(refresh=True)
+        for source in sorted({i["source"] for i in coldstore.pending_indexes()} - live):
+            if dry_run:
+                self.stdout.write(f"(dry-run) {source}: se publicarían sus segmentos pendientes")
+                continue
+            published = coldstore.publish(source)
+            self.stdout.write(self.style.SUCCESS(f"{source}: publicados {published} documentos pendientes"))
+
+    def _archive(self, name, keep, dry_run):
+        year, month = partitions.month_of(name)
+        month_key = f"{year:04d}{month:02d}"
+        col = collection(name, "attempts")
+        total = col.count_documents({})
+        # segmentos del esquema anterior, publicados sin borrar la partición
+        legacy = [i for i in coldstore.load_indexes() if i["source"] == name and i.get("published") != "after_drop"]
+        pending = sum(i["count"] for i in coldstore.pending_indexes(name))
+        if legacy:
+            archived = sum(i["count"] for i in legacy)
+            if archived != total:
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: ya tiene {archived} documentos archivados y la partición {total}; se omite"
+                ))
+                return
+            self.stdout.write(f"{name}: ya archivada ({archived} documentos)")
+        elif pending and pending == total:
+            # corrida anterior (o --keep-partition) que no llegó a borrar la partición: se retoma
+            self.stdout.write(f"{name}: ya archivada, pendiente de publicar ({pending} documentos)")
+        elif dry_run:
+            self.stdout.write(f"(dry-run) {name}: {total} documentos"
+                              + (f" (se descartan {pending} pendientes)" if pending else ""))
+            return
+        else:
+            if pending:
+                # la partición cambió desde esa corrida: se archiva de nuevo
+                coldstore.discard_pending(name)
+                self.stdout.write(self.style.WARNING(f"{name}: descartados {pending} documentos pendientes"))
+            written = 0
+            chunk = []
+            try:
+                for doc in col.find({}).sort("attempt.timestamp", ASCENDING):
+                    chunk.append(doc)
+                    if len(chunk) >= coldstore.COLD_SEGMENT_DOCS:
+                        written += self._write(month_key, chunk, name)
+                        chunk = []
+                if chunk:
+                    written += self._write(month_key, chunk, name)
+                if written != total:
+                    raise CommandError(f"{name}: se archivaron {written} de {total} documentos; la partición no se borra")
+            except BaseException:
+                # nada a medias: la próxima corrida vuelve a empezar el mes
+                coldstore.discard_pending(name)
+                raise
+        if dry_run or keep:
+            return
+        get_db().drop_collection(name)
+        partitions.forget(name)
+        # recién ahora los segmentos existen para las lecturas
+        coldstore.publish(name)
+        self.stdout.write(self.style.SUCCESS(f"{name}: borrada de MongoDB"))
+
+    def _write(self, month_key, docs, source):
+        index = coldstore.write_segment(month_key, docs, source=source, pending=True)
+        self.stdout.write(f"{index['segment']}: {index['count']} documentos, {len(index['blocks'])} bloques ({index['codec']})")
+        return index["count"]
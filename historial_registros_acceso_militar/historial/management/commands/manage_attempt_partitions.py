@@ -0,0 +1,125 @@
+# uso
+# listar particiones con su cantidad de documentos
+# python manage.py manage_attempt_partitions --list
+# crear e indexar por adelantado el mes actual y los 2 siguientes (cron mensual)
+# python manage.py manage_attempt_partitions --ensure-ahead 2
+# repartir la colección access_attempts anterior en particiones mensuales
+# python manage.py manage_attempt_partitions --migrate-legacy
+# archivar (renombrar) o borrar los meses anteriores a 2024-01
+# python manage.py manage_attempt_partitions --archive-before 2024-01
+# python manage.py manage_attempt_partitions --drop-before 2024-01 --dry-run
+
+# historial/management/commands/manage_attempt_partitions.py
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pymongo.errors import BulkWriteError
+
+from historial import partitions
+from historial.mongo import collection, get_db
+
+DUPLICATE_KEY = 11000
+
+
+def _month(value):
+    try:
+        d = datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise CommandError(f"mes inválido {value!r}: se espera YYYY-MM")
+    return d.year, d.month
+
+
+class Command(BaseCommand):
+    help = "Administra las particiones mensuales access_attempts_YYYYMM (crear, migrar, archivar, borrar)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list", action="store_true", help="Lista las particiones y sus documentos.")
+        parser.add_argument("--ensure-ahead", type=int, default=None, help="Crea e indexa el mes actual y N meses siguientes.")
+        parser.add_argument("--migrate-legacy", action="store_true", help="Mueve access_attempts a las particiones (reanudable).")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Documentos por lote en --migrate-legacy.")
+        parser.add_argument("--archive-before", type=_month, default=None, help="Renombra a archived_... los meses anteriores a YYYY-MM.")
+        parser.add_argument("--drop-before", type=_month, default=None, help="Borra (drop) los meses anteriores a YYYY-MM.")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se haría.")
+
+    def handle(self, *args, **options):
+        if options["ensure_ahead"] is not None:
+            self._ensure_ahead(options["ensure_ahead"], options["dry_run"])
+        if options["migrate_legacy"]:
+            self._migrate_legacy(options["batch_size"], options["dry_run"])
+        if options["archive_before"]:
+            self._retire(options["archive_before"], drop=False, dry_run=options["dry_run"])
+        if options["drop_before"]:
+            self._retire(options["drop_before"], drop=True, dry_run=options["dry_run"])
+        if options["list"]:
+            db = get_db()
+            for name in partitions.list_partitions(refresh=True):
+                self.stdout.write(f"{name}\t{db[name].estimated_document_count()}")
+            legacy = partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION
+            if legacy in partitions.existing_collections(refresh=True):
+                self.stdout.write(f"{legacy} (anterior)\t{db[legacy].estimated_document_count()}")
+
+    def _ensure_ahead(self, months, dry_run):
+        now = timezone.now()
+        year, month = now.year, now.month
+        for _ in range(months + 1):
+            name = partitions.partition_name(datetime(year, month, 1))
+            if not dry_run:
+                partitions.ensure_partition(name)
+            self.stdout.write(f"partición lista: {name}")
+            month += 1
+            if month == 13:
+                year, month = year + 1, 1
+
+    def _migrate_legacy(self, batch_size, dry_run):
+        """
+        Copia por lotes (en orden de _id) y borra lo copiado. Un lote repetido
+        tras una interrupción choca por _id y se ignora, así que es reanudable.
+        """
+        legacy = collection(partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION, "attempts")
+        moved = 0
+        last_id = None
+        while True:
+            query = {} if last_id is None else {"_id": {"$gt": last_id}}
+            batch = list(legacy.find(query).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            by_partition = {}
+            for doc in batch:
+                ts = (doc.get("attempt") or {}).get("timestamp") or doc.get("created_at")
+                by_partition.setdefault(partitions.partition_name(partitions.as_utc(ts)), []).append(doc)
+            if not dry_run:
+                for name, docs in by_partition.items():
+                    partitions.ensure_partition(name)
+                    try:
+                        collection(name, "attempts").insert_many(docs, ordered=False)
+                    except BulkWriteError as exc:
+                        if any(e.get("code") != DUPLICATE_KEY for e in exc.details.get("writeErrors", [])):
+                            raise
+                legacy.delete_many({"_id": {"$in": [d["_id"] for d in batch]}})
+            moved += len(batch)
+            self.stdout.write(f"{'(dry-run) ' if dry_run else ''}{moved} documentos movidos")
+        if not dry_run and legacy.estimated_document_count() == 0:
+            legacy.drop()
+            partitions.forget(partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION)
+            self.stdout.write(self.style.SUCCESS(f"{partitions.ACCESS_ATTEMPTS_LEGACY_COLLECTION} vacía: eliminada"))
+
+    def _retire(self, before, drop, dry_run):
+        """drop o renameCollection de cada mes anterior a `before`: O(1) por partición."""
+        db = get_db()
+        for name in partitions.list_partitions(refresh=True):
+            if partitions.month_of(name) >= before:
+                continue
+            if drop:
+                action = "borrada"
+                if not dry_run:
+                    db.drop_collection(name)
+            else:
+                target = partitions.ACCESS_ATTEMPTS_ARCHIVE_PREFIX + name[len(partitions.ACCESS_ATTEMPTS_PARTITION_PREFIX):]
+                action = f"archivada como {target}"
+                if not dry_run:
+                    db[name].rename(target)
+            if not dry_run:
+                partitions.forget(name)
+            self.stdout.write(f"{'(dry-run) ' if dry_run else ''}{name} {action}")
@@ -0,0 +1,48 @@
+# uso
+# recalcular desde los intentos los contadores por gate y lector de los últimos 2 días (cron nocturno)
+# python manage.py rebuild_gate_throughput --days 2
+# cargar el historial previo a los contadores desde una fecha
+# python manage.py rebuild_gate_throughput --since 2024-01-01
+# solo los gates, hasta una fecha
+# python manage.py rebuild_gate_throughput --since 2024-05-01 --until 2024-06-01 --dimension gate_id
+
+# historial/management/commands/rebuild_gate_throughput.py
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from historial import partitions, throughput
+
+
+def _date(value):
+    try:
+        return partitions.as_utc(datetime.fromisoformat(value))
+    except ValueError:
+        raise CommandError(f"fecha inválida: {value!r} (YYYY-MM-DD o ISO 8601)")
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde los intentos los contadores por minuto de gates y lectores (historial/throughput.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Recalcular los últimos N días.")
+        parser.add_argument("--since", type=str, default=None, help="Desde esta fecha (UTC).")
+        parser.add_argument("--until", type=str, default=None,
+                            help="Hasta esta fecha (UTC, excluida). Por defecto el inicio de la hora actual.")
+        parser.add_argument("--dimension", choices=throughput.THROUGHPUT_DIMENSIONS, action="append", default=[])
+
+    def handle(self, *args, **options):
+        if bool(options["days"]) == bool(options["since"]):
+            raise CommandError("Indique --days o --since (uno de los dos).")
+        # la hora en curso la siguen incrementando los registros: no se reemplaza
+        end = _date(options["until"]) if options["until"] else throughput.hour_of(timezone.now())
+        start = end - timedelta(days=options["days"]) if options["days"] else _date(options["since"])
+        if start >= end:
+            raise CommandError("El rango está vacío.")
+        dimensions = options["dimension"] or throughput.THROUGHPUT_DIMENSIONS
+        written = throughput.rebuild(start, end, dimensions)
+        for dimension in dimensions:
+            self.stdout.write(f"{dimension}: {written[dimension]} horas con intentos entre "
+                              f"{throughput.hour_of(start).isoformat()} y {throughput.hour_of(end).isoformat()}")
+        self.stdout.write(self.style.SUCCESS("Contadores recalculados."))
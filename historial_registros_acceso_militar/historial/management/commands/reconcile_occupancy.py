@@ -0,0 +1,73 @@
+# uso
+# recalcular la ocupación de cada zona desde el log de intentos y corregir los contadores del WS (cron cada 5 min)
+# python manage.py reconcile_occupancy
+# considerar solo los movimientos de las últimas N horas (por defecto, todo el log en MongoDB)
+# python manage.py reconcile_occupancy --hours 72
+# solo mostrar los valores calculados, sin enviarlos al WS
+# python manage.py reconcile_occupancy --dry-run
+
+# historial/management/commands/reconcile_occupancy.py
+from datetime import timedelta
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from requests.exceptions import RequestException
+
+from historial import partitions
+from historial.services import DIRECTION_EXIT, OCCUPANCY_URL
+from historial.wsauth import ws_headers
+
+
+def occupancy_from_log(start=None):
+    """
+    {zone_code: personas dentro}: por persona y zona vale su último intento
+    permitido (desde start, o en todo el log); está dentro si fue una entrada.
+    Los intentos sin attempt.direction (anteriores al control de ocupación)
+    cuentan como entradas. Los meses archivados (coldstore) no se leen.
+    """
+    ts = {"$gte": start} if start is not None else {"$ne": None}
+    pipeline = [
+        {"$match": {"zone.code": {"$exists": True}, "validation.allowed": True, "personnel": {"$nin": [None, ""]}}},
+        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
+        {"$match": {"ts": ts}},
+        {"$sort": {"ts": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"person": "$personnel", "zone": "$zone.code"},
+            "direction": {"$last": "$attempt.direction"},
+        }},
+        {"$group": {
+            "_id": "$_id.zone",
+            "inside": {"$sum": {"$cond": [{"$eq": ["$direction", DIRECTION_EXIT]}, 0, 1]}},
+        }},
+    ]
+    rows = partitions.aggregate(pipeline, start=start, profile="attempts", allowDiskUse=True)
+    return {r["_id"]: r["inside"] for r in rows}
+
+
+class Command(BaseCommand):
+    help = "Reconciliación periódica de los contadores de ocupación del WS contra el log de intentos en Mongo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, help="Solo los movimientos de las últimas N horas (por defecto, todos).")
+        parser.add_argument("--dry-run", action="store_true", help="No enviar los valores al WS.")
+
+    def handle(self, *args, **options):
+        start = timezone.now() - timedelta(hours=options["hours"]) if options["hours"] else None
+        counts = occupancy_from_log(start)
+        for zone, n in sorted(counts.items()):
+            self.stdout.write(f"{zone}: {n}")
+        if options["dry_run"]:
+            return
+        try:
+            resp = requests.post(f"{OCCUPANCY_URL}reconcile/", json={"counts": counts},
+                                 headers=ws_headers(), timeout=10)
+            resp.raise_for_status()
+            data = resp.json()
+        except (RequestException, ValueError) as exc:
+            raise CommandError(f"No se pudo reconciliar con el WS: {exc}")
+        for zone, d in sorted(data.get("drift", {}).items()):
+            self.stdout.write(self.style.WARNING(f"{zone}: contador {d['counter']} -> {d['log']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciliadas {data.get('zones', 0)} zonas, {len(data.get('drift', {}))} con desviación"
+        ))
@@ -0,0 +1,36 @@
+# uso
+# traer el bundle de políticas del WS para las decisiones locales (al desplegar o por cron)
+# python manage.py sync_policy_fallback
+# ver la versión guardada sin consultar al WS
+# python manage.py sync_policy_fallback --status
+
+# historial/management/commands/sync_policy_fallback.py
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from requests.exceptions import RequestException
+
+from historial.fallback import POLICY_FALLBACK_FILE, BundleError, policy_mirror
+
+
+class Command(BaseCommand):
+    help = "Sincroniza el bundle de políticas que usa historial/fallback.py cuando el WS no responde."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", action="store_true", help="Solo mostrar la versión guardada.")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            policy = policy_mirror.current()
+            if policy is None:
+                self.stdout.write(f"Sin bundle en {POLICY_FALLBACK_FILE}")
+            else:
+                synced = datetime.fromtimestamp(policy_mirror.synced_at).isoformat(timespec="seconds")
+                self.stdout.write(f"Política v{policy.version} ({len(policy.zones)} zonas, "
+                                  f"{len(policy.personnel)} personas), sincronizada {synced}")
+            return
+        try:
+            version = policy_mirror.sync()
+        except (RequestException, ValueError, KeyError, BundleError) as exc:
+            raise CommandError(f"No se pudo sincronizar: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Política v{version} guardada en {POLICY_FALLBACK_FILE}"))
@@ -1,6 +1,36 @@
 # historial/mongo.py
+"""
+Cliente de MongoDB administrado.
+
+El MongoClient no se crea al importar: get_client() lo crea en el primer uso
+y uno por proceso (MongoClient no sobrevive a un fork; en un worker de
+gunicorn/uwsgi o en multiprocessing el hijo abre su propio pool). Pool y
+timeouts salen de MONGO_CLIENT_OPTIONS, sin tocar código.
+
+Cada colección se usa con un perfil (MONGO_PROFILES) que fija write concern,
+read preference y read concern:
+  - attempts: intentos de acceso, w="majority" (es el registro de auditoría).
+  - alerts: alertas del detector, w=1.
+  - rollups: agregados de analíticas, w=0 (fire-and-forget, se recalculan).
+  - analytics: lecturas de los dashboards, pueden ir a un secundario.
+access_attempts_col y demás nombres de siempre son proxies perezosos sobre
+collection(nombre, perfil), así los imports existentes siguen funcionando.
+
+pool_stats() devuelve las estadísticas del pool por servidor (ver
+api/mongo/pool/); el tiempo de cada comando va a las métricas por petición
+(historial/metrics.py) y al log de operaciones lentas (historial/slowops.py).
+"""
+import os
+import threading
+import time
+
 from django.conf import settings
-from pymongo import MongoClient
+from pymongo import MongoClient, ReadPreference, monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from . import slowops
+from .metrics import MongoTimingListener
 
 """ client = MongoClient("mongodb://localhost:27017/")
 db = client["historial_registros_acceso_militar"]
@@ -8,8 +38,235 @@ db = client["historial_registros_acceso_militar"]
 MONGO_URI = getattr(settings, "MONGO_URI", "mongodb://localhost:27017")
 MONGO_DBNAME = getattr(settings, "MONGO_DBNAME", "historial_registros_acceso_militar")
 
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DBNAME]
+# kwargs de MongoClient; los de settings reemplazan a estos
+DEFAULT_CLIENT_OPTIONS = {
+    "maxPoolSize": 100,
+    "minPoolSize": 0,
+    "maxIdleTimeMS": None,
+    "waitQueueTimeoutMS": None,
+    "connectTimeoutMS": 20000,
+    "socketTimeoutMS": None,
+    "serverSelectionTimeoutMS": 30000,
+    "retryWrites": True,
+    "appname": "historial_registros_acceso_militar",
+}
+MONGO_CLIENT_OPTIONS = {**DEFAULT_CLIENT_OPTIONS, **getattr(settings, "MONGO_CLIENT_OPTIONS", {})}
+
+# w / j / wtimeout (write concern), read_preference (nombre de pymongo.ReadPreference)
+# y read_concern (level); lo que no se indica queda como en el cliente
+DEFAULT_PROFILES = {
+    "default": {},
+    "attempts": {"w": "majority", "wtimeout": 5000},
+    "alerts": {"w": 1},
+    "rollups": {"w": 0},
+    "analytics": {"read_preference": "SECONDARY_PREFERRED"},
+}
+MONGO_PROFILES = {**DEFAULT_PROFILES, **getattr(settings, "MONGO_PROFILES", {})}
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+
+
+# ------------------------------------------------------------------ pool stats
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Contadores del pool por servidor (host:port)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def _server(self, address):
+        key = "%s:%s" % address
+        stats = self._servers.get(key)
+        if stats is None:
+            stats = self._servers[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "created": 0,
+                "closed": 0,
+                "checkouts": 0,
+                "checkout_failed": 0,
+                "checkout_wait_ms_total": 0.0,
+                "checkout_wait_ms_max": 0.0,
+                "cleared": 0,
+                "last_cleared_at": None,
+            }
+        return stats
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            stats = self._server(address)
+            for key, delta in deltas.items():
+                stats[key] += delta
+
+    def pool_created(self, event):
+        with self._lock:
+            self._server(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            stats = self._server(event.address)
+            stats["cleared"] += 1
+            stats["last_cleared_at"] = time.time()
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, checkout_failed=1)
+
+    def connection_checked_out(self, event):
+        # duration (s) existe desde pymongo 4.7
+        wait_ms = (getattr(event, "duration", None) or 0) * 1000
+        with self._lock:
+            stats = self._server(event.address)
+            stats["checked_out"] += 1
+            stats["checkouts"] += 1
+            stats["checkout_wait_ms_total"] += wait_ms
+            stats["checkout_wait_ms_max"] = max(stats["checkout_wait_ms_max"], wait_ms)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._servers.items()}
+
+    def reset(self):
+        with self._lock:
+            self._servers = {}
+
+
+_pool_stats = PoolStatsListener()
+
+
+def pool_stats():
+    """Estadísticas del pool de este proceso: opciones, pid y contadores por servidor."""
+    servers = _pool_stats.snapshot()
+    for stats in servers.values():
+        stats["checkout_wait_ms_avg"] = (
+            stats["checkout_wait_ms_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        )
+    return {
+        "pid": os.getpid(),
+        "connected": _client is not None and _client_pid == os.getpid(),
+        "max_pool_size": MONGO_CLIENT_OPTIONS.get("maxPoolSize"),
+        "min_pool_size": MONGO_CLIENT_OPTIONS.get("minPoolSize"),
+        "servers": servers,
+    }
+
+
+# ------------------------------------------------------------------ cliente
+
+def _reset_after_fork():
+    # el hijo no debe usar los sockets ni los hilos de monitoreo del padre
+    global _client, _client_pid
+    _client = None
+    _client_pid = None
+    _pool_stats.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """MongoClient del proceso actual (se crea en el primer uso)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                if _client_pid != pid:
+                    _pool_stats.reset()
+                options = {k: v for k, v in MONGO_CLIENT_OPTIONS.items() if v is not None}
+                _client = MongoClient(MONGO_URI, event_listeners=[_pool_stats, MongoTimingListener(), slowops.listener], **options)
+                _client_pid = pid
+    return _client
+
+
+def close_client():
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def get_db():
+    return get_client()[MONGO_DBNAME]
+
+
+def _profile_options(profile):
+    try:
+        conf = MONGO_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"perfil de Mongo desconocido: {profile!r}")
+    options = {}
+    wc = {k: conf[k] for k in ("w", "j", "wtimeout") if k in conf}
+    if wc:
+        options["write_concern"] = WriteConcern(**wc)
+    if conf.get("read_preference"):
+        options["read_preference"] = getattr(ReadPreference, conf["read_preference"].upper())
+    if conf.get("read_concern"):
+        options["read_concern"] = ReadConcern(conf["read_concern"])
+    return options
+
+
+def collection(name, profile="default"):
+    """Colección `name` con el write concern / read preference del perfil."""
+    return get_db().get_collection(name, **_profile_options(profile))
+
+
+class LazyCollection:
+    """Proxy que resuelve collection(name, profile) en cada uso (sobrevive a forks)."""
+
+    def __init__(self, name, profile="default"):
+        self.name = name
+        self.profile = profile
+        _profile_options(profile)
+
+    def get(self):
+        return collection(self.name, self.profile)
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r}, profile={self.profile!r})"
+
+
+class LazyDatabase:
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+
+db = LazyDatabase()
+
+# colección única de intentos anterior a las particiones mensuales
+# (historial/partitions.py): se sigue leyendo hasta migrarla
+access_attempts_col = LazyCollection("access_attempts", "attempts")
 
-# colección donde guardaremos los intentos
-access_attempts_col = db["access_attempts"]
\ No newline at end of file
+# alertas generadas por el detector de ráfagas de denegaciones
+access_alerts_col = LazyCollection("access_alerts", "alerts")
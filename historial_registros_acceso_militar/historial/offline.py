@@ -0,0 +1,232 @@
+# historial/offline.py
+"""
+Bundle de políticas para gates sin conexión, y para las decisiones locales
+de historial/fallback.py cuando el WS no responde.
+
+Este módulo no depende de Django (solo de historial/rules.py) y decide con las
+mismas reglas que evaluate_access. El WS arma el contenido en ws/bundle.py.
+
+Este módulo y ws/offline.py (igual que historial/rules.py y ws/rules.py) son
+el mismo código: cada proyecto se despliega solo, sin dependencias entre
+ellos. Un cambio en uno va también al otro, o historial deja de leer los
+bundles que publica el WS.
+
+Formato binario:
+    cabecera (big-endian): magic b"GPB1" | uint64 versión | 32 bytes sha256 | uint32 largo
+    payload: JSON canónico del contenido, comprimido con zlib
+El sha256 se calcula sobre el JSON canónico sin comprimir, de modo que un gate
+que aplica un delta puede verificar que llegó exactamente al mismo contenido.
+
+Contenido (filas como listas para que el bundle sea compacto):
+    meta:      {"badge_fallback": bool}
+    zones:     {code: [id, name, min_rank_level, required_clearance_level,
+                       requires_special_permission, [[permission_id, required], ...]]}
+    personnel: {id: [service_number, badge_id, status, rank_level, clearance_level,
+                     [[permission_id, expires_ts], ...], rank_id, unit_id]}
+    ranks:     {id: [code, name, level]}
+    units:     {id: [code, name]}
+    grants:    {id: [zone_id, personnel_id, granted_by, granted_at, expires_at,
+                     expires_ts, reason]}
+    badges:    {badge_code: [personnel_id, status]}
+"""
+import hashlib
+import json
+import struct
+import time
+import zlib
+
+from . import rules
+
+MAGIC = b"GPB1"
+HEADER = struct.Struct(">4sQ32sI")
+SECTIONS = ("meta", "zones", "personnel", "grants", "badges", "ranks", "units")
+
+
+class BundleError(Exception):
+    pass
+
+
+def canonical(content):
+    return json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def checksum(content):
+    return hashlib.sha256(canonical(content)).hexdigest()
+
+
+def encode_bundle(content, version):
+    raw = canonical(content)
+    payload = zlib.compress(raw, 9)
+    return HEADER.pack(MAGIC, version, hashlib.sha256(raw).digest(), len(payload)) + payload
+
+
+def decode_bundle(data):
+    """Devuelve (version, contenido); lanza BundleError si el bundle está corrupto."""
+    if len(data) < HEADER.size:
+        raise BundleError("bundle truncado")
+    magic, version, digest, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise BundleError("formato de bundle desconocido")
+    payload = data[HEADER.size:HEADER.size + length]
+    if len(payload) != length:
+        raise BundleError("bundle truncado")
+    raw = zlib.decompress(payload)
+    if hashlib.sha256(raw).digest() != digest:
+        raise BundleError("checksum inválido")
+    return version, json.loads(raw)
+
+
+def diff(old, new):
+    """Cambios por sección para pasar de old a new: {section: {"upsert": {...}, "delete": [...]}}."""
+    changes = {}
+    for section in SECTIONS:
+        before, after = old.get(section, {}), new.get(section, {})
+        upsert = {k: v for k, v in after.items() if before.get(k) != v}
+        delete = [k for k in before if k not in after]
+        if upsert or delete:
+            changes[section] = {"upsert": upsert, "delete": delete}
+    return changes
+
+
+def apply_changes(content, changes):
+    out = {section: dict(content.get(section, {})) for section in SECTIONS}
+    for section, change in changes.items():
+        target = out.setdefault(section, {})
+        for k in change.get("delete", []):
+            target.pop(k, None)
+        target.update(change.get("upsert", {}))
+    return out
+
+
+class OfflinePolicy:
+    """
+    Evaluador local sobre un bundle. Construye índices en memoria al cargar;
+    cada evaluación son unas pocas búsquedas en dicts más rules.evaluate.
+    """
+
+    def __init__(self, content, version):
+        self.version = version
+        self.content = content
+        self._index()
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, content = decode_bundle(data)
+        return cls(content, version)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as fh:
+            return cls.from_bytes(fh.read())
+
+    def _index(self):
+        c = self.content
+        self.badge_fallback = c.get("meta", {}).get("badge_fallback", False)
+        self.zones = {}
+        for code, (zid, name, min_rank, cl_level, special, reqs) in c.get("zones", {}).items():
+            self.zones[code] = {
+                "id": zid,
+                "code": code,
+                "name": name,
+                "min_rank_level": min_rank,
+                "required_clearance_level": cl_level,
+                "requires_special_permission": special,
+                "permission_requirements": [{"permission_id": p, "required": r} for p, r in reqs],
+            }
+        self.personnel = c.get("personnel", {})
+        self.by_service_number = {}
+        self.by_badge_id = {}
+        for pid, row in self.personnel.items():
+            self.by_service_number[row[0]] = pid
+            if row[1]:
+                self.by_badge_id[row[1]] = pid
+        self.badges = c.get("badges", {})
+        self.ranks = c.get("ranks", {})
+        self.units = c.get("units", {})
+        # (personnel_id, zone_id) -> grants ordenados por id
+        self.grants = {}
+        for gid in sorted(c.get("grants", {}), key=int):
+            row = c["grants"][gid]
+            self.grants.setdefault((str(row[1]), row[0]), []).append((int(gid), row))
+
+    def apply_delta(self, delta):
+        """Aplica un delta de /ws/policy/delta/ y verifica el checksum resultante."""
+        if delta["from_version"] != self.version:
+            raise BundleError("el delta no parte de la versión cargada")
+        content = apply_changes(self.content, delta["changes"])
+        if checksum(content) != delta["checksum"]:
+            raise BundleError("checksum inválido tras aplicar el delta")
+        self.content = content
+        self.version = delta["to_version"]
+        self._index()
+
+    def _personnel_id(self, service_number=None, badge_id=None):
+        if service_number:
+            return self.by_service_number.get(service_number), None
+        badge = self.badges.get(badge_id)
+        if badge is not None:
+            personnel_id, badge_status = badge
+            if badge_status != "issued":
+                return None, badge_status
+            return (str(personnel_id) if personnel_id is not None else None), None
+        if self.badge_fallback:
+            return self.by_badge_id.get(badge_id), None
+        return None, None
+
+    def person(self, service_number=None, badge_id=None):
+        """
+        service_number, badge_id, rank y unit (con la forma de /ws/access-info/)
+        de la persona, o None si no está en el bundle o su badge no está emitido.
+        Un bundle anterior a ranks/units devuelve rank y unit en None.
+        """
+        personnel_id, _ = self._personnel_id(service_number, badge_id)
+        if personnel_id is None:
+            return None
+        row = self.personnel[personnel_id]
+        rank_id, unit_id = row[6:8] if len(row) >= 8 else (None, None)
+        rank = self.ranks.get(str(rank_id))
+        unit = self.units.get(str(unit_id))
+        return {
+            "service_number": row[0],
+            "badge_id": row[1],
+            "rank": {"id": rank_id, "code": rank[0], "name": rank[1], "level": rank[2]} if rank else None,
+            "unit": {"id": unit_id, "code": unit[0], "name": unit[1]} if unit else None,
+        }
+
+    def evaluate(self, zone_code, service_number=None, badge_id=None, now=None):
+        """
+        Devuelve el mismo dict que evaluate_access ('allowed', 'reason',
+        'evidence', 'special_access') o None si la persona o la zona no existen
+        (el WS respondería 404). Un badge revocado/perdido se deniega igual que
+        el 403 del WS.
+        """
+        personnel_id, badge_status = self._personnel_id(service_number, badge_id)
+        if badge_status is not None:
+            return {
+                "allowed": False,
+                "reason": f"badge_{badge_status}",
+                "evidence": [{"check": "badge_status", "passed": False, "status": badge_status}],
+                "special_access": None,
+            }
+        if personnel_id is None:
+            return None
+        zone = self.zones.get(zone_code)
+        if zone is None:
+            return None
+        status, rank_level, clearance_level, perms = self.personnel[personnel_id][2:6]
+        person = {"status": status, "rank_level": rank_level, "clearance_level": clearance_level}
+        now = time.time() if now is None else now
+        perm_ids = {p for p, expires_ts in perms if expires_ts is None or expires_ts > now}
+        grant = None
+        for gid, (_, _, granted_by, granted_at, expires_at, expires_ts, reason) in self.grants.get((personnel_id, zone["id"]), ()):
+            if expires_ts is None or expires_ts > now:
+                grant = {
+                    "id": gid,
+                    "granted_by": granted_by,
+                    "granted_at": granted_at,
+                    "expires_at": expires_at,
+                    "status": "active",
+                    "reason": reason,
+                }
+                break
+        return rules.evaluate(person, zone, perm_ids, grant)
@@ -0,0 +1,219 @@
+# historial/partitions.py
+"""
+Particiones mensuales de access_attempts.
+
+Cada intento va a access_attempts_YYYYMM según el mes (UTC) de
+attempt.timestamp; la colección y sus índices se crean con el primer intento
+del mes (o antes, con manage_attempt_partitions --ensure-ahead). Las
+analíticas consultan solo los meses que se solapan con la ventana pedida:
+aggregate() corre las etapas de filtrado del pipeline en cada partición,
+las une con $unionWith y aplica el resto (group/sort/limit) sobre la unión.
+
+Borrar o archivar un mes es un drop o un renameCollection, no un
+delete_many sobre millones de documentos (manage_attempt_partitions).
+
+Los meses archivados en segmentos comprimidos (archive_attempts,
+historial/coldstore.py) no están en MongoDB: aggregate() no los ve y
+count_by() los cuenta en proceso cuando la ventana los alcanza.
+
+La colección única anterior (ACCESS_ATTEMPTS_LEGACY_COLLECTION) se sigue
+leyendo mientras exista; manage_attempt_partitions --migrate-legacy reparte
+sus documentos en las particiones.
+"""
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ASCENDING
+
+from .mongo import collection, get_db
+
+ACCESS_ATTEMPTS_PARTITION_PREFIX = getattr(settings, "ACCESS_ATTEMPTS_PARTITION_PREFIX", "access_attempts_")
+ACCESS_ATTEMPTS_LEGACY_COLLECTION = getattr(settings, "ACCESS_ATTEMPTS_LEGACY_COLLECTION", "access_attempts")
+ACCESS_ATTEMPTS_ARCHIVE_PREFIX = getattr(settings, "ACCESS_ATTEMPTS_ARCHIVE_PREFIX", "archived_access_attempts_")
+# cada cuánto se relee la lista de colecciones (particiones creadas por otros workers)
+PARTITIONS_REFRESH_SECONDS = getattr(settings, "PARTITIONS_REFRESH_SECONDS", 60)
+
+PARTITION_INDEXES = [
+    ("attempt_ts", [("attempt.timestamp", ASCENDING)], {}),
+    ("zone_ts", [("zone.code", ASCENDING), ("attempt.timestamp", ASCENDING)], {}),
+    ("personnel_ts", [("personnel", ASCENDING), ("attempt.timestamp", ASCENDING)], {}),
+    # reintentos de la API de ingesta: solo los intentos que traen clave
+    ("idempotency_key", [("idempotency_key", ASCENDING)], {
+        "unique": True, "partialFilterExpression": {"idempotency_key": {"$type": "string"}},
+    }),
+]
+
+# etapas que se aplican documento por documento: se pueden correr en cada partición antes de unir
+_PER_DOCUMENT_STAGES = {"$match", "$addFields", "$set", "$project", "$unset"}
+
+_PARTITION_RE = re.compile(r"^" + re.escape(ACCESS_ATTEMPTS_PARTITION_PREFIX) + r"(\d{6})$")
+
+_lock = threading.Lock()
+_known = set()      # particiones que este proceso ya creó/indexó
+_existing = (0.0, frozenset())  # (leído en, nombres de colecciones)
+
+
+def partition_name(ts):
+    return f"{ACCESS_ATTEMPTS_PARTITION_PREFIX}{ts.year:04d}{ts.month:02d}"
+
+
+def month_of(name):
+    """(año, mes) de una partición, o None si el nombre no es de partición."""
+    m = _PARTITION_RE.match(name)
+    if m is None:
+        return None
+    return int(m.group(1)[:4]), int(m.group(1)[4:])
+
+
+def as_utc(ts):
+    """datetime UTC a partir de attempt.timestamp (datetime naive = UTC, o string ISO 8601)."""
+    if ts is None:
+        return timezone.now()
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if timezone.is_naive(ts):
+        return ts.replace(tzinfo=dt_timezone.utc)
+    return ts.astimezone(dt_timezone.utc)
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        month += 1
+        if month == 13:
+            year, month = year + 1, 1
+
+
+def existing_collections(refresh=False):
+    global _existing
+    read_at, names = _existing
+    if refresh or time.monotonic() - read_at >= PARTITIONS_REFRESH_SECONDS:
+        names = frozenset(get_db().list_collection_names())
+        _existing = (time.monotonic(), names)
+    return names | _known
+
+
+def list_partitions(refresh=False):
+    """Particiones existentes, de la más vieja a la más nueva."""
+    return sorted(n for n in existing_collections(refresh) if month_of(n))
+
+
+def ensure_partition(name):
+    """Crea la partición y sus índices (una vez por proceso; create_index es idempotente)."""
+    if name in _known:
+        return
+    with _lock:
+        if name in _known:
+            return
+        col = collection(name)
+        for index_name, keys, options in PARTITION_INDEXES:
+            col.create_index(keys, name=index_name, **options)
+        _known.add(name)
+
+
+def forget(name):
+    """Tras un drop/rename: que este proceso deje de darla por existente."""
+    global _existing
+    with _lock:
+        _known.discard(name)
+        _existing = (0.0, frozenset())
+
+
+def collection_for(ts, profile="attempts"):
+    """Colección (ya creada e indexada) donde va un intento con ese timestamp."""
+    name = partition_name(as_utc(ts))
+    ensure_partition(name)
+    return collection(name, profile)
+
+
+def partitions_for(start=None, end=None):
+    """
+    Colecciones a leer para attempt.timestamp en [start, end]: las particiones
+    que se solapan (más la del mes de end aunque este proceso todavía no la
+    vea) y la colección anterior si existe. Sin start, todas.
+    """
+    names = existing_collections()
+    end = as_utc(end)
+    if start is None:
+        wanted = {n for n in names if month_of(n) and month_of(n) <= (end.year, end.month)}
+    else:
+        start = as_utc(start)
+        months = [partition_name(datetime(y, m, 1)) for y, m in _months(start, end)]
+        wanted = {n for n in months if n in names}
+        wanted.add(months[-1])
+    out = sorted(wanted)
+    if ACCESS_ATTEMPTS_LEGACY_COLLECTION in names:
+        out.append(ACCESS_ATTEMPTS_LEGACY_COLLECTION)
+    return out
+
+
+def split_pipeline(pipeline):
+    """(etapas por documento del inicio, resto)."""
+    for i, stage in enumerate(pipeline):
+        if next(iter(stage)) not in _PER_DOCUMENT_STAGES:
+            return pipeline[:i], pipeline[i:]
+    return list(pipeline), []
+
+
+def union_pipeline(pipeline, others):
+    head, tail = split_pipeline(pipeline)
+    return head + [{"$unionWith": {"coll": name, "pipeline": head}} for name in others] + tail
+
+
+def zones_filter(head):
+    """zone.code fijado por un $match del inicio ({"zone.code": X} o {"$in": [...]}), o None."""
+    for stage in head:
+        value = stage.get("$match", {}).get("zone.code")
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, dict) and isinstance(value.get("$in"), list) and len(value) == 1:
+            return value["$in"]
+    return None
+
+
+def aggregate(pipeline, start=None, end=None, profile="analytics", **kwargs):
+    """
+    aggregate() sobre las particiones que se solapan con [start, end]. El
+    pipeline debe filtrar él mismo por fecha; la ventana solo elige qué
+    colecciones leer. Los meses archivados no entran: para contar con ellos,
+    count_by().
+    """
+    names = partitions_for(start, end)
+    if not names:
+        return iter(())
+    return collection(names[0], profile).aggregate(union_pipeline(pipeline, names[1:]), **kwargs)
+
+
+def count_by(keys, start, end=None, match=None, profile="analytics"):
+    """
+    Intentos con attempt.timestamp en [start, end), calientes y archivados:
+    {(valor de cada clave, en el orden de keys): cantidad}.
+
+    keys es {nombre: ruta del documento ("zone.code")} o, si la ruta empieza
+    con %, un formato de fecha sobre attempt.timestamp en UTC ("%Y-%m-%d").
+    match admite igualdad, $in, $nin y $exists por ruta. Las particiones se
+    agrupan en MongoDB; los bloques fríos de la ventana, en proceso
+    (coldstore.count_by).
+    """
+    # import tardío: coldstore importa este módulo
+    from . import coldstore
+
+    ts = {"$gte": start} if end is None else {"$gte": start, "$lt": end}
+    group = {
+        name: {"$dateToString": {"format": path, "date": "$ts"}} if path.startswith("%") else f"${path}"
+        for name, path in keys.items()
+    }
+    pipeline = ([{"$match": match}] if match else []) + [
+        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
+        {"$match": {"ts": ts}},
+        {"$group": {"_id": group, "count": {"$sum": 1}}},
+    ]
+    counts = coldstore.count_by(keys, start, end, match)
+    for r in aggregate(pipeline, start=start, end=end, profile=profile):
+        counts[tuple(r["_id"].get(name) for name in keys)] += r["count"]
+    return counts
@@ -1,80 +1,350 @@
 # historial/services.py
+import logging
+import threading
+import time
+
 import requests
 from requests.exceptions import RequestException
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.conf import settings
 from django.utils import timezone
 
-from .mongo import access_attempts_col
+from . import partitions
+from . import throughput
+from .breaker import WS_BREAKER_SLOW_MS, CircuitOpenError, is_failure, ws_breaker
+from .detector import observe_attempt
+from .fallback import POLICY_FALLBACK_ENABLED, policy_mirror
+from .jsoncodec import loads
+from . import metrics
+from .slowops import operation
+from .wsauth import ws_headers
+
+logger = logging.getLogger(__name__)
 
 # keys y timeouts
 ZONES_CACHE_KEY = "external_zones_list"
 ZONES_CACHE_TTL = getattr(settings, "ZONES_CACHE_TTL", 300)  # 5 min por defecto
+# alias de settings.CACHES para las zonas; con varios workers debe ser compartido
+# (redis/memcached) para que consulten al WS una vez entre todos
+ZONES_CACHE_ALIAS = getattr(settings, "ZONES_CACHE_ALIAS", "default")
+# cuánto se conserva la última lista buena para servirla si el WS no responde (None = sin vencimiento)
+ZONES_CACHE_STALE_TTL = getattr(settings, "ZONES_CACHE_STALE_TTL", None)
+# lock de refresco (single-flight) y espera tras un refresco fallido
+ZONES_REFRESH_LOCK_SECONDS = getattr(settings, "ZONES_REFRESH_LOCK_SECONDS", 10)
+ZONES_RETRY_SECONDS = getattr(settings, "ZONES_RETRY_SECONDS", 30)
+# arranque en frío: cuánto espera una petición la lista que está trayendo otra
+ZONES_COLD_WAIT_SECONDS = getattr(settings, "ZONES_COLD_WAIT_SECONDS", 5)
+ZONES_REFRESH_KEY = "external_zones_refreshing"
+ZONES_REFRESH_FAILED = "failed"
 ZONES_SERVICE_URL = getattr(settings, "ZONES_SERVICE_URL", "http://127.0.0.1:8000/ws/zones/")
 ACCESS_INFO_URL = getattr(settings, "ACCESS_INFO_URL", "http://127.0.0.1:8000/ws/access-info/")
+# timeout de /access-info/: por defecto el umbral de llamada lenta del circuit breaker más
+# un margen, así mientras el circuito no se abre un guardia espera poco más que una llamada lenta
+ACCESS_INFO_TIMEOUT_MARGIN_MS = getattr(settings, "ACCESS_INFO_TIMEOUT_MARGIN_MS", 100)
+ACCESS_INFO_TIMEOUT = getattr(settings, "ACCESS_INFO_TIMEOUT", None) or (
+    (WS_BREAKER_SLOW_MS + ACCESS_INFO_TIMEOUT_MARGIN_MS) / 1000)
+ACCESS_INFO_BULK_URL = getattr(settings, "ACCESS_INFO_BULK_URL", "http://127.0.0.1:8000/ws/access-info/bulk/")
+# escaneos por llamada a ACCESS_INFO_BULK_URL (no más que ACCESS_INFO_BULK_MAX del WS)
+ACCESS_INFO_BULK_CHUNK = getattr(settings, "ACCESS_INFO_BULK_CHUNK", 500)
+
+# change feed de políticas del WS: invalida la cache de zonas solo cuando cambian
+POLICY_CHANGES_URL = getattr(settings, "POLICY_CHANGES_URL", "http://127.0.0.1:8000/ws/policy/changes/")
+ZONES_CHANGES_POLL_SECONDS = getattr(settings, "ZONES_CHANGES_POLL_SECONDS", 15)
+ZONES_CHANGE_ENTITIES = "restricted_zones,zone_permission_requirements,permissions,clearance_levels"
+# el contenido de los cambios no se usa: con más de estos se recarga otra vez en la siguiente consulta
+ZONES_CHANGES_LIMIT = 100
+ZONES_VERSION_KEY = "external_zones_policy_version"
+ZONES_POLL_KEY = "external_zones_changes_polled"
+
+# subárboles de unidades del WS (tabla de clausura en MySQL)
+UNITS_SERVICE_URL = getattr(settings, "UNITS_SERVICE_URL", "http://127.0.0.1:8000/ws/units/")
+UNIT_SUBTREE_CACHE_TTL = getattr(settings, "UNIT_SUBTREE_CACHE_TTL", 300)
+
+# ocupación de zonas en el WS (entradas/salidas)
+OCCUPANCY_URL = getattr(settings, "OCCUPANCY_URL", "http://127.0.0.1:8000/ws/occupancy/")
+DIRECTION_ENTRY = "entry"
+DIRECTION_EXIT = "exit"
+
+def _zones_cache():
+    return caches[ZONES_CACHE_ALIAS]
+
+def _zones_changed():
+    """
+    Consulta el change feed del WS y devuelve True si cambiaron zonas o
+    requisitos desde la última versión vista. Pasa por ws_breaker: con el WS
+    caído falla al instante. Si el feed no responde se sigue usando la cache
+    (el TTL sigue de respaldo).
+    """
+    store = _zones_cache()
+    since = store.get(ZONES_VERSION_KEY)
+    try:
+        with ws_breaker.call(), metrics.timed("ws"):
+            resp = requests.get(POLICY_CHANGES_URL, params={
+                "since": since or 0, "entity": ZONES_CHANGE_ENTITIES, "limit": ZONES_CHANGES_LIMIT
+            }, headers=ws_headers(), timeout=2)
+            resp.raise_for_status()
+        data = resp.json()
+    except (RequestException, ValueError):
+        return False
+    changed = since is None or bool(data.get("changes"))
+    # "version" es hasta dónde llegó esta respuesta (con has_more puede quedar por detrás de "latest")
+    store.set(ZONES_VERSION_KEY, data.get("version"), None)
+    return changed
+
+def _load_zones():
+    """GET al servicio de zonas, normalizado. Lanza RequestException/ValueError si falla."""
+    with metrics.timed("ws"):
+        resp = requests.get(ZONES_SERVICE_URL, timeout=5)
+    resp.raise_for_status()
+    data = resp.json()
+    # Normalizar: id -> str, incluir code/name/min_rank...
+    out = []
+    for z in (data or []):
+        out.append({
+            "id": str(z.get("id")),
+            "code": z.get("code"),
+            "name": z.get("name"),
+            "min_rank_level": z.get("min_rank_level"),
+            "required_clearance_name": z.get("required_clearance_name"),
+            "requires_special_permission": bool(z.get("requires_special_permission")),
+        })
+    return out
+
+def _refresh_zones():
+    """
+    Trae las zonas y reemplaza la entrada de la cache. Se llama con el lock
+    ZONES_REFRESH_KEY tomado. Si el WS falla se conserva la lista anterior y el
+    lock queda marcado como fallido ZONES_RETRY_SECONDS: nadie vuelve a
+    consultar antes. Devuelve la lista o None.
+    """
+    store = _zones_cache()
+    try:
+        zones = _load_zones()
+    except (RequestException, ValueError):
+        logger.warning("zones refresh failed", exc_info=True)
+        store.set(ZONES_REFRESH_KEY, ZONES_REFRESH_FAILED, ZONES_RETRY_SECONDS)
+        return None
+    store.set(ZONES_CACHE_KEY, {"zones": zones, "fetched_at": time.time()}, ZONES_CACHE_STALE_TTL)
+    store.delete(ZONES_REFRESH_KEY)
+    return zones
+
+def _poll_zone_changes():
+    """Hilo: si el change feed informa cambios, marca la lista vencida y la refresca."""
+    if not _zones_changed():
+        return
+    store = _zones_cache()
+    entry = store.get(ZONES_CACHE_KEY)
+    if isinstance(entry, dict):
+        # vencida ya: si el refresco falla se reintenta después de ZONES_RETRY_SECONDS
+        entry["fetched_at"] = 0
+        store.set(ZONES_CACHE_KEY, entry, ZONES_CACHE_STALE_TTL)
+    if store.add(ZONES_REFRESH_KEY, 1, ZONES_REFRESH_LOCK_SECONDS):
+        _refresh_zones()
+
+def _refresh_zones_in_background():
+    # solo el proceso que toma el lock consulta al WS
+    if _zones_cache().add(ZONES_REFRESH_KEY, 1, ZONES_REFRESH_LOCK_SECONDS):
+        threading.Thread(target=_refresh_zones, name="zones-refresh", daemon=True).start()
 
 def fetch_zones():
     """
     Devuelve lista de zonas (normalizadas) consultando el servicio MySQL.
-    Usa cache para evitar peticiones repetidas.
+
+    Stale-while-revalidate: la lista se sirve siempre desde la cache
+    (ZONES_CACHE_ALIAS). Pasado ZONES_CACHE_TTL, o cuando el change feed del
+    WS informa cambios en zonas, se refresca en un hilo y mientras tanto se
+    sirve la anterior, también si el WS está caído. Un solo refresco a la vez
+    entre todos los workers que comparten el alias (lock con cache.add). El
+    change feed también se consulta en un hilo, como mucho cada
+    ZONES_CHANGES_POLL_SECONDS: con la lista en cache la petición no espera
+    al WS.
+
+    Solo sin ninguna lista guardada (arranque en frío) se espera al WS: una
+    petición lo consulta y las demás esperan su resultado hasta
+    ZONES_COLD_WAIT_SECONDS. Devuelve [] si no hay lista y el WS no responde.
     """
-    zones = cache.get(ZONES_CACHE_KEY)
-    if zones is not None:
-        return zones
+    store = _zones_cache()
+    entry = store.get(ZONES_CACHE_KEY)
+    if isinstance(entry, dict):
+        if store.add(ZONES_POLL_KEY, 1, ZONES_CHANGES_POLL_SECONDS):
+            threading.Thread(target=_poll_zone_changes, name="zones-changes", daemon=True).start()
+        if time.time() - entry["fetched_at"] >= ZONES_CACHE_TTL:
+            _refresh_zones_in_background()
+        return entry["zones"]
 
-    try:
-        resp = requests.get(ZONES_SERVICE_URL, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        # Normalizar: id -> str, incluir code/name/min_rank...
-        out = []
-        for z in (data or []):
-            out.append({
-                "id": str(z.get("id")),
-                "code": z.get("code"),
-                "name": z.get("name"),
-                "min_rank_level": z.get("min_rank_level"),
-                "required_clearance_name": z.get("required_clearance_name"),
-                "requires_special_permission": bool(z.get("requires_special_permission")),
-            })
-        cache.set(ZONES_CACHE_KEY, out, ZONES_CACHE_TTL)
-        return out
-    except RequestException as exc:
-        # Si falla el servicio remoto devolvemos lista vacía
-        # En producción loggear el error
-        return []
+    if store.add(ZONES_REFRESH_KEY, 1, ZONES_REFRESH_LOCK_SECONDS):
+        zones = _refresh_zones()
+        return zones if zones is not None else []
+    deadline = time.monotonic() + ZONES_COLD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        lock = store.get(ZONES_REFRESH_KEY)
+        if lock is None or lock == ZONES_REFRESH_FAILED:
+            break
+        time.sleep(0.05)
+    entry = store.get(ZONES_CACHE_KEY)
+    return entry["zones"] if isinstance(entry, dict) else []
 
-def query_access_info(service_number=None, badge_id=None, zone_code=None):
+def fetch_unit_subtree(unit_code):
+    """
+    Devuelve la lista de unidades del subárbol de unit_code (la propia unidad
+    primero, luego por profundidad) como [{id, code, name, parent_unit_id, depth}],
+    o None si el WS no conoce la unidad. Se cachea UNIT_SUBTREE_CACHE_TTL.
+    """
+    cache_key = f"unit_subtree:{unit_code}"
+    units = cache.get(cache_key)
+    if units is not None:
+        return units
+    with metrics.timed("ws"):
+        resp = requests.get(f"{UNITS_SERVICE_URL}{unit_code}/subtree/", timeout=5)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    units = resp.json().get("units", [])
+    cache.set(cache_key, units, UNIT_SUBTREE_CACHE_TTL)
+    return units
+
+def _get_access_info(params):
+    with metrics.timed("ws"):
+        resp = requests.get(ACCESS_INFO_URL, params=params, timeout=ACCESS_INFO_TIMEOUT)
+    # devolver el json aunque sea 404/400 para que el caller decida
+    if resp.status_code == 404:
+        return None
+    # badge revocado/perdido: el WS devuelve 403 con la validación denegada
+    # (un 403 que no es del WS, p.ej. de un proxy, no trae JSON: cae en raise_for_status)
+    if resp.status_code == 403:
+        try:
+            data = loads(resp.content)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "validation" in data:
+            return data
+    resp.raise_for_status()
+    return loads(resp.content)
+
+def query_access_info(service_number=None, badge_id=None, zone_code=None, direction=None, fallback=None):
     """
     Llamada al WS /access-info/ con badge_id o service_number y zone_code.
+    Con direction="exit" el WS no aplica la capacidad de la zona.
     Devuelve dict JSON si OK, None/raise si error.
+
+    La llamada pasa por el circuit breaker del WS (historial/breaker.py): con
+    el circuito abierto falla al instante con CircuitOpenError. Con fallback
+    (por defecto POLICY_FALLBACK_ENABLED), si el WS falla o el circuito está
+    abierto se decide localmente con el último bundle sincronizado
+    (historial/fallback.py); la respuesta trae "fallback" y el intento se
+    guarda con processed_by="fallback". Sin bundle se relanza el error. Con
+    fallback la llamada de prueba del half_open corre en segundo plano: el
+    guardia al que le toca recibe la decisión local sin esperarla.
     """
     if not zone_code or (not service_number and not badge_id):
         raise ValueError("zone_code y badge_id o service_number son requeridos")
+    if fallback is None:
+        fallback = POLICY_FALLBACK_ENABLED
 
     params = {"zone_code": zone_code}
+    if direction == DIRECTION_EXIT:
+        params["direction"] = direction
     if service_number:
         params["service_number"] = service_number
     else:
         params["badge_id"] = badge_id
 
     try:
-        resp = requests.get(ACCESS_INFO_URL, params=params, timeout=5)
-        # devolver el json aunque sea 404/400 para que el caller decida
-        if resp.status_code == 404:
-            return None
-        resp.raise_for_status()
-        return resp.json()
+        if fallback and policy_mirror.current() is not None:
+            data = ws_breaker.call_or_defer(lambda: _get_access_info(params))
+        else:
+            with ws_breaker.call():
+                data = _get_access_info(params)
     except RequestException as exc:
-        # En producción: loguear exc
+        # un 4xx es la respuesta del WS; solo se decide localmente si el WS no está
+        if fallback and is_failure(exc):
+            try:
+                return policy_mirror.decide(service_number, badge_id, zone_code,
+                                            cause="circuit_open" if isinstance(exc, CircuitOpenError) else "ws_error")
+            except LookupError:
+                logger.warning("no fallback policy loaded, WS error propagated")
         raise
+    if fallback:
+        # el WS responde: buen momento para traer el delta de políticas
+        policy_mirror.maybe_sync()
+    return data
 
-def save_access_attempt(access_info, attempt_meta):
+def query_access_info_bulk(items, record_occupancy=False):
+    """
+    Llamada al WS /access-info/bulk/ con una lista de
+    {service_number | badge_id, zone_code, direction}. Devuelve una lista de
+    {status, data[, occupancy]} en el mismo orden (ver AccessInfoBulkView).
+    Con record_occupancy el WS además registra entradas y salidas; eso no es
+    idempotente (un reintento las vuelve a contar): la ingesta usa
+    record_occupancy_bulk() después de guardar. Lanza RequestException si el
+    WS no responde: el lote entero se puede reintentar.
     """
-    Inserta en Mongo un documento de intento combinando:
+    results = []
+    for i in range(0, len(items), ACCESS_INFO_BULK_CHUNK):
+        with metrics.timed("ws"):
+            resp = requests.post(ACCESS_INFO_BULK_URL, json={
+                "items": items[i:i + ACCESS_INFO_BULK_CHUNK],
+                "record_occupancy": record_occupancy,
+            }, headers=ws_headers(), timeout=30)
+        resp.raise_for_status()
+        results.extend(loads(resp.content)["results"])
+    return results
+
+def record_occupancy(direction, zone_code):
+    """
+    Informa al WS una entrada o salida de la zona. Devuelve el JSON del WS
+    ({zone_code, capacity, occupancy[, reason]}); una entrada rechazada por
+    zona llena trae reason="zone_full". Devuelve None si el WS no responde:
+    el acceso ya fue validado y la reconciliación corrige el contador.
+    """
+    url = f"{OCCUPANCY_URL}{'exit' if direction == DIRECTION_EXIT else 'entry'}/"
+    try:
+        with ws_breaker.call(), metrics.timed("ws"):
+            resp = requests.post(url, json={"zone_code": zone_code}, headers=ws_headers(), timeout=2)
+        if resp.status_code == 409:
+            return resp.json()
+        resp.raise_for_status()
+        return resp.json()
+    except (RequestException, ValueError):
+        # En producción: loguear
+        return None
+
+def record_occupancy_bulk(moves):
+    """
+    Informa al WS en bloque (/occupancy/bulk/) las entradas y salidas
+    [{zone_code, direction}] de intentos ya guardados. Devuelve un resultado
+    por movimiento, en orden, como record_occupancy(); None si el WS no
+    responde (la reconciliación corrige los contadores).
+    """
+    results = []
+    try:
+        for i in range(0, len(moves), ACCESS_INFO_BULK_CHUNK):
+            with ws_breaker.call(), metrics.timed("ws"):
+                resp = requests.post(f"{OCCUPANCY_URL}bulk/", json={"moves": moves[i:i + ACCESS_INFO_BULK_CHUNK]},
+                                     headers=ws_headers(), timeout=10)
+            resp.raise_for_status()
+            results.extend(loads(resp.content)["results"])
+    except (RequestException, ValueError, KeyError):
+        logger.warning("occupancy bulk update failed, left to reconcile_occupancy", exc_info=True)
+        return None
+    return results
+
+def deny_zone_full(access_info, occupancy_info):
+    """Marca como denegado (zone_full) un acceso que perdió la carrera por el último lugar."""
+    validation = access_info.setdefault("validation", {})
+    validation["allowed"] = False
+    validation["reason"] = "zone_full"
+    validation.setdefault("evidence", []).append({
+        "check": "capacity", "passed": False,
+        "value": occupancy_info.get("occupancy"), "required": occupancy_info.get("capacity"),
+    })
+    return access_info
+
+def build_attempt_doc(access_info, attempt_meta):
+    """
+    Documento de intento combinando:
     - access_info: respuesta del WS (persona, zone, validation, permissions...)
-    - attempt_meta: { timestamp, gate_id, device, ip, processed_by }
-    Devuelve el resultado de insert_one.
+    - attempt_meta: { timestamp, gate_id, device, ip, processed_by, direction[, idempotency_key] }
     """
     now = timezone.now()
     doc = {
@@ -98,10 +368,32 @@ def save_access_attempt(access_info, attempt_meta):
             "gate_id": attempt_meta.get("gate_id"),
             "device": attempt_meta.get("device"),
             "ip": attempt_meta.get("ip"),
+            "direction": attempt_meta.get("direction", DIRECTION_ENTRY),
         },
         "created_at": now,
-        "processed_by": attempt_meta.get("processed_by", "web-ui"),
+        # decidido localmente por historial/fallback.py: se distingue de las decisiones del WS
+        "processed_by": "fallback" if access_info.get("fallback") else attempt_meta.get("processed_by", "web-ui"),
         # opcional: copia raw de access_info para auditoría
         "ws_response": access_info,
     }
-    return access_attempts_col.insert_one(doc)
+    if access_info.get("fallback"):
+        doc["fallback"] = dict(access_info["fallback"], operator=attempt_meta.get("processed_by"))
+    # clave del cliente (API de ingesta): índice único parcial en cada partición
+    if attempt_meta.get("idempotency_key"):
+        doc["idempotency_key"] = attempt_meta["idempotency_key"]
+    return doc
+
+@operation("save_access_attempt")
+def save_access_attempt(access_info, attempt_meta):
+    """
+    Inserta en Mongo el intento armado por build_attempt_doc.
+    Devuelve el resultado de insert_one.
+    """
+    doc = build_attempt_doc(access_info, attempt_meta)
+    # partición mensual según attempt.timestamp (historial/partitions.py)
+    result = partitions.collection_for(doc["attempt"]["timestamp"]).insert_one(doc)
+    # alimentar el detector de ráfagas (insert_one ya dejó el _id en doc)
+    observe_attempt(doc)
+    # contadores por gate y lector (historial/throughput.py)
+    throughput.record([doc])
+    return result
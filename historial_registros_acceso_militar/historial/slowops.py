@@ -0,0 +1,209 @@
+# historial/slowops.py
+"""
+Monitoreo de comandos de MongoDB y log de operaciones lentas.
+
+Las vistas de analíticas y save_access_attempt se marcan con @operation; el
+SlowOpListener (registrado en historial/mongo.py) atribuye cada comando que
+corre dentro de esa operación y registra duración, documentos devueltos (o
+escritos) y la forma del comando: etapas del pipeline con los valores
+reemplazados por su tipo, así dos consultas con distintas fechas cuentan como
+el mismo pipeline.
+
+  - stats(): por operación y forma, cantidad, tiempo total/máximo y documentos
+    (en memoria del proceso).
+  - lo que pase de MONGO_SLOW_OP_MS va al logger "historial.slowops" (una
+    línea JSON por comando; el RotatingFileHandler se configura en LOGGING) y
+    a una lista con los últimos MONGO_SLOW_OP_KEEP.
+historial/admin/slow-ops/ (solo staff) muestra ambas cosas.
+"""
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import monitoring
+
+from .jsoncodec import dumps, loads
+
+MONGO_SLOW_OP_MS = getattr(settings, "MONGO_SLOW_OP_MS", 200)
+MONGO_SLOW_OP_KEEP = getattr(settings, "MONGO_SLOW_OP_KEEP", 200)
+# archivo del RotatingFileHandler de "historial.slowops" (lo lee la vista de admin)
+MONGO_SLOW_OP_LOG = getattr(settings, "MONGO_SLOW_OP_LOG", None)
+
+logger = logging.getLogger("historial.slowops")
+
+_operation = ContextVar("historial_mongo_operation", default=None)
+
+# comandos sobre un cursor abierto: se atribuyen al aggregate/find que lo abrió
+_CURSOR_COMMANDS = {"getMore", "killCursors"}
+_MAX_OPEN_CURSORS = 1000
+
+
+def operation(name):
+    """Decorador: los comandos de MongoDB dentro de la función se atribuyen a `name`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _operation.set(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _operation.reset(token)
+        return wrapper
+    return decorator
+
+
+def shape(value):
+    """Estructura de un filtro o pipeline con los valores literales reemplazados por su tipo."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and all(not isinstance(v, (dict, list, tuple)) for v in value):
+            return [type(value[0]).__name__]
+        return [shape(v) for v in value]
+    if isinstance(value, str) and value.startswith("$"):
+        # referencia a campo: es parte de la forma
+        return value
+    return type(value).__name__
+
+
+def command_shape(command_name, command):
+    if command_name == "aggregate":
+        return shape(command.get("pipeline", []))
+    if command_name in ("find", "count", "countDocuments"):
+        return shape({"filter": command.get("filter", command.get("query", {})), "sort": command.get("sort")})
+    if command_name == "distinct":
+        return shape({"key": command.get("key"), "query": command.get("query", {})})
+    if command_name in ("update", "delete"):
+        return shape(command.get(command_name + "s", [])[:1])
+    return None
+
+
+def _documents(reply):
+    cursor = reply.get("cursor")
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if "n" in reply:
+        return reply["n"]
+    if "values" in reply:
+        return len(reply["values"])
+    return 0
+
+
+class SlowOpListener(monitoring.CommandListener):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._cursors = {}  # cursor id -> (operación, comando, forma) del aggregate/find que lo abrió
+        self._stats = {}
+        self.recent_slow = deque(maxlen=MONGO_SLOW_OP_KEEP)
+
+    def started(self, event):
+        name = event.command_name
+        cursor_id = None
+        if name in _CURSOR_COMMANDS:
+            # el cursor puede recorrerse fuera de la operación que lo abrió
+            cursor_id = event.command.get(name)
+            origin = self._cursors.get(cursor_id)
+            if origin is None:
+                return
+            op, name, cmd_shape = origin
+        else:
+            op = _operation.get()
+            if op is None:
+                return
+            cmd_shape = command_shape(name, event.command)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (op, name, cmd_shape, event.database_name, cursor_id)
+
+    def succeeded(self, event):
+        self._finish(event, _documents(event.reply), None)
+
+    def failed(self, event):
+        failure = event.failure
+        self._finish(event, 0, str(failure.get("errmsg", failure) if isinstance(failure, dict) else failure))
+
+    def _finish(self, event, documents, error):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        op, name, cmd_shape, database, old_cursor = pending
+        duration_ms = event.duration_micros / 1000
+        reply = getattr(event, "reply", None) or {}
+        cursor_id = (reply.get("cursor") or {}).get("id")
+        key = (op, name, dumps(cmd_shape).decode())
+        with self._lock:
+            if old_cursor and not cursor_id:
+                self._cursors.pop(old_cursor, None)
+            elif cursor_id:
+                if len(self._cursors) >= _MAX_OPEN_CURSORS:
+                    # cursores abandonados sin agotar
+                    self._cursors.pop(next(iter(self._cursors)))
+                self._cursors[cursor_id] = (op, name, cmd_shape)
+            row = self._stats.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "documents": 0, "errors": 0})
+            # un getMore suma documentos y tiempo al comando que abrió el cursor
+            if event.command_name not in _CURSOR_COMMANDS:
+                row["count"] += 1
+            row["total_ms"] += duration_ms
+            row["max_ms"] = max(row["max_ms"], duration_ms)
+            row["documents"] += documents
+            row["errors"] += error is not None
+        if duration_ms >= MONGO_SLOW_OP_MS:
+            entry = {
+                "at": timezone.now().isoformat(),
+                "operation": op,
+                "command": event.command_name,
+                "database": database,
+                "duration_ms": round(duration_ms, 3),
+                "documents": documents,
+                "shape": cmd_shape,
+                "error": error,
+            }
+            self.recent_slow.append(entry)
+            logger.warning(dumps(entry).decode())
+
+    def stats(self):
+        with self._lock:
+            rows = [
+                {"operation": op, "command": name, "shape": shape_json, **dict(row)}
+                for (op, name, shape_json), row in self._stats.items()
+            ]
+        for row in rows:
+            row["avg_ms"] = row["total_ms"] / row["count"] if row["count"] else 0.0
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+            self._cursors = {}
+            self._stats = {}
+            self.recent_slow.clear()
+
+
+listener = SlowOpListener()
+
+
+def tail_slow_log(limit=MONGO_SLOW_OP_KEEP):
+    """Últimas entradas del log de operaciones lentas, más recientes primero ([] si no hay log)."""
+    if not MONGO_SLOW_OP_LOG:
+        return []
+    try:
+        with open(MONGO_SLOW_OP_LOG, "rb") as fh:
+            fh.seek(0, 2)
+            fh.seek(max(0, fh.tell() - limit * 2048))
+            lines = fh.read().splitlines()[-limit:]
+    except OSError:
+        return []
+    entries = []
+    for line in reversed(lines):
+        try:
+            entries.append(loads(line))
+        except ValueError:
+            # línea cortada por el seek o escrita con otro formato
+            continue
+    return entries
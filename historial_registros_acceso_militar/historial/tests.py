@@ -1,3 +1,365 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.test import Client, SimpleTestCase
+from requests.exceptions import ConnectionError, HTTPError
+
+from . import mongo, partitions, services, views_ingest
+from .breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from .fallback import PolicyMirror
+from .offline import OfflinePolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, **overrides):
+    options = dict(window=4, min_calls=4, failure_rate=0.5, slow_ms=100, slow_rate=0.5, open_seconds=5)
+    options.update(overrides)
+    return CircuitBreaker("test", clock=clock, **options)
+
+
+def _run(breaker, fail=False, duration=0.0, clock=None):
+    """Resultado de una llamada: ok, failed o rejected (CircuitOpenError)."""
+    try:
+        with breaker.call():
+            if clock is not None:
+                clock.now += duration
+            if fail:
+                raise ConnectionError("WS down")
+    except CircuitOpenError:
+        return "rejected"
+    except ConnectionError:
+        return "failed"
+    return "ok"
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Estados del circuit breaker (historial/breaker.py) con un reloj falso."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = _breaker(self.clock)
+
+    def _open(self):
+        for fail in (True, False, True, False):
+            _run(self.breaker, fail=fail)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            _run(self.breaker, fail=True)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_opens_on_failure_rate_and_fails_fast(self):
+        self._open()
+        self.assertEqual(_run(self.breaker), "rejected")
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    def test_opens_on_slow_rate(self):
+        for _ in range(4):
+            _run(self.breaker, duration=0.2, clock=self.clock)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_client_errors_do_not_count(self):
+        response = mock.Mock(status_code=400)
+        for _ in range(4):
+            with self.assertRaises(HTTPError):
+                with self.breaker.call():
+                    raise HTTPError(response=response)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        self._open()
+        self.clock.now += 5
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        probe = self.breaker.call()
+        probe.__enter__()
+        self.assertEqual(_run(self.breaker), "rejected")
+        probe.__exit__(None, None, None)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self._open()
+        self.clock.now += 5
+        self.assertEqual(_run(self.breaker, fail=True), "failed")
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.stats()["opened"], 2)
+
+    def test_call_or_defer_probes_in_background(self):
+        self._open()
+        self.clock.now += 5
+        started, release = threading.Event(), threading.Event()
+
+        def slow_ws():
+            started.set()
+            release.wait(5)
+            return "ws"
+
+        # el guardia al que le toca la prueba no la espera
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call_or_defer(slow_ws)
+        self.assertTrue(started.wait(5))
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call_or_defer(lambda: "ws")
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == "test-breaker-probe":
+                thread.join(5)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.call_or_defer(lambda: "ws"), "ws")
+
+
+def _policy():
+    content = {
+        "meta": {"badge_fallback": False},
+        "zones": {"CZ-01": [7, "Armería", 3, 2, False, []]},
+        "personnel": {"1": ["SN-1", "B-1", "active", 5, 3, [], 2, 4]},
+        "grants": {},
+        "badges": {"B-1": [1, "issued"], "B-9": [1, "lost"]},
+        "ranks": {"2": ["CPT", "Capitán", 5]},
+        "units": {"4": ["U-4", "Batallón 4"]},
+    }
+    return OfflinePolicy(content, 12)
+
+
+class FallbackDecisionTests(SimpleTestCase):
+    """Decisiones locales con el WS caído (historial/fallback.py) y cómo se guardan."""
+
+    def setUp(self):
+        mirror = PolicyMirror(path="/nonexistent/policy_fallback.bin")
+        mirror.policy, mirror.synced_at, mirror._loaded_from_disk = _policy(), 1000.0, True
+        patches = [
+            mock.patch.object(services, "policy_mirror", mirror),
+            mock.patch.object(services, "ws_breaker", _breaker(FakeClock(), min_calls=2)),
+            mock.patch.object(services.requests, "get", side_effect=ConnectionError("WS down")),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_ws_error_decides_locally(self):
+        info = services.query_access_info(service_number="SN-1", zone_code="CZ-01", fallback=True)
+        self.assertTrue(info["validation"]["allowed"])
+        self.assertEqual(info["fallback"]["cause"], "ws_error")
+        self.assertEqual(info["fallback"]["policy_version"], 12)
+        self.assertEqual(info["rank"]["code"], "CPT")
+        self.assertEqual(info["unit"]["code"], "U-4")
+
+    def test_open_circuit_decides_without_calling_ws(self):
+        for _ in range(2):
+            services.query_access_info(badge_id="B-1", zone_code="CZ-01", fallback=True)
+        calls = services.requests.get.call_count
+        info = services.query_access_info(badge_id="B-1", zone_code="CZ-01", fallback=True)
+        self.assertEqual(info["fallback"]["cause"], "circuit_open")
+        self.assertEqual(info["service_number"], "SN-1")
+        self.assertEqual(services.requests.get.call_count, calls)
+
+    def test_lost_badge_is_denied_locally(self):
+        info = services.query_access_info(badge_id="B-9", zone_code="CZ-01", fallback=True)
+        self.assertFalse(info["validation"]["allowed"])
+        self.assertEqual(info["validation"]["reason"], "badge_lost")
+
+    def test_without_fallback_the_error_propagates(self):
+        with self.assertRaises(ConnectionError):
+            services.query_access_info(service_number="SN-1", zone_code="CZ-01", fallback=False)
+
+    def test_attempt_is_saved_as_fallback(self):
+        info = services.query_access_info(service_number="SN-1", zone_code="CZ-01", fallback=True)
+        doc = services.build_attempt_doc(info, {"gate_id": "G1", "processed_by": "guardia1"})
+        self.assertEqual(doc["processed_by"], "fallback")
+        self.assertEqual(doc["fallback"]["operator"], "guardia1")
+        self.assertEqual(doc["fallback"]["policy_version"], 12)
+        self.assertEqual(doc["personnel_full"]["rank"]["code"], "CPT")
+
+    def test_ws_answer_is_not_marked_fallback(self):
+        doc = services.build_attempt_doc({"service_number": "SN-1", "validation": {"allowed": True}},
+                                         {"processed_by": "guardia1"})
+        self.assertEqual(doc["processed_by"], "guardia1")
+        self.assertNotIn("fallback", doc)
+
+
+class MongoTestCase(SimpleTestCase):
+    """Pruebas contra una base propia (test_<MONGO_DBNAME>) que se borra antes y después de cada una."""
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(mongo, "MONGO_DBNAME", f"test_{mongo.MONGO_DBNAME}"),
+            # particiones que este proceso ya dio por creadas (son de otra base)
+            mock.patch.object(partitions, "_known", set()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self._drop)
+        self._drop()
+
+    def _drop(self):
+        mongo.get_client().drop_database(mongo.MONGO_DBNAME)
+        partitions.forget(None)
+
+
+class PartitionRoutingTests(MongoTestCase):
+    """Intentos por mes de attempt.timestamp (historial/partitions.py)."""
+
+    def _save(self, ts, zone="CZ-01"):
+        return services.save_access_attempt(
+            {"service_number": "SN-1", "zone": {"code": zone}, "validation": {"allowed": True}},
+            {"timestamp": ts, "gate_id": "G1"},
+        )
+
+    def test_partition_is_the_utc_month(self):
+        self.assertEqual(partitions.partition_name(datetime(2024, 5, 31, 23, 59)), "access_attempts_202405")
+        # 21:30 del 31 en UTC-3 ya es junio en UTC
+        self.assertEqual(partitions.partition_name(partitions.as_utc("2024-05-31T21:30:00-03:00")),
+                         "access_attempts_202406")
+        self.assertEqual(partitions.month_of("access_attempts_202406"), (2024, 6))
+        self.assertIsNone(partitions.month_of("access_attempts"))
+
+    def test_save_goes_to_the_month_partition(self):
+        self._save(datetime(2024, 5, 2, 8, 15))
+        self._save("2024-06-01T00:00:00Z")
+        db = mongo.get_db()
+        self.assertEqual(db["access_attempts_202405"].count_documents({}), 1)
+        self.assertEqual(db["access_attempts_202406"].count_documents({}), 1)
+        self.assertEqual(partitions.list_partitions(refresh=True), ["access_attempts_202405", "access_attempts_202406"])
+
+    def test_new_partition_gets_its_indexes(self):
+        self._save(datetime(2024, 5, 2))
+        indexes = mongo.get_db()["access_attempts_202405"].index_information()
+        for name, _, _ in partitions.PARTITION_INDEXES:
+            self.assertIn(name, indexes)
+        self.assertTrue(indexes["idempotency_key"]["unique"])
+
+    def test_window_reads_only_overlapping_months(self):
+        for month in (1, 2, 4):
+            self._save(datetime(2024, month, 10))
+        partitions.existing_collections(refresh=True)
+        self.assertEqual(partitions.partitions_for(datetime(2024, 2, 1), datetime(2024, 4, 30)),
+                         ["access_attempts_202402", "access_attempts_202404"])
+        # el mes de end se lee aunque este proceso todavía no lo vea
+        self.assertEqual(partitions.partitions_for(datetime(2024, 4, 1), datetime(2024, 5, 3)),
+                         ["access_attempts_202404", "access_attempts_202405"])
+        self.assertEqual(partitions.partitions_for(None, datetime(2024, 3, 1)),
+                         ["access_attempts_202401", "access_attempts_202402"])
+
+    def test_legacy_collection_is_still_read(self):
+        mongo.get_db()["access_attempts"].insert_one({"attempt": {"timestamp": datetime(2023, 12, 1)}})
+        partitions.existing_collections(refresh=True)
+        self.assertEqual(partitions.partitions_for(datetime(2024, 1, 1), datetime(2024, 1, 31))[-1], "access_attempts")
+
+    def test_aggregate_unions_the_window(self):
+        self._save(datetime(2024, 1, 10), "CZ-01")
+        self._save(datetime(2024, 2, 10), "CZ-01")
+        self._save(datetime(2024, 2, 11), "CZ-02")
+        self._save(datetime(2024, 3, 10), "CZ-01")
+        partitions.existing_collections(refresh=True)
+        start, end = datetime(2024, 1, 1), datetime(2024, 2, 28)
+        pipeline = [
+            {"$match": {"attempt.timestamp": {"$gte": start, "$lte": end}}},
+            {"$group": {"_id": "$zone.code", "count": {"$sum": 1}}},
+        ]
+        counts = {r["_id"]: r["count"] for r in partitions.aggregate(pipeline, start=start, end=end)}
+        self.assertEqual(counts, {"CZ-01": 2, "CZ-02": 1})
+
+
+class FakeWSResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = json.dumps(data).encode()
+
+    def raise_for_status(self):
+        pass
+
+
+class IngestIdempotencyTests(MongoTestCase):
+    """Reintentos de la API de ingesta (historial/views_ingest.py): un resultado por línea, sin duplicar."""
+
+    def setUp(self):
+        super().setUp()
+        self.decisions, self.moves = [], []
+        patches = [
+            mock.patch.object(views_ingest, "INGEST_TOKEN", "gate-token"),
+            mock.patch.object(services, "ws_breaker", _breaker(FakeClock())),
+            mock.patch.object(services.requests, "post", side_effect=self._ws),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.client = Client(HTTP_AUTHORIZATION="Bearer gate-token")
+
+    def _ws(self, url, json=None, **kwargs):
+        if url.endswith("/occupancy/bulk/"):
+            self.moves.extend(json["moves"])
+            return FakeWSResponse({"results": [{"zone_code": m["zone_code"], "occupancy": 1} for m in json["moves"]]})
+        self.decisions.extend(json["items"])
+        return FakeWSResponse({"results": [
+            {"status": 404, "data": {"detail": "No Personnel matches the given query."}}
+            if item["service_number"] == "SN-404" else
+            {"status": 200, "data": {"service_number": item["service_number"], "zone": {"code": item["zone_code"]},
+                                     "validation": {"allowed": True, "reason": "ok", "evidence": []}}}
+            for item in json["items"]
+        ]})
+
+    def _ingest(self, *scans):
+        body = "\n".join(json.dumps(scan) if isinstance(scan, dict) else scan for scan in scans)
+        response = self.client.post("/historial/api/ingest/attempts/", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _scan(self, key, timestamp="2024-05-02T08:15:00Z", service_number="SN-1"):
+        return {"key": key, "service_number": service_number, "zone_code": "CZ-01", "timestamp": timestamp,
+                "gate_id": "G1"}
+
+    def _stored(self):
+        return sum(mongo.get_db()[name].count_documents({}) for name in partitions.list_partitions(refresh=True))
+
+    def test_retry_returns_duplicates_with_the_stored_ids(self):
+        batch = [self._scan("G1-1"), self._scan("G1-2", "2024-06-01T00:00:00Z")]
+        first = self._ingest(*batch)
+        self.assertEqual([r["status"] for r in first["results"]], ["created", "created"])
+        retry = self._ingest(*batch)
+        self.assertEqual([r["status"] for r in retry["results"]], ["duplicate", "duplicate"])
+        self.assertEqual([r["id"] for r in retry["results"]], [r["id"] for r in first["results"]])
+        self.assertEqual((retry["created"], retry["duplicates"]), (0, 2))
+        self.assertEqual(self._stored(), 2)
+        # el reintento no vuelve a pedir decisiones ni a mover la ocupación
+        self.assertEqual(len(self.decisions), 2)
+        self.assertEqual(len(self.moves), 2)
+
+    def test_partial_retry_only_creates_the_new_keys(self):
+        first = self._ingest(self._scan("G1-1"))
+        retry = self._ingest(self._scan("G1-1"), self._scan("G1-2"))
+        self.assertEqual([r["status"] for r in retry["results"]], ["duplicate", "created"])
+        self.assertEqual(retry["results"][0]["id"], first["results"][0]["id"])
+        self.assertEqual(self._stored(), 2)
+
+    def test_key_repeated_in_the_batch(self):
+        out = self._ingest(self._scan("G1-1"), self._scan("G1-1"))
+        self.assertEqual([r["status"] for r in out["results"]], ["created", "duplicate"])
+        self.assertEqual(self._stored(), 1)
+
+    def test_concurrent_retry_hits_the_unique_index(self):
+        first = self._ingest(self._scan("G1-1"))
+        # otro reintento pasó la consulta previa antes de que se guardara la clave
+        with mock.patch.object(views_ingest, "_stored_keys", return_value={}):
+            retry = self._ingest(self._scan("G1-1"), self._scan("G1-2"))
+        self.assertEqual([r["status"] for r in retry["results"]], ["duplicate", "created"])
+        self.assertEqual(self._stored(), 2)
+        self.assertEqual(len(self.moves), len(first["results"]) + 1)
+
+    def test_each_line_gets_its_own_result(self):
+        out = self._ingest(self._scan("G1-1"), "not json", {"key": "G1-2", "zone_code": "CZ-01"},
+                           self._scan("G1-3", service_number="SN-404"), self._scan("G1-4", timestamp=None))
+        self.assertEqual([r["line"] for r in out["results"]], [1, 2, 3, 4, 5])
+        self.assertEqual([r["status"] for r in out["results"]], ["created", "invalid", "invalid", "not_found", "invalid"])
+        self.assertEqual(out["results"][4]["error"], "timestamp_required")
+        self.assertEqual(self._stored(), 1)
@@ -0,0 +1,237 @@
+# historial/throughput.py
+"""
+Contadores de intentos por gate y por lector a resolución de minuto.
+
+Cada intento guardado incrementa un documento por (dimensión, clave, hora UTC)
+en la colección GATE_THROUGHPUT_COLLECTION:
+
+  {"_id": "gate_id|G1|2024050208", "dimension": "gate_id", "key": "G1",
+   "hour": 2024-05-02T08:00Z, "total": 412, "allowed": 398, "denied": 14,
+   "minutes": {"0": 3, "1": 9, ..., "59": 6}}
+
+con un update_one($inc, upsert) por documento tocado (perfil "rollups", w=0:
+no frena el registro). Un lote de la API de ingesta agrupa sus incrementos y
+los manda en un solo bulk_write.
+
+Las analíticas leen estos documentos (uno por gate y hora), no los intentos:
+una semana de un gate son 168 documentos. series() arma series por minuto o
+por hora, peaks() el minuto y la hora de más carga y heatmap() la matriz
+día de la semana × hora.
+
+Como los incrementos son fire-and-forget, rebuild_gate_throughput recalcula
+un rango desde los intentos (también sirve para cargar el historial previo).
+"""
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ASCENDING, UpdateOne
+
+from . import partitions
+from .mongo import collection
+
+logger = logging.getLogger(__name__)
+
+GATE_THROUGHPUT_COLLECTION = getattr(settings, "GATE_THROUGHPUT_COLLECTION", "gate_throughput")
+# campos de attempt que se cuentan
+THROUGHPUT_DIMENSIONS = ("gate_id", "device")
+
+_indexed = threading.Event()
+
+
+def _col(profile="rollups"):
+    col = collection(GATE_THROUGHPUT_COLLECTION, profile)
+    if not _indexed.is_set():
+        # create_index es idempotente; una vez por proceso
+        collection(GATE_THROUGHPUT_COLLECTION).create_index(
+            [("dimension", ASCENDING), ("hour", ASCENDING), ("key", ASCENDING)], name="dimension_hour_key")
+        _indexed.set()
+    return col
+
+
+def hour_of(ts):
+    ts = partitions.as_utc(ts)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(dimension, key, hour):
+    return f"{dimension}|{key}|{hour:%Y%m%d%H}"
+
+
+def increments(docs):
+    """{_id del documento de la hora: Counter de campos a incrementar} para estos intentos."""
+    out = {}
+    for doc in docs:
+        attempt = doc.get("attempt") or {}
+        try:
+            ts = partitions.as_utc(attempt.get("timestamp"))
+        except (TypeError, ValueError):
+            continue
+        hour = ts.replace(minute=0, second=0, microsecond=0)
+        allowed = bool((doc.get("validation") or {}).get("allowed"))
+        for dimension in THROUGHPUT_DIMENSIONS:
+            key = attempt.get(dimension)
+            if not key:
+                continue
+            _id = bucket_id(dimension, key, hour)
+            entry = out.get(_id)
+            if entry is None:
+                entry = out[_id] = ({"dimension": dimension, "key": key, "hour": hour}, Counter())
+            counts = entry[1]
+            counts["total"] += 1
+            # ambos campos, aunque uno sume 0: así los documentos tienen siempre la misma forma
+            counts["allowed"] += allowed
+            counts["denied"] += not allowed
+            counts[f"minutes.{ts.minute}"] += 1
+    return out
+
+
+def record(docs):
+    """Suma estos intentos a los contadores. Nunca interrumpe el guardado."""
+    try:
+        ops = [
+            UpdateOne({"_id": _id}, {"$inc": dict(counts), "$setOnInsert": fields}, upsert=True)
+            for _id, (fields, counts) in increments(docs).items()
+        ]
+        if ops:
+            _col().bulk_write(ops, ordered=False)
+    except Exception:
+        logger.exception("gate throughput counters failed")
+
+
+def buckets(dimension, start, end, key=None):
+    """Documentos por hora de la dimensión con hour en [start, end)."""
+    if dimension not in THROUGHPUT_DIMENSIONS:
+        raise ValueError(f"dimensión desconocida: {dimension!r}")
+    query = {"dimension": dimension, "hour": {"$gte": hour_of(start), "$lt": end}}
+    if key:
+        query["key"] = key
+    return _col("analytics").find(query, {"_id": 0}).sort("hour", ASCENDING)
+
+
+def _hours(start, end):
+    hour = hour_of(start)
+    while hour < end:
+        yield hour
+        hour += timedelta(hours=1)
+
+
+def series(dimension, start, end, resolution="hour", key=None, limit=10):
+    """
+    Intentos por minuto o por hora en [start, end) de las `limit` claves con
+    más intentos: (etiquetas ISO, [(clave, [valores])]).
+    """
+    start, end = partitions.as_utc(start), partitions.as_utc(end)
+    step = timedelta(minutes=1) if resolution == "minute" else timedelta(hours=1)
+    if resolution == "minute":
+        start = start.replace(second=0, microsecond=0)
+    else:
+        start = hour_of(start)
+    slots = int((end - start) / step)
+    totals = Counter()
+    values = {}
+    for b in buckets(dimension, start, end, key):
+        hour = partitions.as_utc(b["hour"])
+        row = values.setdefault(b["key"], [0] * slots)
+        totals[b["key"]] += b.get("total", 0)
+        if resolution == "minute":
+            for minute, count in (b.get("minutes") or {}).items():
+                i = int((hour + timedelta(minutes=int(minute)) - start) / step)
+                if 0 <= i < slots:
+                    row[i] += count
+        else:
+            i = int((hour - start) / step)
+            if 0 <= i < slots:
+                row[i] += b.get("total", 0)
+    labels = [(start + step * i).isoformat() for i in range(slots)]
+    return labels, [(k, values[k]) for k, _ in totals.most_common(limit)]
+
+
+def peaks(dimension, start, end, limit=None):
+    """
+    Por clave: total, permitidos, denegados, minutos con actividad, minuto y
+    hora de más intentos. Ordenado por el minuto pico (lo que dimensiona un lector).
+    """
+    rows = {}
+    for b in buckets(dimension, start, partitions.as_utc(end)):
+        hour = partitions.as_utc(b["hour"])
+        row = rows.get(b["key"])
+        if row is None:
+            row = rows[b["key"]] = {
+                "key": b["key"], "total": 0, "allowed": 0, "denied": 0, "active_minutes": 0,
+                "peak_minute": {"at": None, "count": 0}, "peak_hour": {"at": None, "count": 0},
+            }
+        total = b.get("total", 0)
+        row["total"] += total
+        row["allowed"] += b.get("allowed", 0)
+        row["denied"] += b.get("denied", 0)
+        if total > row["peak_hour"]["count"]:
+            row["peak_hour"] = {"at": hour.isoformat(), "count": total}
+        minutes = b.get("minutes") or {}
+        row["active_minutes"] += len(minutes)
+        if minutes:
+            minute, count = max(minutes.items(), key=lambda item: item[1])
+            if count > row["peak_minute"]["count"]:
+                row["peak_minute"] = {"at": (hour + timedelta(minutes=int(minute))).isoformat(), "count": count}
+    for row in rows.values():
+        row["avg_per_active_minute"] = round(row["total"] / row["active_minutes"], 2) if row["active_minutes"] else 0
+    out = sorted(rows.values(), key=lambda r: (-r["peak_minute"]["count"], -r["total"]))
+    return out[:limit] if limit else out
+
+
+def heatmap(dimension, start, end, key=None):
+    """
+    Matriz 7×24 (lunes = 0, hora local de TIME_ZONE) con el promedio de
+    intentos por hora de la semana en [start, end), y las ocurrencias de cada
+    celda en el rango (horas sin intentos cuentan como 0).
+    """
+    start, end = hour_of(start), partitions.as_utc(end)
+    totals = [[0] * 24 for _ in range(7)]
+    occurrences = [[0] * 24 for _ in range(7)]
+    for hour in _hours(start, end):
+        local = timezone.localtime(hour)
+        occurrences[local.weekday()][local.hour] += 1
+    for b in buckets(dimension, start, end, key):
+        local = timezone.localtime(partitions.as_utc(b["hour"]))
+        totals[local.weekday()][local.hour] += b.get("total", 0)
+    average = [
+        [round(t / n, 2) if n else 0 for t, n in zip(trow, nrow)]
+        for trow, nrow in zip(totals, occurrences)
+    ]
+    return {"totals": totals, "average": average, "occurrences": occurrences}
+
+
+def rebuild(start, end, dimensions=THROUGHPUT_DIMENSIONS):
+    """
+    Recalcula desde los intentos los contadores de [start, end) (se redondea a
+    horas) y reemplaza los documentos del rango. Devuelve {dimensión: documentos}.
+    """
+    start, end = hour_of(start), hour_of(end)
+    out = {}
+    for dimension in dimensions:
+        keys = {"key": f"attempt.{dimension}", "minute": "%Y-%m-%dT%H:%M", "allowed": "validation.allowed"}
+        match = {f"attempt.{dimension}": {"$nin": [None, ""]}}
+        docs = {}
+        for (key, minute, allowed), count in partitions.count_by(keys, start, end, match, profile="attempts").items():
+            ts = datetime.strptime(minute, "%Y-%m-%dT%H:%M").replace(tzinfo=dt_timezone.utc)
+            hour = ts.replace(minute=0)
+            _id = bucket_id(dimension, key, hour)
+            doc = docs.get(_id)
+            if doc is None:
+                doc = docs[_id] = {
+                    "_id": _id, "dimension": dimension, "key": key, "hour": hour,
+                    "total": 0, "allowed": 0, "denied": 0, "minutes": {},
+                }
+            doc["total"] += count
+            doc["allowed" if allowed else "denied"] += count
+            doc["minutes"][str(ts.minute)] = doc["minutes"].get(str(ts.minute), 0) + count
+        # escritura confirmada: se borra y se vuelve a insertar el rango
+        col = _col("default")
+        col.delete_many({"dimension": dimension, "hour": {"$gte": start, "$lt": end}})
+        if docs:
+            col.insert_many(list(docs.values()), ordered=False)
+        out[dimension] = len(docs)
+    return out
@@ -39,3 +39,75 @@ urlpatterns += [
 ]
 
 
+
+# alertas del detector de ráfagas de denegaciones
+from .views_analytics import api_access_alerts
+
+urlpatterns += [
+    path("api/alerts/", api_access_alerts, name="api_access_alerts"),
+]
+
+
+
+# analíticas por subárbol de unidades
+from .views_analytics import analytics_attempts_by_unit_subtree
+
+urlpatterns += [
+    path("api/analytics/unit_subtree/", analytics_attempts_by_unit_subtree, name="api_attempts_by_unit_subtree"),
+]
+
+
+
+# estadísticas del pool de MongoDB
+from .views_analytics import api_mongo_pool_stats
+
+urlpatterns += [
+    path("api/mongo/pool/", api_mongo_pool_stats, name="api_mongo_pool_stats"),
+]
+
+
+
+# comandos de MongoDB por operación y log de operaciones lentas (solo staff)
+from .views_analytics import slow_ops_admin
+
+urlpatterns += [
+    path("admin/slow-ops/", slow_ops_admin, name="slow_ops_admin"),
+]
+
+
+# perfiles por petición capturados por ProfilingMiddleware (solo staff)
+from .profiling import profile_detail, profiles_index
+
+urlpatterns += [
+    path("admin/profiles/", profiles_index, name="profiles"),
+    path("admin/profiles/<str:capture_id>/", profile_detail, name="profile_detail"),
+]
+
+
+
+# ingesta por lotes (NDJSON) para los controladores de los gates
+from .views_ingest import api_ingest_attempts
+
+urlpatterns += [
+    path("api/ingest/attempts/", api_ingest_attempts, name="api_ingest_attempts"),
+]
+
+
+
+# throughput por gate y lector (contadores por minuto, historial/throughput.py)
+from .views_analytics import analytics_gate_heatmap, analytics_gate_peaks, analytics_gate_throughput
+
+urlpatterns += [
+    path("api/analytics/throughput/", analytics_gate_throughput, name="api_gate_throughput"),
+    path("api/analytics/throughput/peaks/", analytics_gate_peaks, name="api_gate_peaks"),
+    path("api/analytics/throughput/heatmap/", analytics_gate_heatmap, name="api_gate_heatmap"),
+]
+
+
+
+# circuit breaker del WS y decisiones locales (historial/breaker.py, historial/fallback.py)
+from .views_analytics import api_ws_breaker_status
+
+urlpatterns += [
+    path("api/ws/breaker/", api_ws_breaker_status, name="api_ws_breaker_status"),
+]
@@ -10,7 +10,15 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
-from .services import fetch_zones, query_access_info, save_access_attempt
+from .services import (
+    DIRECTION_ENTRY,
+    DIRECTION_EXIT,
+    deny_zone_full,
+    fetch_zones,
+    query_access_info,
+    record_occupancy,
+    save_access_attempt,
+)
 
 """ def registrar_evento(request):
     eventos = list(eventos_col.find())
@@ -73,6 +81,7 @@ def registrar_acceso(request):
         zone_code = request.POST.get("zone_code")
         gate_id = request.POST.get("gate_id", "GATE-1").strip()
         device = request.POST.get("device", "web-ui").strip()
+        direction = DIRECTION_EXIT if request.POST.get("direction") == DIRECTION_EXIT else DIRECTION_ENTRY
         ip = _get_client_ip(request)
         processed_by = request.user.username if request.user.is_authenticated else "web-ui"
 
@@ -92,9 +101,9 @@ def registrar_acceso(request):
         # llamar al WS
         try:
             if id_type == "service":
-                access_info = query_access_info(service_number=id_value, zone_code=zone_code)
+                access_info = query_access_info(service_number=id_value, zone_code=zone_code, direction=direction)
             else:
-                access_info = query_access_info(badge_id=id_value, zone_code=zone_code)
+                access_info = query_access_info(badge_id=id_value, zone_code=zone_code, direction=direction)
         except Exception as exc:
             messages.error(request, f"Error comunicándose con el servicio de autenticación: {str(exc)}")
             return redirect(reverse("historial:registrar_acceso"))
@@ -104,6 +113,17 @@ def registrar_acceso(request):
             messages.error(request, "No se encontró al militar en el servicio de autenticación.")
             return redirect(reverse("historial:registrar_acceso"))
 
+        # ocupación: una entrada permitida reserva lugar (puede perder la carrera
+        # por el último lugar); una salida permitida lo libera. Un escaneo denegado
+        # no movió a nadie, así que no toca el contador
+        scan_allowed = access_info.get("validation", {}).get("allowed")
+        if scan_allowed and direction == DIRECTION_EXIT:
+            record_occupancy(DIRECTION_EXIT, zone_code)
+        elif scan_allowed:
+            occupancy_info = record_occupancy(DIRECTION_ENTRY, zone_code)
+            if occupancy_info and occupancy_info.get("reason") == "zone_full":
+                deny_zone_full(access_info, occupancy_info)
+
         # access_info contiene la evaluación (validation) — guardamos intento
         attempt_meta = {
             "timestamp": timezone.now(),
@@ -111,10 +131,15 @@ def registrar_acceso(request):
             "device": device,
             "ip": ip,
             "processed_by": processed_by,
+            "direction": direction,
         }
 
         inserted = save_access_attempt(access_info, attempt_meta)
 
+        # decisión local (historial/fallback.py): el guardia debe saber que el WS no respondió
+        if access_info.get("fallback"):
+            messages.info(request, f"Servicio de autenticación no disponible: decisión local con la política v{access_info['fallback']['policy_version']}.")
+
         # Mensaje según validación
         validation = access_info.get("validation", {})
         allowed = validation.get("allowed", False)
@@ -1,11 +1,21 @@
 # historial/views_analytics.py
-from django.http import JsonResponse
+from django.conf import settings
 from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
 from datetime import timedelta, datetime
 from bson import ObjectId
+from requests.exceptions import RequestException
 
-from .mongo import access_attempts_col
+from .jsoncodec import FastJsonResponse
+from . import coldstore
+from . import partitions
+from . import throughput
+from .breaker import ws_breaker
+from .fallback import policy_mirror
+from .mongo import access_alerts_col, pool_stats
+from .services import fetch_unit_subtree
+from .slowops import MONGO_SLOW_OP_MS, listener as slow_op_listener, operation, tail_slow_log
 
 # Helper: parse days param
 def _get_start_date(request, default_days=30):
@@ -20,54 +30,34 @@ def _get_start_date(request, default_days=30):
     return start
 
 # 1) Intentos por zona (barras)
+@operation("analytics_attempts_by_zone")
 def analytics_attempts_by_zone(request):
     start = _get_start_date(request)
-    pipeline = [
-        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
-        {"$match": {"ts": {"$gte": start}}},
-        {"$group": {"_id": "$zone.code", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    res = list(access_attempts_col.aggregate(pipeline))
-    labels = [r["_id"] or "SIN_ZONA" for r in res]
-    data = [r["count"] for r in res]
-    return JsonResponse({"labels": labels, "datasets": [{"label": "Intentos", "data": data}]}, safe=False)
+    res = sorted(partitions.count_by({"zone": "zone.code"}, start).items(), key=lambda r: -r[1])
+    labels = [zone or "SIN_ZONA" for (zone,), _ in res]
+    data = [count for _, count in res]
+    return FastJsonResponse({"labels": labels, "datasets": [{"label": "Intentos", "data": data}]}, safe=False)
 
 # 2) Permitidos vs Denegados (pie)
+@operation("analytics_allowed_vs_denied")
 def analytics_allowed_vs_denied(request):
     start = _get_start_date(request)
-    pipeline = [
-        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
-        {"$match": {"ts": {"$gte": start}}},
-        {"$group": {"_id": "$validation.allowed", "count": {"$sum": 1}}},
-        {"$sort": {"_id": -1}}
-    ]
-    res = list(access_attempts_col.aggregate(pipeline))
+    res = partitions.count_by({"allowed": "validation.allowed"}, start)
     # map True->Permitidos, False->Denegados
-    mapping = {True: 0, False: 0, None: 0}
-    for r in res:
-        key = r["_id"]
-        mapping[key] = r["count"]
     labels = ["Permitidos", "Denegados"]
-    data = [mapping.get(True, 0), mapping.get(False, 0)]
-    return JsonResponse({"labels": labels, "datasets": [{"data": data}]}, safe=False)
+    data = [res[(True,)], res[(False,)]]
+    return FastJsonResponse({"labels": labels, "datasets": [{"data": data}]}, safe=False)
 
 # 3) Serie temporal: intentos por día (línea)
+@operation("analytics_attempts_over_time")
 def analytics_attempts_over_time(request):
     start = _get_start_date(request)
-    pipeline = [
-        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
-        {"$match": {"ts": {"$gte": start}}},
-        {"$project": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$ts"}}}},
-        {"$group": {"_id": "$day", "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    res = list(access_attempts_col.aggregate(pipeline))
+    res = partitions.count_by({"day": "%Y-%m-%d"}, start)
     # Fill missing dates between start..today with 0s (to keep chart continuous)
     labels = []
     data = []
     # build dictionary from res
-    dmap = {r["_id"]: r["count"] for r in res}
+    dmap = {day: count for (day,), count in res.items()}
     start_date = start.date()
     end_date = datetime.utcnow().date()
     cur = start_date
@@ -76,58 +66,41 @@ def analytics_attempts_over_time(request):
         labels.append(key)
         data.append(dmap.get(key, 0))
         cur = cur + timedelta(days=1)
-    return JsonResponse({"labels": labels, "datasets": [{"label": "Intentos/día", "data": data}]}, safe=False)
+    return FastJsonResponse({"labels": labels, "datasets": [{"label": "Intentos/día", "data": data}]}, safe=False)
 
 # 4) Top offenders (personnel con más intentos) - barras horizontales
+@operation("analytics_top_offenders")
 def analytics_top_offenders(request):
     start = _get_start_date(request)
     try:
         limit = int(request.GET.get("limit", 10))
     except Exception:
         limit = 10
-    pipeline = [
-        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
-        {"$match": {"ts": {"$gte": start}}},
-        {"$group": {"_id": "$personnel_full.service_number", "count": {"$sum": 1}, "name": {"$first": "$personnel_full.first_name"}, "last": {"$first": "$personnel_full.last_name"}}},
-        {"$sort": {"count": -1}},
-        {"$limit": limit}
-    ]
-    res = list(access_attempts_col.aggregate(pipeline))
+    keys = {"service_number": "personnel_full.service_number", "name": "personnel_full.first_name",
+            "last": "personnel_full.last_name"}
+    # un grupo por número de servicio; el nombre es el primero que aparece
+    offenders = {}
+    for (service_number, name, last), count in partitions.count_by(keys, start).items():
+        r = offenders.setdefault(service_number, {"_id": service_number, "count": 0, "name": name, "last": last})
+        r["count"] += count
+    res = sorted(offenders.values(), key=lambda r: -r["count"])[:limit]
     labels = [ (r["_id"] or "UNK") + (f" — {r.get('name') or ''} {r.get('last') or ''}".strip()) for r in res ]
     data = [r["count"] for r in res]
-    return JsonResponse({"labels": labels, "datasets": [{"label": "Intentos", "data": data}]}, safe=False)
+    return FastJsonResponse({"labels": labels, "datasets": [{"label": "Intentos", "data": data}]}, safe=False)
 
 # 5) Tasa de permitidos por rango (doughnut)
+@operation("analytics_allowed_rate_by_rank")
 def analytics_allowed_rate_by_rank(request):
     start = _get_start_date(request)
-    pipeline = [
-        {"$addFields": {"ts": {"$toDate": "$attempt.timestamp"}}},
-        {"$match": {"ts": {"$gte": start}}},
-        {"$group": {"_id": {"rank": "$personnel_full.rank.code", "allowed": "$validation.allowed"}, "count": {"$sum": 1}}},
-        {"$group": {"_id": "$_id.rank", "byAllowed": {"$push": {"k": {"$cond": ["$_id.allowed", "allowed", "denied"]}, "v": "$count"}}}},
-        {"$project": {
-            "allowed": {
-                "$reduce": {
-                    "input": "$byAllowed",
-                    "initialValue": 0,
-                    "in": { "$cond": [ { "$eq": ["$$this.k", "allowed"] }, "$$this.v", "$$value" ] }
-                }
-            },
-            "denied": {
-                "$reduce": {
-                    "input": "$byAllowed",
-                    "initialValue": 0,
-                    "in": { "$cond": [ { "$eq": ["$$this.k", "denied"] }, "$$this.v", "$$value" ] }
-                }
-            }
-        }},
-        {"$sort": {"allowed": -1, "denied": -1}}
-    ]
-    res = list(access_attempts_col.aggregate(pipeline))
+    by_rank = {}
+    for (rank, allowed), count in partitions.count_by({"rank": "personnel_full.rank.code", "allowed": "validation.allowed"}, start).items():
+        r = by_rank.setdefault(rank, {"_id": rank, "allowed": 0, "denied": 0})
+        r["allowed" if allowed else "denied"] += count
+    res = sorted(by_rank.values(), key=lambda r: (-r["allowed"], -r["denied"]))
     labels = [r["_id"] or "SIN_RANGO" for r in res]
     # For doughnut we can show allowed counts or allowed percentage; here we send allowed counts
     data = [r.get("allowed", 0) for r in res]
-    return JsonResponse({"labels": labels, "datasets": [{"label": "Permitidos (por rango)", "data": data}]}, safe=False)
+    return FastJsonResponse({"labels": labels, "datasets": [{"label": "Permitidos (por rango)", "data": data}]}, safe=False)
 
 # Dashboard view (render template with canvases)
 def analytics_dashboard(request):
@@ -137,31 +110,259 @@ def analytics_dashboard(request):
 
 
 # a continuacion se definen funciones para mapeos de codigos con nombres o descripciones
+def _with_cold_summary(res, key):
+    """Resultado del $group por código más los códigos del archivo frío (coldstore.summary), ordenado."""
+    names = {r["_id"]: r.get("name") for r in res if r["_id"]}
+    for code, name in coldstore.summary(key).items():
+        if names.get(code) is None:
+            names[code] = name
+    return [{"code": code, "name": names[code]} for code in sorted(names)]
+
+
+@operation("api_distinct_zones_from_mongo")
 def api_distinct_zones_from_mongo(request):
     """
     Devuelve lista de zonas únicas encontradas en access_attempts:
     [ { "code": "CZ-01", "name": "Centro de Control" }, ... ]
+    Los meses archivados aportan las suyas desde el resumen de sus índices.
     """
     pipeline = [
         {"$match": {"zone.code": {"$exists": True}}},
         {"$group": {"_id": "$zone.code", "name": {"$first": "$zone.name"}}},
         {"$sort": {"_id": 1}}
     ]
-    res = list(access_attempts_col.aggregate(pipeline))
-    out = [{"code": r["_id"], "name": r.get("name")} for r in res if r["_id"]]
-    return JsonResponse(out, safe=False)
+    res = list(partitions.aggregate(pipeline))
+    return FastJsonResponse(_with_cold_summary(res, "zones"), safe=False)
 
 
+@operation("api_distinct_ranks_from_mongo")
 def api_distinct_ranks_from_mongo(request):
     """
     Devuelve lista de rangos únicos (code + name) presentes en access_attempts:
     [ { "code": "CPT", "name": "Capitán" }, ... ]
+    Los meses archivados aportan los suyos desde el resumen de sus índices.
     """
     pipeline = [
         {"$match": {"personnel_full.rank.code": {"$exists": True}}},
         {"$group": {"_id": "$personnel_full.rank.code", "name": {"$first": "$personnel_full.rank.name"}}},
         {"$sort": {"_id": 1}}
     ]
-    res = list(access_attempts_col.aggregate(pipeline))
-    out = [{"code": r["_id"], "name": r.get("name")} for r in res if r["_id"]]
-    return JsonResponse(out, safe=False)
\ No newline at end of file
+    res = list(partitions.aggregate(pipeline))
+    return FastJsonResponse(_with_cold_summary(res, "ranks"), safe=False)
+
+
+# Alertas del detector de ráfagas de denegaciones (más recientes primero)
+ALERTS_MAX_LIMIT = getattr(settings, "ALERTS_MAX_LIMIT", 500)
+
+
+@operation("api_access_alerts")
+def api_access_alerts(request):
+    """
+    GET /historial/api/alerts/?days=1&limit=50&dimension=gate_id
+    """
+    start = _get_start_date(request, default_days=1)
+    try:
+        limit = int(request.GET.get("limit", 50))
+    except Exception:
+        limit = 50
+    # limit(0) o negativo en MongoDB no acota la consulta
+    if limit < 1:
+        limit = 50
+    limit = min(limit, ALERTS_MAX_LIMIT)
+    query = {"triggered_at": {"$gte": start}}
+    dimension = request.GET.get("dimension")
+    if dimension:
+        query["dimension"] = dimension
+    res = access_alerts_col.find(query).sort("triggered_at", -1).limit(limit)
+    out = []
+    for r in res:
+        out.append({
+            "id": str(r["_id"]),
+            "dimension": r.get("dimension"),
+            "key": r.get("key"),
+            "count": r.get("count"),
+            "threshold": r.get("threshold"),
+            "window_seconds": r.get("window_seconds"),
+            "zone_code": r.get("zone_code"),
+            "reason": r.get("reason"),
+            "attempt_id": str(r["attempt_id"]) if r.get("attempt_id") else None,
+            "triggered_at": r["triggered_at"].isoformat() if r.get("triggered_at") else None,
+        })
+    return FastJsonResponse(out, safe=False)
+
+
+# Intentos por subárbol de unidades (la unidad y todo lo que cuelga de ella)
+@operation("analytics_attempts_by_unit_subtree")
+def analytics_attempts_by_unit_subtree(request):
+    """
+    GET /historial/api/analytics/unit_subtree/?unit=1DIV&days=30
+    El WS resuelve el subárbol con la tabla de clausura (una consulta); aquí
+    se filtra por personnel_full.unit.id con $in antes de calcular ts.
+    """
+    unit_code = request.GET.get("unit")
+    if not unit_code:
+        return FastJsonResponse({"detail": "unit requerido"}, status=400)
+    try:
+        units = fetch_unit_subtree(unit_code)
+    except RequestException:
+        return FastJsonResponse({"detail": "servicio de unidades no disponible"}, status=502)
+    if units is None:
+        return FastJsonResponse({"detail": "unidad no encontrada"}, status=404)
+
+    start = _get_start_date(request)
+    match = {"personnel_full.unit.id": {"$in": [u["id"] for u in units]}}
+    counts = {}
+    for (unit, allowed), count in partitions.count_by({"unit": "personnel_full.unit.id", "allowed": "validation.allowed"},
+                                                      start, match=match).items():
+        key = "allowed" if allowed else "denied"
+        counts.setdefault(unit, {"allowed": 0, "denied": 0})[key] += count
+
+    # orden del subárbol (profundidad, código); solo unidades con intentos
+    rows = [(u, counts[u["id"]]) for u in units if u["id"] in counts]
+    allowed = sum(c["allowed"] for _, c in rows)
+    denied = sum(c["denied"] for _, c in rows)
+    return FastJsonResponse({
+        "unit": unit_code,
+        "units_in_subtree": len(units),
+        "totals": {"allowed": allowed, "denied": denied, "total": allowed + denied},
+        "labels": [u["code"] for u, _ in rows],
+        "datasets": [
+            {"label": "Permitidos", "data": [c["allowed"] for _, c in rows]},
+            {"label": "Denegados", "data": [c["denied"] for _, c in rows]},
+        ],
+    }, safe=False)
+
+
+# Estadísticas del pool de MongoDB de este worker (historial/mongo.py)
+def api_mongo_pool_stats(request):
+    """
+    GET /historial/api/mongo/pool/
+    Por servidor: conexiones abiertas y en uso, creadas/cerradas, checkouts,
+    espera media y máxima para obtener conexión y veces que se limpió el pool.
+    """
+    return FastJsonResponse(pool_stats())
+
+
+# Estado del circuit breaker del WS y del bundle de decisiones locales de este worker
+def api_ws_breaker_status(request):
+    """
+    GET /historial/api/ws/breaker/
+    Estado (closed/open/half_open), últimas llamadas, tasas de fallidas y
+    lentas, y la versión de política con la que se decidiría sin el WS.
+    """
+    policy = policy_mirror.current()
+    return FastJsonResponse({
+        "breaker": ws_breaker.stats(),
+        "fallback": {
+            "available": policy is not None,
+            "policy_version": policy.version if policy is not None else None,
+            "synced_at": policy_mirror.synced_at,
+        },
+    })
+
+
+# Comandos de MongoDB por operación y últimos comandos lentos (historial/slowops.py)
+@staff_member_required
+def slow_ops_admin(request):
+    """
+    GET /historial/admin/slow-ops/
+    Los contadores son de este worker; los comandos lentos se leen del log
+    rotativo (todos los workers) si está configurado.
+    """
+    return render(request, "slow_ops.html", {
+        "threshold_ms": MONGO_SLOW_OP_MS,
+        "stats": slow_op_listener.stats(),
+        "slow_ops": tail_slow_log() or list(reversed(slow_op_listener.recent_slow)),
+    })
+
+
+
+# Throughput por gate y por lector (contadores de historial/throughput.py, no los intentos)
+# ventana máxima a resolución de minuto (1440 puntos por día y clave)
+THROUGHPUT_MINUTE_MAX_HOURS = getattr(settings, "THROUGHPUT_MINUTE_MAX_HOURS", 48)
+
+
+def _get_dimension(request):
+    dimension = request.GET.get("dimension", "gate_id")
+    return dimension if dimension in throughput.THROUGHPUT_DIMENSIONS else None
+
+
+def _get_int(request, name, default):
+    try:
+        value = int(request.GET.get(name, default))
+    except Exception:
+        return default
+    return value if value >= 1 else default
+
+
+@operation("analytics_gate_throughput")
+def analytics_gate_throughput(request):
+    """
+    GET /historial/api/analytics/throughput/?dimension=gate_id&resolution=hour&days=7&limit=10
+    GET /historial/api/analytics/throughput/?dimension=device&resolution=minute&hours=6&key=lector-2
+    Una serie por gate (o lector), las `limit` con más intentos.
+    """
+    dimension = _get_dimension(request)
+    if dimension is None:
+        return FastJsonResponse({"detail": "dimension debe ser gate_id o device"}, status=400)
+    resolution = request.GET.get("resolution", "hour")
+    end = timezone.now()
+    if resolution == "minute":
+        hours = min(_get_int(request, "hours", 6), THROUGHPUT_MINUTE_MAX_HOURS)
+        start = end - timedelta(hours=hours)
+    elif resolution == "hour":
+        start = end - timedelta(days=_get_int(request, "days", 7))
+    else:
+        return FastJsonResponse({"detail": "resolution debe ser minute u hour"}, status=400)
+    labels, rows = throughput.series(dimension, start, end, resolution,
+                                     key=request.GET.get("key"), limit=_get_int(request, "limit", 10))
+    return FastJsonResponse({
+        "dimension": dimension,
+        "resolution": resolution,
+        "labels": labels,
+        "datasets": [{"label": key, "data": data} for key, data in rows],
+    }, safe=False)
+
+
+@operation("analytics_gate_peaks")
+def analytics_gate_peaks(request):
+    """
+    GET /historial/api/analytics/throughput/peaks/?dimension=gate_id&days=7&limit=20
+    Minuto y hora pico por gate (o lector), ordenado por el minuto pico.
+    """
+    dimension = _get_dimension(request)
+    if dimension is None:
+        return FastJsonResponse({"detail": "dimension debe ser gate_id o device"}, status=400)
+    end = timezone.now()
+    rows = throughput.peaks(dimension, end - timedelta(days=_get_int(request, "days", 7)), end,
+                            limit=_get_int(request, "limit", 20))
+    return FastJsonResponse({
+        "dimension": dimension,
+        "rows": rows,
+        "labels": [r["key"] for r in rows],
+        "datasets": [
+            {"label": "Minuto pico", "data": [r["peak_minute"]["count"] for r in rows]},
+            {"label": "Promedio por minuto activo", "data": [r["avg_per_active_minute"] for r in rows]},
+        ],
+    }, safe=False)
+
+
+@operation("analytics_gate_heatmap")
+def analytics_gate_heatmap(request):
+    """
+    GET /historial/api/analytics/throughput/heatmap/?dimension=gate_id&days=28[&key=G1]
+    Promedio de intentos por día de la semana (lunes primero) y hora local.
+    """
+    dimension = _get_dimension(request)
+    if dimension is None:
+        return FastJsonResponse({"detail": "dimension debe ser gate_id o device"}, status=400)
+    end = timezone.now()
+    data = throughput.heatmap(dimension, end - timedelta(days=_get_int(request, "days", 28)), end,
+                              key=request.GET.get("key"))
+    return FastJsonResponse({
+        "dimension": dimension,
+        "key": request.GET.get("key"),
+        "days": ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"],
+        "hours": list(range(24)),
+        **data,
+    }, safe=False)
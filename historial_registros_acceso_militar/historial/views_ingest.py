@@ -0,0 +1,265 @@
+# historial/views_ingest.py
+"""
+API de ingesta por lotes para los controladores de los gates.
+
+POST /historial/api/ingest/attempts/ con un cuerpo NDJSON, un escaneo por línea:
+
+  {"key": "G1-000123", "service_number": "SN-20245", "zone_code": "CZ-01",
+   "timestamp": "2024-05-02T08:15:00Z", "gate_id": "G1", "device": "lector-2",
+   "direction": "entry"}
+
+(badge_id en lugar de service_number; direction "exit" para salidas.)
+timestamp es obligatorio: string ISO 8601 (sin zona = UTC) o número de
+segundos desde la época Unix. Sin él la misma clave podría caer en meses
+distintos al reenviarse y saltarse el índice único.
+
+Requiere "Authorization: Bearer <INGEST_TOKEN>"; sin INGEST_TOKEN configurado
+la API está desactivada (403).
+
+`key` la genera el controlador y es única por escaneo: cada partición tiene un
+índice único sobre idempotency_key, así que reenviar un lote (timeout, caída
+de red) no duplica intentos. Las claves ya guardadas se detectan antes de
+llamar al WS.
+
+Las decisiones se piden al WS en bloque (/ws/access-info/bulk/) y los
+intentos se guardan con un insert_many sin orden por partición. Recién
+después se informan al WS (/ws/occupancy/bulk/) las entradas y salidas
+permitidas de los intentos que se insertaron: un reintento no vuelve a mover
+la ocupación. Una entrada que ya no encuentra lugar se guarda como denegada
+(zone_full). La respuesta trae un resultado por línea, en orden:
+  created    guardado (id, allowed, reason)
+  duplicate  la clave ya estaba guardada (o repetida en el lote)
+  not_found  el WS no conoce a la persona o la zona; no se guarda
+  invalid    línea mal formada; no se guarda
+  error      falló la escritura en MongoDB; se puede reintentar
+Si el WS no responde, el lote entero vuelve 502 y no se guarda nada.
+"""
+import hmac
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from pymongo.errors import BulkWriteError
+from requests.exceptions import RequestException
+
+from . import partitions
+from . import throughput
+from .detector import observe_attempt
+from .jsoncodec import FastJsonResponse, loads
+from .mongo import collection
+from .services import (
+    DIRECTION_ENTRY,
+    DIRECTION_EXIT,
+    build_attempt_doc,
+    deny_zone_full,
+    query_access_info_bulk,
+    record_occupancy_bulk,
+)
+from .slowops import operation
+from .views import _get_client_ip
+
+# máximo de líneas por lote
+INGEST_MAX_ITEMS = getattr(settings, "INGEST_MAX_ITEMS", 1000)
+# los controladores deben mandar "Authorization: Bearer <token>"; sin token la API no acepta lotes
+INGEST_TOKEN = getattr(settings, "INGEST_TOKEN", None)
+INGEST_MAX_KEY_LENGTH = 200
+
+DUPLICATE_KEY = 11000
+
+
+def _authorized(request):
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if not header.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(header[7:].encode(), INGEST_TOKEN.encode())
+
+
+def _timestamp(value):
+    """datetime UTC de un string ISO 8601 o de segundos Unix; ValueError si no es ninguno."""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError) as exc:
+            raise ValueError(value) from exc
+    if isinstance(value, str) and value:
+        return partitions.as_utc(value)
+    raise ValueError(value)
+
+
+def _parse_line(line):
+    """(escaneo normalizado, None) o (None, error)."""
+    try:
+        item = loads(line)
+    except ValueError:
+        return None, "invalid_json"
+    if not isinstance(item, dict):
+        return None, "invalid_json"
+    key = item.get("key")
+    if not isinstance(key, str) or not key or len(key) > INGEST_MAX_KEY_LENGTH:
+        return None, "key_required"
+    if not item.get("zone_code") or not (item.get("service_number") or item.get("badge_id")):
+        return None, "zone_code and (service_number or badge_id) required"
+    direction = item.get("direction") or DIRECTION_ENTRY
+    if direction not in (DIRECTION_ENTRY, DIRECTION_EXIT):
+        return None, "invalid_direction"
+    if item.get("timestamp") is None:
+        return None, "timestamp_required"
+    try:
+        ts = _timestamp(item["timestamp"])
+    except ValueError:
+        return None, "invalid_timestamp"
+    return {
+        "key": key,
+        "service_number": item.get("service_number"),
+        "badge_id": item.get("badge_id"),
+        "zone_code": item["zone_code"],
+        "direction": direction,
+        "timestamp": ts,
+        "gate_id": item.get("gate_id"),
+        "device": item.get("device"),
+    }, None
+
+
+def _stored_keys(scans):
+    """{clave: _id} de las claves del lote que ya están guardadas (una consulta por mes)."""
+    by_partition = {}
+    for scan in scans:
+        by_partition.setdefault(partitions.partition_name(scan["timestamp"]), []).append(scan["key"])
+    stored = {}
+    for name, keys in by_partition.items():
+        for doc in collection(name, "attempts").find({"idempotency_key": {"$in": keys}}, {"idempotency_key": 1}):
+            stored[doc["idempotency_key"]] = doc["_id"]
+    return stored
+
+
+def _insert(docs, positions, results):
+    """
+    insert_many sin orden; las claves que chocan (reintento concurrente)
+    quedan como duplicate. Devuelve [(doc, posición)] de los insertados.
+    """
+    failed = {}
+    try:
+        partitions.collection_for(docs[0]["attempt"]["timestamp"]).insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        for err in exc.details.get("writeErrors", []):
+            failed[err["index"]] = "duplicate" if err.get("code") == DUPLICATE_KEY else "error"
+    created = []
+    for i, (doc, pos) in enumerate(zip(docs, positions)):
+        outcome = failed.get(i)
+        if outcome is None:
+            created.append((doc, pos))
+            results[pos].update(status="created", id=str(doc["_id"]))
+        else:
+            results[pos]["status"] = outcome
+    return created
+
+
+def _record_occupancy(created):
+    """
+    Ocupación de los intentos permitidos recién insertados (una llamada al WS).
+    Una entrada que perdió el último lugar se guarda como denegada (zone_full).
+    """
+    allowed = [(doc, pos) for doc, pos in created if (doc.get("validation") or {}).get("allowed")]
+    if not allowed:
+        return
+    outcomes = record_occupancy_bulk([
+        {"zone_code": (doc.get("zone") or {}).get("code"), "direction": doc["attempt"]["direction"]}
+        for doc, _ in allowed
+    ])
+    for (doc, _), info in zip(allowed, outcomes or []):
+        if info.get("reason") == "zone_full":
+            deny_zone_full(doc, info)
+            partitions.collection_for(doc["attempt"]["timestamp"]).update_one(
+                {"_id": doc["_id"]}, {"$set": {"validation": doc["validation"]}})
+
+
+@csrf_exempt
+@require_POST
+@operation("ingest_attempts")
+def api_ingest_attempts(request):
+    if not INGEST_TOKEN:
+        return FastJsonResponse({"detail": "ingest API disabled: INGEST_TOKEN not configured"}, status=403)
+    if not _authorized(request):
+        return FastJsonResponse({"detail": "invalid token"}, status=401)
+    lines = [line for line in request.body.splitlines() if line.strip()]
+    if len(lines) > INGEST_MAX_ITEMS:
+        return FastJsonResponse({"detail": f"at most {INGEST_MAX_ITEMS} lines per request"}, status=413)
+
+    results = []
+    scans = []      # escaneos válidos (con su posición en results)
+    seen = set()
+    for line in lines:
+        scan, error = _parse_line(line)
+        result = {"line": len(results) + 1}
+        results.append(result)
+        if error:
+            result.update(status="invalid", error=error)
+            continue
+        result["key"] = scan["key"]
+        if scan["key"] in seen:
+            result["status"] = "duplicate"
+            continue
+        seen.add(scan["key"])
+        scan["pos"] = result["line"] - 1
+        scans.append(scan)
+
+    stored = _stored_keys(scans)
+    pending = []
+    for scan in scans:
+        if scan["key"] in stored:
+            results[scan["pos"]].update(status="duplicate", id=str(stored[scan["key"]]))
+        else:
+            pending.append(scan)
+
+    try:
+        decisions = query_access_info_bulk([
+            {"service_number": s["service_number"], "badge_id": s["badge_id"],
+             "zone_code": s["zone_code"], "direction": s["direction"]}
+            for s in pending
+        ]) if pending else []
+    except (RequestException, ValueError, KeyError) as exc:
+        return FastJsonResponse({"detail": f"access service unavailable: {exc}"}, status=502)
+
+    ip = _get_client_ip(request)
+    by_partition = {}
+    for scan, decision in zip(pending, decisions):
+        result = results[scan["pos"]]
+        code = decision.get("status")
+        if code == 404:
+            result.update(status="not_found", error=decision["data"].get("detail"))
+            continue
+        if code not in (200, 403):
+            result.update(status="invalid", error=decision["data"].get("detail"))
+            continue
+        doc = build_attempt_doc(decision["data"], {
+            "timestamp": scan["timestamp"],
+            "gate_id": scan["gate_id"],
+            "device": scan["device"],
+            "ip": ip,
+            "processed_by": "ingest-api",
+            "direction": scan["direction"],
+            "idempotency_key": scan["key"],
+        })
+        docs, positions = by_partition.setdefault(partitions.partition_name(scan["timestamp"]), ([], []))
+        docs.append(doc)
+        positions.append(scan["pos"])
+
+    created = []
+    for docs, positions in by_partition.values():
+        created.extend(_insert(docs, positions, results))
+    _record_occupancy(created)
+    for doc, pos in created:
+        validation = doc.get("validation") or {}
+        results[pos].update(allowed=validation.get("allowed"), reason=validation.get("reason"))
+        observe_attempt(doc)
+    # un bulk_write de contadores por lote (historial/throughput.py)
+    throughput.record([doc for doc, _ in created])
+    return FastJsonResponse({
+        "received": len(lines),
+        "created": len(created),
+        "duplicates": sum(r.get("status") == "duplicate" for r in results),
+        "results": results,
+    })
@@ -0,0 +1,17 @@
+# historial/wsauth.py
+"""
+Cabecera de autenticación de este servicio ante el WS.
+
+El bundle/delta de políticas y /ws/occupancy/ exigen un token de servicio
+(ws/permissions.py); WS_SERVICE_TOKEN es el de historial.
+"""
+from django.conf import settings
+
+WS_SERVICE_TOKEN = getattr(settings, "WS_SERVICE_TOKEN", None)
+
+
+def ws_headers():
+    """{"Authorization": "Bearer <token>"} o {} si no hay token configurado."""
+    if not WS_SERVICE_TOKEN:
+        return {}
+    return {"Authorization": f"Bearer {WS_SERVICE_TOKEN}"}
@@ -43,11 +43,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'historial.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'historial.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -134,10 +136,148 @@ STATIC_URL = '/static/'
 # settings.py (WA project)
 MONGO_URI = "mongodb://localhost:27017"
 MONGO_DBNAME = "historial_registros_acceso_militar"
+# pool y timeouts del MongoClient (historial/mongo.py); se ajustan aquí sin tocar código
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": 100,
+    "minPoolSize": 0,
+    "maxIdleTimeMS": 300000,
+    "waitQueueTimeoutMS": 2000,
+    "connectTimeoutMS": 5000,
+    "socketTimeoutMS": 10000,
+    "serverSelectionTimeoutMS": 5000,
+}
+# write concern / read preference por uso: attempts (w=majority), alerts (w=1),
+# rollups (w=0, fire-and-forget), analytics (lecturas en secundarios)
+MONGO_PROFILES = {
+    "attempts": {"w": "majority", "wtimeout": 5000},
+    "alerts": {"w": 1},
+    "rollups": {"w": 0},
+    "analytics": {"read_preference": "SECONDARY_PREFERRED"},
+}
 
 # URL del servicio que expone las zonas (app MySQL)
 ZONES_SERVICE_URL = "http://127.0.0.1:8000/ws/zones/"   # o /ws/api/zones/ según la config
 ACCESS_INFO_URL = "http://127.0.0.1:8000/ws/access-info/"
 
 # cache (opcional): si no configuras cache backend, Django usará locmem cache por defecto
-ZONES_CACHE_TTL = 300
+# las zonas se invalidan por el change feed del WS; el TTL queda como respaldo
+ZONES_CACHE_TTL = 3600
+# alias de CACHES para las zonas (historial/services.py: stale-while-revalidate con un solo
+# refresco a la vez). Con varios workers de gunicorn conviene un backend compartido, p.ej.
+# CACHES = {"default": {...}, "shared": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+#                                        "LOCATION": "redis://127.0.0.1:6379/1"}}
+# y ZONES_CACHE_ALIAS = "shared"; con locmem cada worker consulta al WS por su cuenta
+ZONES_CACHE_ALIAS = "default"
+# la última lista buena se conserva sin vencimiento y se sirve si el WS no responde
+ZONES_CACHE_STALE_TTL = None
+ZONES_RETRY_SECONDS = 30
+POLICY_CHANGES_URL = "http://127.0.0.1:8000/ws/policy/changes/"
+# jerarquía de unidades (subárboles para las analíticas por unidad)
+UNITS_SERVICE_URL = "http://127.0.0.1:8000/ws/units/"
+# ocupación de zonas (entradas/salidas y reconcile_occupancy)
+OCCUPANCY_URL = "http://127.0.0.1:8000/ws/occupancy/"
+ZONES_CHANGES_POLL_SECONDS = 15
+
+# detector de ráfagas de denegaciones (ventanas en segundos)
+DENIAL_BURST_BUCKET_SECONDS = 10
+DENIAL_BURST_RULES = {
+    "service_number": {"window": 300, "threshold": 5},
+    "gate_id": {"window": 60, "threshold": 20},
+    "device": {"window": 60, "threshold": 20},
+}
+# máximo de alertas por consulta de /historial/api/alerts/
+ALERTS_MAX_LIMIT = 500
+
+# JSON rápido (historial/jsoncodec.py): orjson si está instalado, si no json de la stdlib
+JSON_CODEC = "orjson"
+
+# métricas por petición (historial/metrics.py): /metrics en formato Prometheus y cabecera
+# Server-Timing con el tiempo en SQL, MongoDB y llamadas al WS
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_SERVER_TIMING = True
+
+# comandos de MongoDB de las analíticas y save_access_attempt (historial/slowops.py):
+# los que superan MONGO_SLOW_OP_MS van a un log rotativo y a /historial/admin/slow-ops/
+MONGO_SLOW_OP_MS = 200
+MONGO_SLOW_OP_KEEP = 200
+MONGO_SLOW_OP_LOG = BASE_DIR / "logs" / "mongo_slow_ops.log"
+os.makedirs(MONGO_SLOW_OP_LOG.parent, exist_ok=True)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_ops_file": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": MONGO_SLOW_OP_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "historial.slowops": {"handlers": ["slow_ops_file"], "level": "WARNING", "propagate": False},
+    },
+}
+
+# perfiles por petición (historial/profiling.py): cabecera X-Profile / ?profile=1 (staff o
+# PROFILE_TOKEN) o 1 de cada PROFILE_SAMPLE_EVERY peticiones (0 = apagado; se cambia en
+# caliente en /historial/admin/profiles/)
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_KEEP = 200
+PROFILE_SAMPLE_EVERY = 0
+PROFILE_TOKEN = None
+# alias de CACHES del N de muestreo: con locmem (el 'default' si no se define CACHES) el cambio desde
+# la página solo llega al worker que la atendió; con varios workers usar un alias redis/memcached
+PROFILE_CACHE_ALIAS = "default"
+
+# particiones mensuales de intentos (historial/partitions.py, manage_attempt_partitions)
+ACCESS_ATTEMPTS_PARTITION_PREFIX = "access_attempts_"
+# colección única anterior: se sigue leyendo hasta migrarla con --migrate-legacy
+ACCESS_ATTEMPTS_LEGACY_COLLECTION = "access_attempts"
+ACCESS_ATTEMPTS_ARCHIVE_PREFIX = "archived_access_attempts_"
+PARTITIONS_REFRESH_SECONDS = 60
+
+# archivo frío de intentos (historial/coldstore.py, archive_attempts): segmentos comprimidos
+# con zstd si está instalado zstandard (pip install zstandard), si no con gzip
+COLD_ARCHIVE_DIR = BASE_DIR / "cold_archive"
+COLD_ARCHIVE_CODEC = "zstd"
+COLD_BLOCK_DOCS = 2000
+COLD_SEGMENT_DOCS = 200000
+
+# API de ingesta por lotes (historial/views_ingest.py): decisiones en bloque al WS
+ACCESS_INFO_BULK_URL = "http://127.0.0.1:8000/ws/access-info/bulk/"
+ACCESS_INFO_BULK_CHUNK = 500
+INGEST_MAX_ITEMS = 1000
+# los controladores mandan "Authorization: Bearer <token>"; None = API de ingesta desactivada (403)
+INGEST_TOKEN = None
+
+# contadores por minuto de gates y lectores (historial/throughput.py): $inc con el perfil
+# "rollups"; rebuild_gate_throughput los recalcula desde los intentos
+GATE_THROUGHPUT_COLLECTION = "gate_throughput"
+THROUGHPUT_MINUTE_MAX_HOURS = 48
+
+# circuit breaker de las llamadas al WS (historial/breaker.py): se abre si en las últimas
+# WS_BREAKER_WINDOW llamadas fallan o tardan más de WS_BREAKER_SLOW_MS la mitad
+# timeout de /access-info/ en segundos; None = WS_BREAKER_SLOW_MS + ACCESS_INFO_TIMEOUT_MARGIN_MS
+ACCESS_INFO_TIMEOUT = None
+ACCESS_INFO_TIMEOUT_MARGIN_MS = 100
+WS_BREAKER_WINDOW = 20
+WS_BREAKER_MIN_CALLS = 5
+WS_BREAKER_FAILURE_RATE = 0.5
+WS_BREAKER_SLOW_MS = 1000
+WS_BREAKER_SLOW_RATE = 0.5
+WS_BREAKER_OPEN_SECONDS = 10
+# decisiones locales con el bundle de políticas cuando el WS no responde (historial/fallback.py,
+# evaluador en historial/offline.py). Se guardan con processed_by="fallback"
+POLICY_FALLBACK_ENABLED = False
+POLICY_BUNDLE_URL = "http://127.0.0.1:8000/ws/policy/bundle/"
+POLICY_DELTA_URL = "http://127.0.0.1:8000/ws/policy/delta/"
+POLICY_FALLBACK_FILE = BASE_DIR / "policy_fallback.bin"
+POLICY_FALLBACK_SYNC_SECONDS = 60
+
+# token de este servicio en el WS (uno de SERVICE_TOKENS del WS): se manda como
+# "Authorization: Bearer <token>" al bundle/delta de políticas y a /ws/occupancy/
+WS_SERVICE_TOKEN = None
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from historial.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("historial/", include("historial.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -44,13 +44,17 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'ws.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ws.middleware.ChangedByMiddleware',
+    'ws.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ws.middleware.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'sistema_acceso_militar.urls'
@@ -116,3 +120,77 @@ STATIC_URL = '/static/'
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Caché de resolución de personal/zonas para AccessInfoView (ws/cache.py).
+# Con varios workers, ACCESS_CACHE_ALIAS debe apuntar a un backend compartido
+# (redis/memcached) para que la invalidación por versión llegue a todos.
+ACCESS_CACHE_ALIAS = "default"
+ACCESS_CACHE_SIZE = 10000
+ACCESS_CACHE_SHARED = False
+ACCESS_CACHE_TTL = 3600
+# badge_id que no existe en la tabla badges se busca en personnel.badge_id. Solo como
+# paso de migración (mientras se cargan los badges en la tabla): confía en códigos que
+# la tabla badges no conoce, así que un badge dado de baja ahí seguiría entrando
+BADGE_FALLBACK_TO_PERSONNEL = False
+
+# Bundles de políticas para gates offline (ws/bundle.py)
+POLICY_BUNDLE_DIR = BASE_DIR / "policy_bundles"
+POLICY_BUNDLE_KEEP = 50
+
+# ocupación de zonas (ws/occupancy.py): contadores atómicos por zona. Con varios
+# workers debe ser un alias compartido (redis/memcached); locmem solo sirve en un proceso
+OCCUPANCY_CACHE_ALIAS = "default"
+
+# AccessInfoView: render precompilado de AccessInfoSerializer (ws/fastrender.py).
+# False usa el serializer de DRF (pruebas de paridad / bench_access_info_render)
+ACCESS_INFO_FAST_RENDER = True
+
+# JSON rápido (ws/jsoncodec.py): orjson si está instalado, si no json de la stdlib
+JSON_CODEC = "orjson"
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "ws.jsoncodec.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "ws.jsoncodec.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# Réplicas de lectura (ws/routers.py). Las lecturas de AccessInfoView, ZoneListAPI,
+# export_policy_bundle y generate_access_attempts van a una réplica; el resto y las
+# escrituras a 'default'. Ejemplo de réplica:
+#   DATABASES["replica1"] = {**DATABASES["default"], "HOST": "mysql-replica-1", "TEST": {"MIRROR": "default"}}
+#   DATABASE_REPLICAS = ["replica1"]
+# Para probar en local basta con dos archivos SQLite (el de la réplica copiado del de 'default').
+# Pruebas del router: python manage.py test ws --settings=sistema_acceso_militar.settings_replica_test
+DATABASE_ROUTERS = ["ws.routers.PrimaryReplicaRouter"]
+DATABASE_REPLICAS = []
+# retraso de replicación tolerado: lo invalidado hace menos se carga de la primaria
+REPLICA_LAG_SECONDS = 5
+# tras escribir, la sesión (cookie) sigue leyendo de la primaria este tiempo
+REPLICA_PIN_SECONDS = 5
+
+# métricas por petición (ws/metrics.py): /metrics en formato Prometheus y cabecera Server-Timing
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_SERVER_TIMING = True
+
+# perfiles por petición (ws/profiling.py): cabecera X-Profile / ?profile=1 (staff o PROFILE_TOKEN)
+# o 1 de cada PROFILE_SAMPLE_EVERY peticiones (0 = apagado; se cambia en caliente en ws/admin/profiles/)
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_KEEP = 200
+PROFILE_SAMPLE_EVERY = 0
+PROFILE_TOKEN = None
+# alias de CACHES del N de muestreo: con locmem (el 'default' si no se define CACHES) el cambio desde
+# la página solo llega al worker que la atendió; con varios workers usar un alias redis/memcached
+PROFILE_CACHE_ALIAS = "default"
+
+# AccessInfoBulkView (POST /ws/access-info/bulk/): máximo de escaneos por petición
+ACCESS_INFO_BULK_MAX = 1000
+
+# tokens de gates y servicios (ws/permissions.py): "Authorization: Bearer <token>" en
+# /ws/policy/bundle/, /ws/policy/delta/ y /ws/occupancy/. Vacío = solo staff con sesión
+SERVICE_TOKENS = []
@@ -0,0 +1,22 @@
+# sistema_acceso_militar/settings_replica_test.py
+# Pruebas del router primaria/réplica (ws/tests.py, ReplicaRoutingTests) con dos alias SQLite:
+# python manage.py test ws --settings=sistema_acceso_militar.settings_replica_test
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_primary.sqlite3",  # noqa: F405
+        # en archivo y no en memoria: la conexión de la réplica abre el mismo archivo
+        "TEST": {"NAME": BASE_DIR / "test_primary_test.sqlite3"},  # noqa: F405
+    },
+    # en las pruebas la réplica es la misma base (MIRROR): lo que se verifica es a qué alias va cada consulta
+    "replica1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "test_replica1.sqlite3",  # noqa: F405
+        "TEST": {"MIRROR": "default"},
+    },
+}
+DATABASE_REPLICAS = ["replica1"]
+# en MySQL las tablas de ws vienen de esquema+tuplas.sql; en las pruebas se crean desde los modelos
+MIGRATION_MODULES = {"ws": None}
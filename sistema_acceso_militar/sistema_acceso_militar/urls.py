@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from ws.metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('ws/', include('ws.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
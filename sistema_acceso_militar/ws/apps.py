@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class WsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ws'
+
+    def ready(self):
+        # change feed de políticas + invalidación de cachés (ws/changelog.py)
+        from . import changelog
+        changelog.connect()
+        # tabla de clausura de unidades (ws/hierarchy.py)
+        from . import hierarchy
+        hierarchy.connect()
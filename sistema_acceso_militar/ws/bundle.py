@@ -0,0 +1,188 @@
+# ws/bundle.py
+"""
+Compila las políticas de MySQL en el bundle de ws/offline.py y guarda
+snapshots versionados para que los gates puedan sincronizar por deltas.
+
+Los snapshots viven en POLICY_BUNDLE_DIR como policy-<versión>.bin. La versión
+solo avanza cuando el contenido cambia (se compara el checksum). Si el change
+feed (ws/changelog.py) no registró cambios desde el último export, ni siquiera
+se vuelve a compilar.
+"""
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import changelog, offline
+from .models import (
+    Badge,
+    Personnel,
+    PersonnelPermission,
+    Rank,
+    RestrictedZone,
+    SpecialAccessGrant,
+    Unit,
+    ZonePermissionRequirement,
+)
+
+POLICY_BUNDLE_DIR = getattr(settings, "POLICY_BUNDLE_DIR", os.path.join(settings.BASE_DIR, "policy_bundles"))
+# cuántos snapshots se conservan para responder deltas
+POLICY_BUNDLE_KEEP = getattr(settings, "POLICY_BUNDLE_KEEP", 50)
+BADGE_FALLBACK_TO_PERSONNEL = getattr(settings, "BADGE_FALLBACK_TO_PERSONNEL", False)
+
+SNAPSHOT_RE = re.compile(r"^policy-(\d+)\.bin$")
+
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+
+def _ts(dt):
+    return dt.timestamp() if dt else None
+
+
+def build_policy_content():
+    """Lee zonas, requisitos, personal, permisos activos, grants activos, badges, grados y unidades."""
+    reqs = {}
+    for zone_id, permission_id, required in ZonePermissionRequirement.objects.order_by("id").values_list(
+        "zone_id", "permission_id", "required"
+    ):
+        reqs.setdefault(zone_id, []).append([permission_id, required])
+    zones = {}
+    for z in RestrictedZone.objects.select_related("required_clearance"):
+        zones[z.code] = [
+            z.id,
+            z.name,
+            z.min_rank_level,
+            z.required_clearance.level_value if z.required_clearance else None,
+            z.requires_special_permission,
+            reqs.get(z.id, []),
+        ]
+
+    perms = {}
+    for personnel_id, permission_id, expires_at in PersonnelPermission.objects.filter(active=True).order_by(
+        "id"
+    ).values_list("personnel_id", "permission_id", "expires_at").iterator(chunk_size=5000):
+        perms.setdefault(personnel_id, []).append([permission_id, _ts(expires_at)])
+    personnel = {}
+    for pid, sn, badge_id, status, rank_level, cl_level, rank_id, unit_id in Personnel.objects.values_list(
+        "id", "service_number", "badge_id", "status", "rank__level", "clearance__level_value", "rank_id", "unit_id"
+    ).iterator(chunk_size=5000):
+        personnel[str(pid)] = [sn, badge_id, status, rank_level, cl_level, perms.get(pid, []), rank_id, unit_id]
+    # para mostrar grado y unidad en decisiones locales (historial/fallback.py)
+    ranks = {str(rid): [code, name, level] for rid, code, name, level in Rank.objects.values_list(
+        "id", "code", "name", "level")}
+    units = {str(uid): [code, name] for uid, code, name in Unit.objects.values_list("id", "code", "name")}
+
+    grants = {}
+    for g in SpecialAccessGrant.objects.filter(status="active").iterator(chunk_size=5000):
+        grants[str(g.id)] = [
+            g.zone_id, g.personnel_id, g.granted_by_id, _iso(g.granted_at), _iso(g.expires_at),
+            _ts(g.expires_at), g.reason,
+        ]
+
+    badges = {
+        code: [personnel_id, status]
+        for code, personnel_id, status in Badge.objects.values_list("badge_code", "personnel_id", "status")
+    }
+    return {
+        "meta": {"badge_fallback": BADGE_FALLBACK_TO_PERSONNEL},
+        "zones": zones,
+        "personnel": personnel,
+        "grants": grants,
+        "badges": badges,
+        "ranks": ranks,
+        "units": units,
+    }
+
+
+def _snapshot_path(version):
+    return os.path.join(POLICY_BUNDLE_DIR, f"policy-{version:010d}.bin")
+
+
+def list_versions():
+    if not os.path.isdir(POLICY_BUNDLE_DIR):
+        return []
+    versions = []
+    for name in os.listdir(POLICY_BUNDLE_DIR):
+        m = SNAPSHOT_RE.match(name)
+        if m:
+            versions.append(int(m.group(1)))
+    return sorted(versions)
+
+
+def read_snapshot(version):
+    with open(_snapshot_path(version), "rb") as fh:
+        return fh.read()
+
+
+@lru_cache(maxsize=8)
+def load_snapshot(version):
+    """Contenido decodificado de un snapshot (los snapshots son inmutables)."""
+    return offline.decode_bundle(read_snapshot(version))[1]
+
+
+def latest_version():
+    versions = list_versions()
+    return versions[-1] if versions else None
+
+
+def _marker_path():
+    return os.path.join(POLICY_BUNDLE_DIR, "last_change_version")
+
+
+def _read_marker():
+    try:
+        with open(_marker_path()) as fh:
+            return int(fh.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_marker(change_version):
+    with open(_marker_path(), "w") as fh:
+        fh.write(str(change_version))
+
+
+def export_snapshot(content=None, force=False):
+    """
+    Guarda un snapshot nuevo si el contenido cambió. Devuelve (versión, creado).
+    """
+    current = latest_version()
+    # leída antes de compilar: lo que cambie durante la compilación se revisa en el próximo export
+    change_version = changelog.latest_version()
+    if content is None and not force and current is not None and _read_marker() == change_version:
+        return current, False
+    content = build_policy_content() if content is None else content
+    os.makedirs(POLICY_BUNDLE_DIR, exist_ok=True)
+    if current is not None and offline.checksum(load_snapshot(current)) == offline.checksum(content):
+        _write_marker(change_version)
+        return current, False
+    version = (current or 0) + 1
+    tmp = _snapshot_path(version) + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(offline.encode_bundle(content, version))
+    os.replace(tmp, _snapshot_path(version))
+    _write_marker(change_version)
+    for old in list_versions()[:-POLICY_BUNDLE_KEEP]:
+        os.remove(_snapshot_path(old))
+    return version, True
+
+
+def delta_since(version):
+    """
+    Delta desde `version` hasta el último snapshot, o None si esa versión ya
+    no se conserva (el gate debe descargar el bundle completo).
+    """
+    current = latest_version()
+    if current is None or version not in list_versions():
+        return None
+    new = load_snapshot(current)
+    changes = {} if version == current else offline.diff(load_snapshot(version), new)
+    return {
+        "from_version": version,
+        "to_version": current,
+        "checksum": offline.checksum(new),
+        "changes": changes,
+    }
@@ -0,0 +1,353 @@
+# ws/cache.py
+"""
+Caché de resolución para AccessInfoView.
+
+Guarda registros de personal ya resueltos (rank, unit, clearance, permisos
+activos y grants especiales vigentes) y de zonas (con sus requisitos) en un LRU
+por proceso, con tamaño acotado y, opcionalmente, un segundo nivel compartido
+(un alias de settings.CACHES, p.ej. redis/memcached).
+
+Invalidación por versión:
+  - versión global: cambia al guardar Rank, Unit, ClearanceLevel, Permission,
+    RestrictedZone o ZonePermissionRequirement (afecta a todos los registros).
+  - versión por persona: cambia al guardar Personnel, PersonnelPermission o
+    SpecialAccessGrant de esa persona.
+  - versión de badges: cambia al guardar Badge; invalida las entradas buscadas
+    por badge y el conjunto de badges revocados/perdidos.
+Los cambios llegan por el change feed (ws/changelog.py), incluidas las
+operaciones masivas, y se aplican tras el commit. Las versiones viven en el
+alias ACCESS_CACHE_ALIAS; con varios workers debe ser un backend compartido
+para que los cambios se vean en todos.
+
+Con réplicas (ws/routers.py) las cargas van a la primaria mientras la versión
+que las invalida sea más nueva que REPLICA_LAG_SECONDS: así una réplica
+atrasada no deja en caché datos viejos bajo la versión nueva (una versión
+recién inicializada, p.ej. tras reiniciar el caché, cuenta como nueva).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import routers
+from .models import Badge, Personnel, PersonnelPermission, RestrictedZone, SpecialAccessGrant, ZonePermissionRequirement
+
+ACCESS_CACHE_ALIAS = getattr(settings, "ACCESS_CACHE_ALIAS", "default")
+ACCESS_CACHE_SIZE = getattr(settings, "ACCESS_CACHE_SIZE", 10000)
+# si es True los registros también se guardan en el alias compartido
+ACCESS_CACHE_SHARED = getattr(settings, "ACCESS_CACHE_SHARED", False)
+ACCESS_CACHE_TTL = getattr(settings, "ACCESS_CACHE_TTL", 3600)
+# badges que no están en la tabla badges se buscan en personnel.badge_id
+BADGE_FALLBACK_TO_PERSONNEL = getattr(settings, "BADGE_FALLBACK_TO_PERSONNEL", False)
+
+GLOBAL_VERSION_KEY = "ws:access:v:global"
+PERSON_VERSION_KEY = "ws:access:v:person:{}"
+BADGES_VERSION_KEY = "ws:access:v:badges"
+
+
+def _backend():
+    return caches[ACCESS_CACHE_ALIAS]
+
+
+def _new_token():
+    return time.time_ns()
+
+
+def get_versions(*keys):
+    """
+    Lee varias versiones en un solo get_many. Si una clave no existe (nunca se
+    creó o el backend la expulsó) se inicializa con un token nuevo, de modo que
+    ninguna entrada anterior pueda darse por válida.
+    """
+    backend = _backend()
+    found = backend.get_many(keys)
+    for k in keys:
+        if k not in found:
+            backend.add(k, _new_token(), None)
+            found[k] = backend.get(k)
+    return tuple(found[k] for k in keys)
+
+
+def bump_version(key):
+    _backend().set(key, _new_token(), None)
+
+
+def bump_global_version():
+    bump_version(GLOBAL_VERSION_KEY)
+
+
+def bump_badges_version():
+    bump_version(BADGES_VERSION_KEY)
+
+
+def bump_personnel_version(personnel_id):
+    if personnel_id is not None:
+        bump_version(PERSON_VERSION_KEY.format(personnel_id))
+
+
+class LRUCache:
+    """LRU acotado y thread-safe (OrderedDict + lock)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = LRUCache(ACCESS_CACHE_SIZE)
+
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+
+# ------------------------------------------------------------------ personal
+
+def _load_personnel(id):
+    personnel = Personnel.objects.select_related("rank", "unit", "clearance").filter(id=id).first()
+    if personnel is None:
+        return None
+    now = timezone.now()
+    # solo filtros por igualdad (active / status): sweep_expirations apaga lo vencido.
+    # valid_until: el registro deja de valer cuando expira el primer permiso o grant
+    valid_until = None
+
+    def _track(expires_at):
+        nonlocal valid_until
+        if expires_at and expires_at > now and (valid_until is None or expires_at < valid_until):
+            valid_until = expires_at
+
+    perms = list(
+        PersonnelPermission.objects.filter(personnel=personnel, active=True).select_related("permission")
+    )
+    perms_out = []
+    perm_ids = set()
+    for p in perms:
+        if p.expires_at is None or p.expires_at > now:
+            perm_ids.add(p.permission_id)
+            perms_out.append({
+                "id": p.permission.id,
+                "code": p.permission.code,
+                "name": p.permission.name,
+                "expires_at": _iso(p.expires_at),
+            })
+            _track(p.expires_at)
+
+    grants = {}
+    grants_qs = SpecialAccessGrant.objects.filter(personnel=personnel, status="active").order_by("id")
+    for g in grants_qs:
+        if g.expires_at is not None and g.expires_at <= now:
+            continue
+        _track(g.expires_at)
+        grants.setdefault(g.zone_id, {
+            "id": g.id,
+            "granted_by": g.granted_by_id,
+            "granted_at": _iso(g.granted_at),
+            "expires_at": _iso(g.expires_at),
+            "status": g.status,
+            "reason": g.reason,
+        })
+
+    rank, unit, clearance = personnel.rank, personnel.unit, personnel.clearance
+    return {
+        "id": personnel.id,
+        "service_number": personnel.service_number,
+        "badge_id": personnel.badge_id,
+        "first_name": personnel.first_name,
+        "last_name": personnel.last_name,
+        "status": personnel.status,
+        "rank": {"id": rank.id, "code": rank.code, "name": rank.name, "level": rank.level},
+        "unit": None if not unit else {"id": unit.id, "code": unit.code, "name": unit.name},
+        "clearance": None if not clearance else {
+            "id": clearance.id, "name": clearance.name, "level_value": clearance.level_value
+        },
+        "rank_level": rank.level,
+        "clearance_level": clearance.level_value if clearance else None,
+        "permissions": perms_out,
+        "permission_ids": frozenset(perm_ids),
+        "grants": grants,
+        "valid_until": valid_until.timestamp() if valid_until else None,
+    }
+
+
+def _entry_valid(entry, scope_v):
+    record, entry_scope_v, entry_person_v = entry
+    if entry_scope_v != scope_v:
+        return False
+    if record["valid_until"] is not None and record["valid_until"] <= time.time():
+        return False
+    (person_v,) = get_versions(PERSON_VERSION_KEY.format(record["id"]))
+    return entry_person_v == person_v
+
+
+# ------------------------------------------------------------------ badges
+
+class BadgeRejected(Exception):
+    """El badge escaneado existe en la tabla badges pero no está 'issued'."""
+
+    def __init__(self, badge_code, status):
+        super().__init__(f"badge {badge_code} is {status}")
+        self.badge_code = badge_code
+        self.status = status
+
+
+# (versión, {badge_code: status}) de los badges revocados/perdidos
+_blocked_badges = (None, {})
+_blocked_lock = threading.Lock()
+
+
+def _get_blocked_badges(badges_v):
+    """
+    Conjunto en memoria de badges no emitidos (revoked/lost). Solo se recarga
+    cuando cambia la versión de badges; son pocos, así que un dict (hash set)
+    basta y da respuestas exactas.
+    """
+    global _blocked_badges
+    version, blocked = _blocked_badges
+    if version == badges_v:
+        return blocked
+    with _blocked_lock:
+        if _blocked_badges[0] != badges_v:
+            with routers.primary_reads_if(routers.recently_changed(badges_v)):
+                blocked = dict(
+                    Badge.objects.filter(status__in=(Badge.STATUS_REVOKED, Badge.STATUS_LOST)).values_list("badge_code", "status")
+                )
+            _blocked_badges = (badges_v, blocked)
+        return _blocked_badges[1]
+
+
+def _personnel_id_for_badge(badge_code):
+    """
+    Resuelve el badge por badges.badge_code. Si el código no está en la tabla
+    badges y BADGE_FALLBACK_TO_PERSONNEL está activo, usa personnel.badge_id.
+    """
+    row = Badge.objects.filter(badge_code=badge_code).values_list("personnel_id").first()
+    if row is not None:
+        return row[0]
+    if BADGE_FALLBACK_TO_PERSONNEL:
+        return Personnel.objects.filter(badge_id=badge_code).values_list("id", flat=True).first()
+    return None
+
+
+def get_personnel_record(service_number=None, badge_id=None):
+    """
+    Devuelve el registro resuelto de la persona (dict) o None si no existe.
+    Un acierto en el LRU local no ejecuta ninguna consulta SQL.
+    Con badge_id lanza BadgeRejected si el badge está revocado o perdido, sin
+    consultar MySQL.
+    """
+    if service_number:
+        key = ("sn", service_number)
+        scope_v = get_versions(GLOBAL_VERSION_KEY)
+    else:
+        key = ("badge", badge_id)
+        # las entradas por badge dependen también de la tabla badges
+        scope_v = get_versions(GLOBAL_VERSION_KEY, BADGES_VERSION_KEY)
+        badge_status = _get_blocked_badges(scope_v[1]).get(badge_id)
+        if badge_status is not None:
+            raise BadgeRejected(badge_id, badge_status)
+    cache_key = "ws:access:personnel:{}:{}".format(*key)
+
+    entry = _local.get(key)
+    if entry is not None and _entry_valid(entry, scope_v):
+        return entry[0]
+    if ACCESS_CACHE_SHARED:
+        entry = _backend().get(cache_key)
+        if entry is not None and _entry_valid(entry, scope_v):
+            _local.set(key, entry)
+            return entry[0]
+
+    # leer la versión de la persona antes de cargar: si cambia durante la carga,
+    # la entrada ya nace obsoleta y se recargará en la siguiente consulta
+    if service_number:
+        personnel_id = Personnel.objects.filter(service_number=service_number).values_list("id", flat=True).first()
+    else:
+        personnel_id = _personnel_id_for_badge(badge_id)
+    if personnel_id is None:
+        return None
+    (person_v,) = get_versions(PERSON_VERSION_KEY.format(personnel_id))
+    with routers.primary_reads_if(routers.recently_changed(person_v, *scope_v)):
+        record = _load_personnel(id=personnel_id)
+    if record is None:
+        return None
+    entry = (record, scope_v, person_v)
+    _local.set(key, entry)
+    if ACCESS_CACHE_SHARED:
+        _backend().set(cache_key, entry, ACCESS_CACHE_TTL)
+    return record
+
+
+# ------------------------------------------------------------------ zonas
+
+def _load_zone(code):
+    zone = RestrictedZone.objects.select_related("required_clearance").filter(code=code).first()
+    if zone is None:
+        return None
+    zreqs = ZonePermissionRequirement.objects.filter(zone=zone).select_related("permission")
+    return {
+        "id": zone.id,
+        "code": zone.code,
+        "name": zone.name,
+        "min_rank_level": zone.min_rank_level,
+        "required_clearance_name": zone.required_clearance.name if zone.required_clearance else None,
+        "required_clearance_level": zone.required_clearance.level_value if zone.required_clearance else None,
+        "requires_special_permission": zone.requires_special_permission,
+        "capacity": zone.capacity,
+        "permission_requirements": [
+            {"permission_id": r.permission_id, "code": r.permission.code, "required": r.required} for r in zreqs
+        ],
+    }
+
+
+def get_zone_record(code):
+    """Devuelve la zona resuelta (dict con requisitos) o None si no existe."""
+    key = ("zone", code)
+    cache_key = "ws:access:zone:{}".format(code)
+    (global_v,) = get_versions(GLOBAL_VERSION_KEY)
+
+    entry = _local.get(key)
+    if entry is not None and entry[1] == global_v:
+        return entry[0]
+    if ACCESS_CACHE_SHARED:
+        entry = _backend().get(cache_key)
+        if entry is not None and entry[1] == global_v:
+            _local.set(key, entry)
+            return entry[0]
+
+    with routers.primary_reads_if(routers.recently_changed(global_v)):
+        record = _load_zone(code)
+    if record is None:
+        return None
+    entry = (record, global_v)
+    _local.set(key, entry)
+    if ACCESS_CACHE_SHARED:
+        _backend().set(cache_key, entry, ACCESS_CACHE_TTL)
+    return record
+
+
+def clear_local():
+    _local.clear()
@@ -0,0 +1,281 @@
+# ws/changelog.py
+"""
+Change feed de políticas (tabla audit_policy_changes).
+
+Cada cambio en un modelo de política deja una fila con versión monotónica:
+  - save()/delete() individuales: receivers post_save/post_delete.
+  - update()/bulk_create()/bulk_update(): PolicyQuerySet (ws/models.py).
+La fila se escribe en la misma transacción que el cambio y, tras el commit,
+se invalidan las cachés de ws/cache.py afectadas. Otros consumidores (gates,
+historial) leen /ws/policy/changes/?since=<versión>.
+
+La versión sale de la fila única de audit_policy_version, bloqueada con
+select_for_update hasta el commit de la transacción que cambia políticas. Un
+auto_increment se asigna en el INSERT pero se ve en el COMMIT: una transacción
+larga podía confirmar un id menor a uno ya entregado y el consumidor lo
+saltaba para siempre. Con la secuencia bloqueada las transacciones que
+cambian políticas se confirman de a una, en orden de versión.
+
+changed_by es el personal que hizo el cambio: ChangedByMiddleware deja el
+usuario de la petición en un ContextVar y la primera fila que se escribe lo
+resuelve a personnel (username = service_number, o el mismo email). Los
+comandos pueden fijarlo con acting_as(personnel_id). Sin usuario, o si no es
+personal, queda NULL.
+
+data lleva los valores de la fila (o del update()). De Personnel solo van los
+campos que deciden un acceso (POLICY_FIELDS): nombre, contacto, fechas
+personales, badge_id y foto no se copian al feed.
+"""
+import json
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_delete, post_save
+
+from . import cache as access_cache
+from .models import (
+    Badge,
+    ClearanceLevel,
+    Permission,
+    Personnel,
+    PersonnelPermission,
+    PolicyChange,
+    PolicyVersion,
+    Rank,
+    RestrictedZone,
+    SpecialAccessGrant,
+    Unit,
+    ZonePermissionRequirement,
+)
+
+POLICY_MODELS = (
+    Rank, ClearanceLevel, Unit, Personnel, Permission, PersonnelPermission,
+    RestrictedZone, ZonePermissionRequirement, SpecialAccessGrant, Badge,
+)
+# por encima de este número de filas una operación masiva se registra como una
+# sola fila con entity_id NULL ("recargar toda la entidad")
+POLICY_CHANGES_BULK_ROW_LIMIT = getattr(settings, "POLICY_CHANGES_BULK_ROW_LIMIT", 1000)
+# campos que se copian a data; los modelos que no están van completos
+POLICY_FIELDS = {
+    Personnel: ("id", "service_number", "rank", "unit", "clearance", "status", "updated_at"),
+}
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            # expresiones (F(), Value()...) en update()
+            return str(o)
+
+
+# {"user": ...} o {"personnel_id": ...} de la petición/comando en curso
+_actor = ContextVar("ws_policy_changed_by", default=None)
+
+
+def begin_actor(user=None, personnel_id=None):
+    """Quién hace los cambios de ahora en más; devuelve el token para end_actor."""
+    return _actor.set({"user": user} if personnel_id is None else {"personnel_id": personnel_id})
+
+
+def end_actor(token):
+    _actor.reset(token)
+
+
+class acting_as:
+    """with changelog.acting_as(personnel_id): ... (comandos, scripts)."""
+
+    def __init__(self, personnel_id):
+        self.personnel_id = personnel_id
+
+    def __enter__(self):
+        self._token = begin_actor(personnel_id=self.personnel_id)
+        return self
+
+    def __exit__(self, *exc):
+        end_actor(self._token)
+
+
+def personnel_for_user(user, using=None):
+    """personnel.id del usuario de Django (username = service_number o mismo email), o None."""
+    if user is None or not user.is_authenticated:
+        return None
+    match = Q(service_number=user.get_username())
+    if user.email:
+        match |= Q(email=user.email)
+    return Personnel.objects.using(using).filter(match).values_list("id", flat=True).first()
+
+
+def changed_by_id(using=None):
+    """personnel.id de quien hace el cambio; se resuelve una vez por petición."""
+    actor = _actor.get()
+    if actor is None:
+        return None
+    if "personnel_id" not in actor:
+        actor["personnel_id"] = personnel_for_user(actor.pop("user"), using=using)
+    return actor["personnel_id"]
+
+
+def _dump(data):
+    return json.dumps(data, cls=_Encoder, ensure_ascii=False)
+
+
+def _allowed(model):
+    """attnames y nombres de campo que pueden ir a data, o None si van todos."""
+    names = POLICY_FIELDS.get(model)
+    if names is None:
+        return None
+    return set(names) | {model._meta.get_field(n).attname for n in names}
+
+
+def policy_values(model, values):
+    """values (p.ej. los kwargs de update()) sin los campos que no van al feed."""
+    allowed = _allowed(model)
+    return dict(values) if allowed is None else {k: v for k, v in values.items() if k in allowed}
+
+
+def _values(instance):
+    allowed = _allowed(type(instance))
+    return {
+        f.attname: getattr(instance, f.attname)
+        for f in instance._meta.concrete_fields
+        if allowed is None or f.attname in allowed
+    }
+
+
+def rows_for(objs):
+    """Filas {pk[, personnel_id]} de objetos ya guardados, o None si no tienen pk."""
+    if len(objs) > POLICY_CHANGES_BULK_ROW_LIMIT or any(o.pk is None for o in objs):
+        return None
+    return [{"pk": o.pk, "personnel_id": getattr(o, "personnel_id", None)} for o in objs]
+
+
+def invalidate_change(entity, entity_id, data):
+    """Invalida en ws/cache.py exactamente lo que tocó el cambio."""
+    if entity == Personnel._meta.db_table:
+        if entity_id is None:
+            access_cache.bump_global_version()
+        else:
+            access_cache.bump_personnel_version(entity_id)
+    elif entity in (PersonnelPermission._meta.db_table, SpecialAccessGrant._meta.db_table):
+        personnel_id = (data or {}).get("personnel_id")
+        if entity_id is None or personnel_id is None:
+            access_cache.bump_global_version()
+        else:
+            access_cache.bump_personnel_version(personnel_id)
+    elif entity == Badge._meta.db_table:
+        access_cache.bump_badges_version()
+    else:
+        access_cache.bump_global_version()
+
+
+def _on_commit(changes, using):
+    def run():
+        for entity, entity_id, data in changes:
+            invalidate_change(entity, entity_id, data)
+    transaction.on_commit(run, using=using)
+
+
+def _next_versions(count, using):
+    """
+    Reserva `count` versiones consecutivas; la fila de la secuencia queda
+    bloqueada hasta el commit (o rollback) de la transacción en curso.
+    """
+    seq = PolicyVersion.objects.using(using).select_for_update().filter(pk=1).first()
+    if seq is None:
+        # base sin la fila (creada por syncdb): arranca desde la última versión registrada
+        start = PolicyChange.objects.using(using).aggregate(v=Max("id"))["v"] or 0
+        seq = PolicyVersion.objects.using(using).create(pk=1, version=start)
+    first = seq.version + 1
+    seq.version += count
+    seq.save(using=using, update_fields=["version"])
+    return range(first, first + count)
+
+
+def _write(changes, action, using):
+    """Filas de audit_policy_changes para [(entity, entity_id, data)]."""
+    with transaction.atomic(using=using):
+        actor = changed_by_id(using)
+        PolicyChange.objects.using(using).bulk_create([
+            PolicyChange(id=version, entity=entity, entity_id=entity_id, action=action, diff=_dump(data),
+                         changed_by_id=actor)
+            for version, (entity, entity_id, data) in zip(_next_versions(len(changes), using), changes)
+        ])
+    _on_commit(changes, using)
+
+
+def log_change(model, entity_id, action, data, using=None):
+    _write([(model._meta.db_table, entity_id, data)], action, using)
+
+
+def log_bulk(model, action, rows, count, extra=None, using=None):
+    """
+    Registra una operación masiva: una fila por objeto si se conocen las filas
+    afectadas, o una sola fila de entidad completa si no.
+    """
+    if count == 0:
+        return
+    entity = model._meta.db_table
+    if rows is None:
+        _write([(entity, None, dict(extra or {}, count=count))], action, using)
+        return
+    _write([(entity, row["pk"], dict(extra or {}, personnel_id=row.get("personnel_id"))) for row in rows],
+           action, using)
+
+
+def _log_saved(sender, instance, created, using=None, **kwargs):
+    action = PolicyChange.ACTION_CREATE if created else PolicyChange.ACTION_UPDATE
+    log_change(sender, instance.pk, action, _values(instance), using=using)
+
+
+def _log_deleted(sender, instance, using=None, **kwargs):
+    log_change(sender, instance.pk, PolicyChange.ACTION_DELETE, _values(instance), using=using)
+
+
+def connect():
+    for model in POLICY_MODELS:
+        post_save.connect(_log_saved, sender=model, dispatch_uid=f"ws_changelog_save_{model.__name__}")
+        post_delete.connect(_log_deleted, sender=model, dispatch_uid=f"ws_changelog_delete_{model.__name__}")
+
+
+def latest_version():
+    return PolicyChange.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def changes_since(version, entities=None, limit=1000):
+    """
+    Cambios con versión > version (como mucho `limit`). Las versiones se
+    confirman en orden (ver _next_versions): todo lo menor o igual a la última
+    visible ya está confirmado y el consumidor puede avanzar hasta ella.
+    """
+    # tope leído antes que las filas: lo que se confirme durante la consulta queda para la próxima
+    latest = latest_version()
+    qs = PolicyChange.objects.filter(id__gt=version, id__lte=latest).order_by("id")
+    if entities:
+        qs = qs.filter(entity__in=entities)
+    rows = list(qs[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # con filtro de entidades se avanza también sobre las filas que no interesan
+    new_version = rows[-1].id if has_more else max(latest, version)
+    return {
+        "since": version,
+        "version": new_version,
+        "latest": latest,
+        "has_more": has_more,
+        "changes": [
+            {
+                "version": r.id,
+                "entity": r.entity,
+                "entity_id": r.entity_id,
+                "action": r.action,
+                "changed_at": r.changed_at.isoformat(),
+                "changed_by": r.changed_by_id,
+                "data": json.loads(r.diff) if r.diff else None,
+            } for r in rows
+        ],
+    }
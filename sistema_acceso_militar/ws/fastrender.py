@@ -0,0 +1,146 @@
+# ws/fastrender.py
+"""
+Render precompilado de AccessInfoSerializer para AccessInfoView.
+
+Instanciar el serializer anidado en cada respuesta copia los campos de siete
+serializers (incluido EvidenceSerializer(many=True)) solo para volver a emitir
+el mismo dict. Aquí se recorre el serializer una sola vez al importar el
+módulo y se arma un plan por nivel: (clave de salida, clave de entrada,
+conversión, qué hacer si falta). Renderizar es recorrer ese plan.
+
+La semántica es la de DRF para instancias dict:
+  - clave ausente: default del campo, None si allow_null, se omite si
+    required=False, y si no KeyError.
+  - valor None: se emite None sin convertir.
+  - claves que el serializer no declara (p.ej. grant_id en evidence) se descartan.
+Al compilar se compara el resultado con el serializer real sobre datos de
+ejemplo generados a partir de los campos; si difieren se lanza
+ImproperlyConfigured, así un cambio en serializers.py no rompe la paridad en
+silencio. ACCESS_INFO_FAST_RENDER = False vuelve al serializer de DRF.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from .serializers import AccessInfoSerializer
+
+ACCESS_INFO_FAST_RENDER = getattr(settings, "ACCESS_INFO_FAST_RENDER", True)
+
+_SKIP = object()
+_RAISE = object()
+
+# conversiones equivalentes a to_representation de DRF
+_DIRECT = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+}
+
+
+def _on_missing(field):
+    if field.default is not empty:
+        return field.get_default
+    if field.allow_null:
+        return lambda: None
+    if not field.required:
+        return _SKIP
+    return _RAISE
+
+
+def _convert(field):
+    if isinstance(field, serializers.ListSerializer):
+        child = compile_serializer(field.child)
+        return lambda value: [child(item) for item in value]
+    if isinstance(field, serializers.Serializer):
+        return compile_serializer(field)
+    return _DIRECT.get(type(field), field.to_representation)
+
+
+def compile_serializer(serializer):
+    """Devuelve render(instance) -> dict para una instancia de Serializer cuyos datos son dicts."""
+    plan = []
+    for field in serializer._readable_fields:
+        if isinstance(field, serializers.SerializerMethodField) or len(field.source_attrs) != 1:
+            raise ImproperlyConfigured(
+                f"{type(serializer).__name__}.{field.field_name}: el render precompilado solo admite "
+                f"campos con source simple"
+            )
+        plan.append((field.field_name, field.source_attrs[0], _convert(field), _on_missing(field)))
+    plan = tuple(plan)
+
+    def render(instance):
+        ret = {}
+        for name, key, convert, missing in plan:
+            try:
+                value = instance[key]
+            except KeyError:
+                if missing is _SKIP:
+                    continue
+                if missing is _RAISE:
+                    raise
+                value = missing()
+            ret[name] = None if value is None else convert(value)
+        return ret
+
+    return render
+
+
+# ------------------------------------------------------------------ paridad
+
+def _sample_value(field, variant):
+    if isinstance(field, serializers.ListSerializer):
+        return [sample_instance(field.child, variant), sample_instance(field.child, "full")]
+    if isinstance(field, serializers.Serializer):
+        return sample_instance(field, variant)
+    if isinstance(field, serializers.BooleanField):
+        return 1 if variant == "sparse" else True
+    if isinstance(field, serializers.IntegerField):
+        return "7" if variant == "sparse" else 7
+    if isinstance(field, serializers.DateTimeField):
+        return "2024-01-01T00:00:00+00:00"
+    if isinstance(field, serializers.ListField):
+        return [1, 2]
+    if isinstance(field, serializers.DictField):
+        return {"id": 1, "reason": "x"}
+    return field.field_name
+
+
+def sample_instance(serializer, variant="full"):
+    """
+    Datos de ejemplo para un serializer. "full" llena todos los campos y
+    agrega una clave no declarada; "sparse" omite los opcionales, pone None en
+    los que admiten null y usa valores que DRF tiene que convertir.
+    """
+    data = {"undeclared_key": "x"}
+    for field in serializer._readable_fields:
+        key = field.source_attrs[0] if len(field.source_attrs) == 1 else field.field_name
+        if variant == "sparse" and not field.required:
+            continue
+        if variant == "sparse" and field.allow_null:
+            data[key] = None
+            continue
+        data[key] = _sample_value(field, variant)
+    return data
+
+
+def _dump(data):
+    # compara también el orden de las claves
+    return json.dumps(data, default=str)
+
+
+def check_parity(serializer_class, render):
+    for variant in ("full", "sparse"):
+        sample = sample_instance(serializer_class(), variant)
+        expected = serializer_class(sample).data
+        got = render(sample)
+        if _dump(got) != _dump(expected):
+            raise ImproperlyConfigured(
+                f"render precompilado de {serializer_class.__name__} difiere de DRF ({variant}): "
+                f"{_dump(got)} != {_dump(expected)}"
+            )
+
+
+render_access_info = compile_serializer(AccessInfoSerializer())
+check_parity(AccessInfoSerializer, render_access_info)
@@ -0,0 +1,138 @@
+# ws/hierarchy.py
+"""
+Mantenimiento de la tabla de clausura de unidades (unit_closure).
+
+Unit.parent_unit sigue siendo la fuente de verdad; unit_closure se actualiza
+en la misma transacción que el save()/delete() de la unidad:
+  - alta: la unidad se enlaza consigo misma y con todos los ancestros del padre.
+  - cambio de padre: se cortan los enlaces del subárbol con sus ancestros
+    anteriores y se agregan los del nuevo padre.
+  - baja: los hijos quedan como raíces (parent_unit SET NULL), así que su
+    subárbol pierde los enlaces con los ancestros de la unidad borrada.
+Las operaciones masivas (UnitQuerySet) y los scripts SQL reconstruyen la tabla
+completa con rebuild() (python manage.py rebuild_unit_closure).
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, pre_save
+
+from .models import Personnel, Unit, UnitClosure
+
+_NEW = object()
+
+
+def _subtree(unit_id, using=None):
+    """{descendant_id: depth} del subárbol de unit_id (incluye la unidad)."""
+    return dict(
+        UnitClosure.objects.using(using).filter(ancestor_id=unit_id).values_list("descendant_id", "depth")
+    )
+
+
+def _ancestors(unit_id, using=None):
+    """[(ancestor_id, depth)] de unit_id (incluye la unidad con depth 0)."""
+    if unit_id is None:
+        return []
+    return list(UnitClosure.objects.using(using).filter(descendant_id=unit_id).values_list("ancestor_id", "depth"))
+
+
+def _link(subtree, parent_id, using=None):
+    """Enlaza cada nodo del subárbol con el padre y todos sus ancestros."""
+    rows = [
+        UnitClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=a_depth + d_depth + 1)
+        for ancestor_id, a_depth in _ancestors(parent_id, using)
+        for descendant_id, d_depth in subtree.items()
+    ]
+    UnitClosure.objects.using(using).bulk_create(rows)
+
+
+def insert_unit(unit, using=None):
+    UnitClosure.objects.using(using).create(ancestor_id=unit.pk, descendant_id=unit.pk, depth=0)
+    _link({unit.pk: 0}, unit.parent_unit_id, using)
+
+
+def move_unit(unit, using=None):
+    subtree = _subtree(unit.pk, using)
+    if not subtree:
+        # la unidad no estaba en la tabla (p.ej. cargada por SQL antes de la reconstrucción)
+        rebuild(using=using)
+        return
+    UnitClosure.objects.using(using).filter(descendant_id__in=list(subtree)).exclude(
+        ancestor_id__in=list(subtree)
+    ).delete()
+    _link(subtree, unit.parent_unit_id, using)
+
+
+def detach_unit(unit, using=None):
+    """Antes de borrar: el subárbol de cada hijo deja de colgar de los ancestros de la unidad."""
+    below = [d for d, depth in _subtree(unit.pk, using).items() if depth > 0]
+    above = [a for a, _ in _ancestors(unit.pk, using)]
+    if below and above:
+        UnitClosure.objects.using(using).filter(ancestor_id__in=above, descendant_id__in=below).delete()
+
+
+def rebuild(using=None):
+    """Recalcula unit_closure completa a partir de units.parent_unit_id. Devuelve el número de filas."""
+    parents = dict(Unit.objects.using(using).values_list("id", "parent_unit_id"))
+    rows = []
+    for unit_id in parents:
+        depth = 0
+        node = unit_id
+        seen = set()
+        # se corta si hay un ciclo cargado por SQL directo
+        while node is not None and node not in seen:
+            seen.add(node)
+            rows.append(UnitClosure(ancestor_id=node, descendant_id=unit_id, depth=depth))
+            node = parents.get(node)
+            depth += 1
+    with transaction.atomic(using=using):
+        UnitClosure.objects.using(using).all().delete()
+        UnitClosure.objects.using(using).bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+
+# ------------------------------------------------------------------ consultas
+
+def subtree_unit_ids(unit_id):
+    return list(UnitClosure.objects.filter(ancestor_id=unit_id).values_list("descendant_id", flat=True))
+
+
+def subtree_personnel(unit_id):
+    """Personal de la unidad y de todas sus subunidades: un join con unit_closure."""
+    return Personnel.objects.filter(unit__ancestor_links__ancestor_id=unit_id)
+
+
+# ------------------------------------------------------------------ señales
+
+def _before_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old_parent = _NEW
+    if instance.pk is not None:
+        row = Unit.objects.using(using).filter(pk=instance.pk).values_list("parent_unit_id").first()
+        if row is not None:
+            old_parent = row[0]
+    if old_parent is not _NEW and instance.parent_unit_id != old_parent and instance.parent_unit_id is not None:
+        if UnitClosure.objects.using(using).filter(
+            ancestor_id=instance.pk, descendant_id=instance.parent_unit_id
+        ).exists():
+            raise ValueError("una unidad no puede depender de sí misma ni de una de sus subunidades")
+    instance._closure_old_parent = old_parent
+
+
+def _after_save(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old_parent = getattr(instance, "_closure_old_parent", _NEW)
+    if old_parent is _NEW:
+        insert_unit(instance, using)
+    elif old_parent != instance.parent_unit_id:
+        move_unit(instance, using)
+
+
+def _before_delete(sender, instance, using=None, **kwargs):
+    detach_unit(instance, using)
+
+
+def connect():
+    pre_save.connect(_before_save, sender=Unit, dispatch_uid="ws_hierarchy_pre_save")
+    post_save.connect(_after_save, sender=Unit, dispatch_uid="ws_hierarchy_post_save")
+    pre_delete.connect(_before_delete, sender=Unit, dispatch_uid="ws_hierarchy_pre_delete")
@@ -0,0 +1,82 @@
+# ws/jsoncodec.py
+"""
+Codec JSON rápido para las respuestas y peticiones del WS.
+
+Usa orjson si está instalado (pip install orjson) y JSON_CODEC lo permite; si
+no, cae a json de la stdlib con el mismo resultado. orjson serializa
+datetime/date/UUID de forma nativa; el resto (Decimal, QuerySet, ...) pasa
+por el JSONEncoder de DRF, así que la salida coincide con JSONRenderer:
+compacta, UTF-8 sin escapar, datetimes UTC con "Z", U+2028/U+2029 escapados.
+La indentación pedida por el cliente y lo que orjson no admite (enteros de
+más de 64 bits) se delegan a json; la única diferencia es que NaN sale como
+null (JSON válido) en vez de NaN.
+"""
+import json
+
+from django.conf import settings
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import encoders
+
+# "orjson" (por defecto, si está instalado) o "json"
+JSON_CODEC = getattr(settings, "JSON_CODEC", "orjson")
+
+orjson = None
+if JSON_CODEC == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+_default = encoders.JSONEncoder().default
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(obj, indent=False):
+    """bytes UTF-8 con la misma salida que JSONRenderer (indent=True: 2 espacios)."""
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, default=_default, option=_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+            return data.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        except TypeError:
+            pass
+    ret = json.dumps(
+        obj, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=True,
+        indent=2 if indent else None, separators=(",", ": ") if indent else (",", ":"),
+    )
+    return ret.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer de DRF sobre dumps(); mismo media type y misma salida."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser de DRF sobre loads(); otros charsets van al parser original."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("_", "-") not in ("utf-8", "utf8"):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
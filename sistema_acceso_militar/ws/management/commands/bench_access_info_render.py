@@ -0,0 +1,59 @@
+# uso
+# medir el costo por respuesta de serializar /access-info/ con DRF y con el render precompilado
+# python manage.py bench_access_info_render
+# con una persona y zona reales y más iteraciones
+# python manage.py bench_access_info_render --service-number SN-0001 --zone-code CZ-01 --iterations 50000
+
+# ws/management/commands/bench_access_info_render.py
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ws import cache as access_cache
+from ws import fastrender
+from ws.serializers import AccessInfoSerializer
+from ws.views import build_access_info
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark del serializado de AccessInfoView: AccessInfoSerializer de DRF vs ws/fastrender.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--service-number", type=str, default=None, help="Persona real (por defecto datos de ejemplo).")
+        parser.add_argument("--zone-code", type=str, default=None)
+
+    def _payload(self, options):
+        if not options["service_number"]:
+            return fastrender.sample_instance(AccessInfoSerializer())
+        if not options["zone_code"]:
+            raise CommandError("--zone-code es requerido junto con --service-number")
+        person = access_cache.get_personnel_record(service_number=options["service_number"])
+        zone = access_cache.get_zone_record(options["zone_code"])
+        if person is None or zone is None:
+            raise CommandError("No se encontró la persona o la zona")
+        return build_access_info(person, zone)
+
+    def _time(self, fn, payload, iterations):
+        fn(payload)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(payload)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    def handle(self, *args, **options):
+        payload = self._payload(options)
+        iterations = options["iterations"]
+
+        drf = lambda p: AccessInfoSerializer(p).data
+        fast = fastrender.render_access_info
+        if json.dumps(drf(payload), default=str) != json.dumps(fast(payload), default=str):
+            raise CommandError("El render precompilado no coincide con AccessInfoSerializer para este payload")
+
+        drf_us = self._time(drf, payload, iterations)
+        fast_us = self._time(fast, payload, iterations)
+        self.stdout.write(f"iteraciones: {iterations}")
+        self.stdout.write(f"DRF AccessInfoSerializer: {drf_us:9.2f} µs/respuesta")
+        self.stdout.write(f"render precompilado:      {fast_us:9.2f} µs/respuesta")
+        self.stdout.write(self.style.SUCCESS(f"paridad ok, {drf_us / fast_us:.1f}x más rápido"))
@@ -0,0 +1,152 @@
+# uso
+# revisar los planes de las consultas del control de acceso (falla si alguna recorre la tabla completa)
+# python manage.py check_query_plans
+# con una persona y zona concretas y mostrando el plan completo
+# python manage.py check_query_plans --service-number SN-0001 --zone-code CZ-01 --verbose
+
+# ws/management/commands/check_query_plans.py
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ws.models import (
+    Badge,
+    Personnel,
+    PersonnelPermission,
+    RestrictedZone,
+    SpecialAccessGrant,
+    ZonePermissionRequirement,
+)
+
+SQLITE_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+POSTGRES_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+
+
+def hot_queries(personnel_id, service_number, badge_id, zone_id, zone_code):
+    """
+    Las consultas que ejecutan evaluate_access y AccessInfoView (ws/cache.py),
+    armadas igual que en el código para que el plan sea el mismo.
+    """
+    return [
+        ("cache.personnel_id_por_service_number",
+         Personnel.objects.filter(service_number=service_number).values_list("id", flat=True)[:1]),
+        ("cache.personnel_id_por_badge",
+         Badge.objects.filter(badge_code=badge_id).values_list("personnel_id")[:1]),
+        ("cache.personnel_id_por_badge_fallback",
+         Personnel.objects.filter(badge_id=badge_id).values_list("id", flat=True)[:1]),
+        ("cache.badges_bloqueados",
+         Badge.objects.filter(status__in=(Badge.STATUS_REVOKED, Badge.STATUS_LOST)).values_list("badge_code", "status")),
+        ("cache.personnel",
+         Personnel.objects.select_related("rank", "unit", "clearance").filter(id=personnel_id).order_by("pk")[:1]),
+        ("cache.permisos_activos",
+         PersonnelPermission.objects.filter(personnel_id=personnel_id, active=True).select_related("permission")),
+        ("cache.grants_activos",
+         SpecialAccessGrant.objects.filter(personnel_id=personnel_id, status="active").order_by("id")),
+        ("cache.zona",
+         RestrictedZone.objects.select_related("required_clearance").filter(code=zone_code).order_by("pk")[:1]),
+        ("cache.requisitos_zona",
+         ZonePermissionRequirement.objects.filter(zone_id=zone_id).select_related("permission")),
+        ("evaluate_access.requisitos_zona",
+         ZonePermissionRequirement.objects.filter(zone_id=zone_id)),
+        ("evaluate_access.permisos_activos",
+         PersonnelPermission.objects.filter(personnel_id=personnel_id, active=True)),
+        ("evaluate_access.grant_especial",
+         SpecialAccessGrant.objects.filter(zone_id=zone_id, personnel_id=personnel_id, status="active").order_by("id")),
+    ]
+
+
+def explain(connection, sql, params):
+    """Devuelve (líneas del plan, tablas recorridas completas)."""
+    vendor = connection.vendor
+    prefix = "EXPLAIN QUERY PLAN " if vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        columns = [c[0] for c in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    lines = []
+    full_scans = []
+    for row in rows:
+        if vendor == "mysql":
+            # type=ALL: recorre la tabla completa
+            lines.append(
+                f"{row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                f"rows={row.get('rows')} {row.get('Extra') or ''}".rstrip()
+            )
+            if row.get("type") == "ALL":
+                full_scans.append(row.get("table"))
+        elif vendor == "sqlite":
+            detail = row.get("detail", "")
+            lines.append(detail)
+            m = SQLITE_SCAN_RE.match(detail)
+            if m:
+                full_scans.append(m.group(1))
+        else:
+            detail = str(next(iter(row.values())))
+            lines.append(detail)
+            full_scans += POSTGRES_SCAN_RE.findall(detail)
+    return lines, full_scans
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta EXPLAIN sobre cada consulta del camino caliente de evaluate_access/AccessInfoView "
+        "y falla si algún plan recorre una tabla completa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--service-number", type=str, default=None, help="Persona de ejemplo (por defecto la primera con permisos).")
+        parser.add_argument("--zone-code", type=str, default=None, help="Zona de ejemplo (por defecto la primera con requisitos).")
+        parser.add_argument("--database", type=str, default="default", help="Alias de la base de datos.")
+        parser.add_argument("--ignore-table", action="append", default=[], help="Tabla cuyo recorrido completo se tolera (repetible).")
+        parser.add_argument("--verbose", action="store_true", help="Mostrar el plan completo de cada consulta.")
+
+    def _sample(self, options):
+        db = options["database"]
+        if options["service_number"]:
+            personnel = Personnel.objects.using(db).filter(service_number=options["service_number"]).first()
+            if personnel is None:
+                raise CommandError(f"No existe personal con service_number {options['service_number']}")
+        else:
+            pid = PersonnelPermission.objects.using(db).values_list("personnel_id", flat=True).first()
+            personnel = Personnel.objects.using(db).filter(id=pid).first() or Personnel.objects.using(db).first()
+        if options["zone_code"]:
+            zone = RestrictedZone.objects.using(db).filter(code=options["zone_code"]).first()
+            if zone is None:
+                raise CommandError(f"No existe la zona {options['zone_code']}")
+        else:
+            zid = ZonePermissionRequirement.objects.using(db).values_list("zone_id", flat=True).first()
+            zone = RestrictedZone.objects.using(db).filter(id=zid).first() or RestrictedZone.objects.using(db).first()
+        # con la base vacía se revisan los planes con valores que no existen
+        return (
+            personnel.id if personnel else 0,
+            personnel.service_number if personnel else "",
+            (personnel.badge_id or "") if personnel else "",
+            zone.id if zone else 0,
+            zone.code if zone else "",
+        )
+
+    def handle(self, *args, **options):
+        db = options["database"]
+        connection = connections[db]
+        ignored = set(options["ignore_table"])
+        failures = []
+        for name, qs in hot_queries(*self._sample(options)):
+            sql, params = qs.using(db).query.get_compiler(using=db).as_sql()
+            lines, full_scans = explain(connection, sql, params)
+            full_scans = [t for t in full_scans if t not in ignored]
+            if full_scans:
+                failures.append((name, full_scans))
+                self.stdout.write(self.style.ERROR(f"FULL SCAN {name}: {', '.join(full_scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"ok        {name}"))
+            if options["verbose"] or full_scans:
+                for line in lines:
+                    self.stdout.write(f"    {line}")
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} consulta(s) recorren tablas completas: "
+                + "; ".join(f"{name} ({', '.join(tables)})" for name, tables in failures)
+            )
@@ -0,0 +1,37 @@
+# uso
+# compilar las políticas y guardar un snapshot nuevo si cambiaron (cron cada minuto)
+# python manage.py export_policy_bundle
+# copiar además el bundle a un archivo para cargarlo en un gate
+# python manage.py export_policy_bundle --output ./gate-policy.bin
+# forzar la compilación tras cambios hechos con SQL directo (no pasan por el change feed)
+# python manage.py export_policy_bundle --force
+
+# ws/management/commands/export_policy_bundle.py
+from django.core.management.base import BaseCommand
+
+from ws import bundle
+from ws import routers
+
+
+class Command(BaseCommand):
+    help = "Compila zonas, requisitos, personal, permisos, grants y badges en un bundle versionado para gates offline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=str, default=None, help="Copia el último bundle a este archivo.")
+        parser.add_argument("--force", action="store_true", help="Compilar aunque el change feed no registre cambios (p.ej. tras cargar datos con SQL).")
+
+    def handle(self, *args, **options):
+        # solo lee de la BD: una sola réplica para que el change feed y el contenido coincidan
+        with routers.replica_reads():
+            version, created = bundle.export_snapshot(force=options["force"])
+        if created:
+            self.stdout.write(self.style.SUCCESS(f"Snapshot de políticas v{version} generado en {bundle.POLICY_BUNDLE_DIR}"))
+        else:
+            self.stdout.write(f"Sin cambios: la versión vigente sigue siendo v{version}")
+
+        out_file = options["output"]
+        if out_file:
+            data = bundle.read_snapshot(version)
+            with open(out_file, "wb") as fh:
+                fh.write(data)
+            self.stdout.write(f"Bundle v{version} ({len(data)} bytes) escrito en {out_file}")
@@ -5,10 +5,8 @@
 # ws/management/commands/generate_access_attempts.py
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.db.models import Q
 
 import random
-import json
 from datetime import timedelta
 
 # Ajusta el import si tu app no se llama 'ws'
@@ -20,6 +18,8 @@ from ws.models import (
     SpecialAccessGrant,
     Permission,
 )
+from ws import jsoncodec
+from ws import routers
 
 # Opcional: si quieres nombres realistas
 try:
@@ -49,6 +49,11 @@ class Command(BaseCommand):
         parser.add_argument("--only-personnel-active", action="store_true", help="Preferir personal con status='active' (no exclusivo).")
 
     def handle(self, *args, **options):
+        # solo lee de MySQL: con réplicas configuradas no carga la primaria
+        with routers.replica_reads():
+            self.generate(**options)
+
+    def generate(self, **options):
         n = options["n"]
         out_file = options["output"]
         seed = options["seed"]
@@ -93,11 +98,12 @@ class Command(BaseCommand):
             z = random.choice(zonas)
 
             # obtener permisos activos del personal (no expirados)
+            # filtro por igualdad; sweep_expirations apaga los vencidos y aquí se descarta el resto
             now_check = timezone.now()
-            perms_qs = PersonnelPermission.objects.filter(
-                personnel=p,
-                active=True
-            ).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now_check)).select_related("permission")
+            perms_qs = [
+                pp for pp in PersonnelPermission.objects.filter(personnel=p, active=True).select_related("permission")
+                if pp.expires_at is None or pp.expires_at > now_check
+            ]
             perm_ids = set([pp.permission.id for pp in perms_qs if getattr(pp, "permission", None) is not None])
 
             # requerimientos de la zona
@@ -128,11 +134,10 @@ class Command(BaseCommand):
                     perm_ok = False
 
             # special access grants active
-            special = SpecialAccessGrant.objects.filter(
-                zone=z,
-                personnel=p,
-                status="active"
-            ).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now_check)).first()
+            special = next((
+                g for g in SpecialAccessGrant.objects.filter(zone=z, personnel=p, status="active").order_by("id")
+                if g.expires_at is None or g.expires_at > now_check
+            ), None)
 
             if special:
                 allowed = True
@@ -284,8 +289,9 @@ class Command(BaseCommand):
                 self.stdout.write(f"{i+1} documentos generados...")
 
         # escribir JSON array
-        with open(out_file, "w", encoding="utf-8") as fh:
-            json.dump(docs, fh, ensure_ascii=False, indent=2)
+        # ws/jsoncodec.py: orjson si está instalado (mismo JSON indentado que json.dump)
+        with open(out_file, "wb") as fh:
+            fh.write(jsoncodec.dumps(docs, indent=True))
 
         self.stdout.write(self.style.SUCCESS(f"Generados {len(docs)} documentos en {out_file}"))
         self.stdout.write("")
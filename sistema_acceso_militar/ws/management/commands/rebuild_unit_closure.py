@@ -0,0 +1,16 @@
+# uso
+# recalcular unit_closure tras cargar unidades con SQL directo (esquema+tuplas.sql)
+# python manage.py rebuild_unit_closure
+
+# ws/management/commands/rebuild_unit_closure.py
+from django.core.management.base import BaseCommand
+
+from ws import hierarchy
+
+
+class Command(BaseCommand):
+    help = "Reconstruye la tabla de clausura de unidades (unit_closure) a partir de units.parent_unit_id."
+
+    def handle(self, *args, **options):
+        rows = hierarchy.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"unit_closure reconstruida: {rows} filas"))
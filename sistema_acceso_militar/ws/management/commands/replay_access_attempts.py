@@ -0,0 +1,158 @@
+# uso
+# re-evaluar el dump de mongodump con la política actual (compila un snapshot si cambió)
+# python manage.py replay_access_attempts --dump ../dump/historial_registros_acceso_militar/access_attempts.bson
+# leer de MongoDB (access_attempts y sus particiones mensuales) con 8 procesos y guardar las diferencias
+# python manage.py replay_access_attempts --mongo-uri mongodb://localhost:27017 --mongo-db historial_registros_acceso_militar --workers 8 --output diferencias.ndjson
+# usar el bundle de un gate en lugar del snapshot más reciente
+# python manage.py replay_access_attempts --dump access_attempts.bson --bundle ./gate-policy.bin
+
+# ws/management/commands/replay_access_attempts.py
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ws import bundle
+from ws import replay
+from ws import routers
+from ws.offline import BundleError, decode_bundle
+
+# colecciones de intentos en el historial: la única anterior y las particiones mensuales
+ATTEMPT_COLLECTION_RE = re.compile(r"^access_attempts(_\d{6})?$")
+
+
+class Command(BaseCommand):
+    help = "Re-evalúa intentos guardados (MongoDB o dump .bson) contra la política actual y reporta las decisiones que cambiarían."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dump", type=str, default=None, help="Archivo .bson de mongodump.")
+        parser.add_argument("--mongo-uri", type=str, default=None, help="URI de MongoDB del historial.")
+        parser.add_argument("--mongo-db", type=str, default="historial_registros_acceso_militar")
+        parser.add_argument("--collection", action="append", default=[], help="Colecciones a leer (por defecto access_attempts y access_attempts_YYYYMM).")
+        parser.add_argument("--bundle", type=str, default=None, help="Bundle de políticas a usar (por defecto el snapshot más reciente).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--chunk-docs", type=int, default=20000, help="Documentos por tarea.")
+        parser.add_argument("--limit", type=int, default=None, help="Procesar como máximo N intentos.")
+        parser.add_argument("--output", type=str, default=None, help="NDJSON con cada intento cuya decisión cambia.")
+        parser.add_argument("--top", type=int, default=20, help="Transiciones y zonas a mostrar.")
+
+    def handle(self, *args, **options):
+        if bool(options["dump"]) == bool(options["mongo_uri"]):
+            raise CommandError("Indique --dump o --mongo-uri (uno de los dos).")
+        bundle_bytes, version = self._policy(options["bundle"])
+        now = time.time()
+        keep_diffs = bool(options["output"])
+        if options["dump"]:
+            if not os.path.exists(options["dump"]):
+                raise CommandError(f"No existe {options['dump']}")
+            func = replay.replay_dump_range
+            tasks = (
+                (options["dump"], start, end, keep_diffs)
+                for start, end in replay.dump_ranges(options["dump"], options["chunk_docs"], options["limit"])
+            )
+            source = options["dump"]
+        else:
+            func = replay.replay_raw_batch
+            tasks = ((batch, keep_diffs) for batch in self._mongo_batches(options))
+            source = f"{options['mongo_uri']}/{options['mongo_db']}"
+
+        self.stdout.write(f"Política v{version}; leyendo {source} con {options['workers']} procesos")
+        start = time.perf_counter()
+        counts, transitions, zones = Counter(), Counter(), Counter()
+        out = open(options["output"], "w") if keep_diffs else None
+        try:
+            if options["workers"] > 1:
+                # los procesos no usan la BD: que no hereden las conexiones abiertas
+                connections.close_all()
+                with multiprocessing.Pool(options["workers"], replay.init_worker, (bundle_bytes, now)) as pool:
+                    for result in pool.imap_unordered(func, tasks):
+                        self._merge(result, counts, transitions, zones, out)
+            else:
+                replay.init_worker(bundle_bytes, now)
+                for task in tasks:
+                    self._merge(func(task), counts, transitions, zones, out)
+        finally:
+            if out is not None:
+                out.close()
+        elapsed = time.perf_counter() - start
+        self._report(counts, transitions, zones, elapsed, options)
+
+    def _policy(self, path):
+        if path:
+            try:
+                with open(path, "rb") as fh:
+                    data = fh.read()
+                return data, decode_bundle(data)[0]
+            except (OSError, BundleError) as exc:
+                raise CommandError(f"Bundle inválido {path}: {exc}")
+        # snapshot actual (se compila si la política cambió desde el último)
+        with routers.replica_reads():
+            version, _ = bundle.export_snapshot()
+        return bundle.read_snapshot(version), version
+
+    def _mongo_batches(self, options):
+        try:
+            from pymongo import MongoClient
+        except ImportError:
+            raise CommandError("Leer de MongoDB requiere pymongo (pip install pymongo).")
+        client = MongoClient(options["mongo_uri"])
+        db = client[options["mongo_db"]]
+        names = options["collection"] or sorted(n for n in db.list_collection_names() if ATTEMPT_COLLECTION_RE.match(n))
+        remaining = options["limit"]
+        try:
+            for name in names:
+                cursor = db[name].find_raw_batches({}, replay.PROJECTION, batch_size=options["chunk_docs"])
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    cursor = cursor.limit(remaining)
+                for batch in cursor:
+                    if remaining is not None:
+                        remaining -= replay.count_documents(batch)
+                    yield batch
+        finally:
+            client.close()
+
+    def _merge(self, result, counts, transitions, zones, out):
+        c, t, z, diffs = result
+        counts.update(c)
+        transitions.update(t)
+        zones.update(z)
+        for d in diffs:
+            out.write(json.dumps(d, ensure_ascii=False) + "\n")
+
+    def _report(self, counts, transitions, zones, elapsed, options):
+        total = counts["total"]
+        rate = total / elapsed if elapsed else 0
+        differ = counts["gained"] + counts["lost"] + counts["reason_changed"]
+        self.stdout.write(self.style.SUCCESS(f"{total:,} intentos en {elapsed:.1f}s ({rate:,.0f}/s)"))
+        self.stdout.write(
+            f"  iguales: {counts['same']:,}  distintos: {differ:,} "
+            f"(ahora permitidos: {counts['gained']:,}, ahora denegados: {counts['lost']:,}, "
+            f"otro motivo: {counts['reason_changed']:,})"
+        )
+        self.stdout.write(
+            f"  persona/zona que ya no existen: {counts['not_found_now']:,}  "
+            f"zone_full (capacidad no re-evaluada): {counts['capacity_not_replayed']:,}  "
+            f"sin persona o zona: {counts['unusable']:,}"
+        )
+        if transitions:
+            self.stdout.write("Transiciones (antes -> ahora):")
+            for (old_allowed, old_reason, new_allowed, new_reason), n in transitions.most_common(options["top"]):
+                self.stdout.write(f"  {n:>10,}  {_label(old_allowed, old_reason)} -> {_label(new_allowed, new_reason)}")
+            self.stdout.write("Zonas con más diferencias:")
+            for zone, n in zones.most_common(options["top"]):
+                self.stdout.write(f"  {n:>10,}  {zone}")
+        if options["output"]:
+            self.stdout.write(f"Diferencias escritas en {options['output']}")
+
+
+def _label(allowed, reason):
+    if allowed is None:
+        return reason
+    return f"{'permitido' if allowed else 'denegado'}/{reason}"
@@ -0,0 +1,328 @@
+# uso
+# dataset de benchmark: 1 millón de personas (determinista con --seed)
+# python manage.py seed_policy_data --personnel 1000000 --seed 42
+# otro lote en la misma BD (los códigos llevan el prefijo)
+# python manage.py seed_policy_data --personnel 200000 --prefix B2 --seed 7
+
+# ws/management/commands/seed_policy_data.py
+import math
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ws.models import (
+    Badge,
+    ClearanceLevel,
+    Permission,
+    Personnel,
+    PersonnelPermission,
+    Rank,
+    RestrictedZone,
+    SpecialAccessGrant,
+    Unit,
+    ZonePermissionRequirement,
+)
+
+FIRST_NAMES = [
+    "Juan", "Carlos", "Luis", "José", "Miguel", "Andrés", "Diego", "Jorge", "Pablo", "Fernando",
+    "Santiago", "Mateo", "Daniel", "David", "Javier", "Ricardo", "Marco", "Esteban", "Xavier", "Patricio",
+    "María", "Ana", "Gabriela", "Daniela", "Carolina", "Paola", "Verónica", "Andrea", "Sofía", "Valeria",
+    "Lucía", "Fernanda", "Camila", "Diana", "Mónica", "Patricia", "Alejandra", "Natalia", "Elena", "Rocío",
+]
+LAST_NAMES = [
+    "García", "Rodríguez", "Martínez", "López", "González", "Pérez", "Sánchez", "Ramírez", "Torres", "Flores",
+    "Rivera", "Gómez", "Díaz", "Cruz", "Morales", "Reyes", "Gutiérrez", "Ortiz", "Chávez", "Ramos",
+    "Vargas", "Castillo", "Jiménez", "Moreno", "Romero", "Herrera", "Medina", "Aguilar", "Vega", "Castro",
+    "Mendoza", "Ruiz", "Salazar", "Andrade", "Zambrano", "Cevallos", "Villacís", "Paredes", "Espinoza", "Benítez",
+]
+LOCATIONS = ["Quito", "Guayaquil", "Cuenca", "Manta", "Loja", "Ambato", "Riobamba", "Esmeraldas", "Machala", "Tena"]
+
+# niveles de la jerarquía: (tipo, nombre, hijos por unidad del nivel anterior)
+UNIT_LEVELS = [
+    ("DIV", "División", None),
+    ("BDE", "Brigada", (2, 4)),
+    ("BN", "Batallón", (2, 4)),
+    ("COMP", "Compañía", (3, 5)),
+    ("PLT", "Pelotón", (2, 4)),
+]
+
+PERSONNEL_STATUS = [
+    (Personnel.STATUS_ACTIVE, 92),
+    (Personnel.STATUS_SUSPENDED, 3),
+    (Personnel.STATUS_RETIRED, 4),
+    (Personnel.STATUS_TERMINATED, 1),
+]
+GRANT_STATUS = [
+    (SpecialAccessGrant.STATUS_ACTIVE, 70),
+    (SpecialAccessGrant.STATUS_EXPIRED, 20),
+    (SpecialAccessGrant.STATUS_REVOKED, 10),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera datos sintéticos de política a escala (unidades, permisos, zonas, personal, permisos "
+        "asignados, grants y badges) con bulk_create en transacciones por lotes. Misma --seed, mismo dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--personnel", type=int, default=100000, help="Cantidad de personal a generar.")
+        parser.add_argument("--divisions", type=int, default=10, help="Divisiones (raíces de la jerarquía de unidades).")
+        parser.add_argument("--permissions", type=int, default=200, help="Permisos a generar.")
+        parser.add_argument("--zones", type=int, default=500, help="Zonas restringidas a generar.")
+        parser.add_argument("--permissions-per-person", type=float, default=2.5, help="Promedio de permisos asignados por persona.")
+        parser.add_argument("--grant-rate", type=float, default=0.02, help="Fracción del personal con special access grants.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Personas por lote (una transacción por lote).")
+        parser.add_argument("--seed", type=int, default=42, help="Seed de random.Random.")
+        parser.add_argument("--prefix", type=str, default="SYN", help="Prefijo de los códigos generados (permite varios lotes en la misma BD).")
+        parser.add_argument("--base-date", type=date.fromisoformat, default=None, help="Fecha de referencia YYYY-MM-DD (por defecto hoy).")
+        parser.add_argument("--database", type=str, default="default")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.db = options["database"]
+        self.prefix = options["prefix"]
+        self.batch_size = options["batch_size"]
+        base = options["base_date"] or date.today()
+        self.base_dt = datetime.combine(base, dt_time(12), tzinfo=dt_timezone.utc)
+        self.base_date = base
+
+        if len(self.prefix) > 6:
+            raise CommandError("--prefix admite hasta 6 caracteres (los códigos de unidad son de 20).")
+        if Unit.objects.using(self.db).filter(code__startswith=f"{self.prefix}-").exists():
+            raise CommandError(f"Ya hay datos con el prefijo {self.prefix!r}; usa otro --prefix.")
+
+        ranks = list(Rank.objects.using(self.db).order_by("level").values_list("id", "level"))
+        clearances = list(ClearanceLevel.objects.using(self.db).order_by("level_value").values_list("id", flat=True))
+        if not ranks or not clearances:
+            raise CommandError("Las tablas ranks y clearance_levels deben tener filas (ver esquema+tuplas.sql).")
+
+        started = time.monotonic()
+        units_by_depth = self._seed_units(options["divisions"])
+        permission_ids = self._seed_permissions(options["permissions"])
+        special_zone_ids = self._seed_zones(options["zones"], ranks, clearances, permission_ids)
+        self._seed_personnel(
+            options["personnel"], ranks, clearances, units_by_depth, permission_ids, special_zone_ids,
+            options["permissions_per_person"], options["grant_rate"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Listo en {time.monotonic() - started:.1f}s"))
+
+    # ------------------------------------------------------------------ helpers
+
+    def _ids_by(self, model, field, values):
+        """{valor: id} tras un bulk_create (MySQL no devuelve los ids insertados)."""
+        return dict(model.objects.using(self.db).filter(**{f"{field}__in": values}).values_list(field, "id"))
+
+    def _weighted(self, pairs):
+        values = [v for v, _ in pairs]
+        cum, total = [], 0
+        for _, w in pairs:
+            total += w
+            cum.append(total)
+        return lambda: self.rng.choices(values, cum_weights=cum)[0]
+
+    def _days_ago(self, low, high):
+        return self.base_dt - timedelta(days=self.rng.randint(low, high), seconds=self.rng.randint(0, 86399))
+
+    # ------------------------------------------------------------------ catálogos
+
+    def _seed_units(self, divisions):
+        """Crea la jerarquía nivel por nivel; UnitQuerySet.bulk_create reconstruye unit_closure."""
+        units_by_depth = []
+        parents = [None]
+        seq = 0
+        for depth, (kind, label, fanout) in enumerate(UNIT_LEVELS):
+            objs = []
+            for parent_id in parents:
+                children = divisions if fanout is None else self.rng.randint(*fanout)
+                for _ in range(children):
+                    seq += 1
+                    objs.append(Unit(
+                        code=f"{self.prefix}-{kind}{seq:06d}",
+                        name=f"{label} {seq}",
+                        parent_unit_id=parent_id,
+                        location=self.rng.choice(LOCATIONS),
+                    ))
+            Unit.objects.using(self.db).bulk_create(objs, batch_size=self.batch_size)
+            ids = self._ids_by(Unit, "code", [u.code for u in objs])
+            parents = [ids[u.code] for u in objs]
+            units_by_depth.append(parents)
+        self.stdout.write(f"unidades: {seq} en {len(UNIT_LEVELS)} niveles")
+        return units_by_depth
+
+    def _seed_permissions(self, count):
+        objs = [
+            Permission(code=f"{self.prefix}_PERM_{i:05d}", name=f"Permiso sintético {i}", description="seed_policy_data")
+            for i in range(1, count + 1)
+        ]
+        Permission.objects.using(self.db).bulk_create(objs, batch_size=self.batch_size)
+        ids = self._ids_by(Permission, "code", [p.code for p in objs])
+        self.stdout.write(f"permisos: {count}")
+        # en el orden de creación: los primeros son los más comunes (ver _permission_picker)
+        return [ids[p.code] for p in objs]
+
+    def _permission_picker(self, permission_ids):
+        # distribución tipo Zipf: pocos permisos concentran la mayoría de asignaciones
+        return self._weighted([(pid, 1.0 / (rank + 1)) for rank, pid in enumerate(permission_ids)])
+
+    def _seed_zones(self, count, ranks, clearances, permission_ids):
+        rank_levels = sorted({level for _, level in ranks})
+        pick_permission = self._permission_picker(permission_ids)
+        objs = []
+        for i in range(1, count + 1):
+            special = self.rng.random() < 0.4
+            objs.append(RestrictedZone(
+                code=f"{self.prefix}-Z{i:06d}",
+                name=f"Zona sintética {i}",
+                location_description=self.rng.choice(LOCATIONS),
+                min_rank_level=self.rng.choice(rank_levels) if self.rng.random() < 0.6 else None,
+                required_clearance_id=self.rng.choice(clearances) if self.rng.random() < 0.7 else None,
+                requires_special_permission=special,
+                capacity=self.rng.choice([10, 25, 50, 100, 250, 500]) if self.rng.random() < 0.3 else None,
+                active=self.rng.random() < 0.95,
+            ))
+        with transaction.atomic(using=self.db):
+            RestrictedZone.objects.using(self.db).bulk_create(objs, batch_size=self.batch_size)
+            ids = self._ids_by(RestrictedZone, "code", [z.code for z in objs])
+            reqs = []
+            special_zone_ids = []
+            for z in objs:
+                if not z.requires_special_permission or not permission_ids:
+                    continue
+                zone_id = ids[z.code]
+                special_zone_ids.append(zone_id)
+                for pid in {pick_permission() for _ in range(self.rng.randint(1, 3))}:
+                    reqs.append(ZonePermissionRequirement(zone_id=zone_id, permission_id=pid, required=True))
+            ZonePermissionRequirement.objects.using(self.db).bulk_create(reqs, batch_size=self.batch_size)
+        self.stdout.write(f"zonas: {count} ({len(special_zone_ids)} con permiso especial, {len(reqs)} requisitos)")
+        return special_zone_ids
+
+    # ------------------------------------------------------------------ personal
+
+    def _seed_personnel(self, count, ranks, clearances, units_by_depth, permission_ids, special_zone_ids,
+                        permissions_per_person, grant_rate):
+        min_level, max_level = ranks[0][1], ranks[-1][1]
+        span = max(max_level - min_level, 1)
+        # pirámide: cada nivel de rango tiene ~1.6 veces menos gente que el anterior
+        pick_rank = self._weighted([((rid, level), 1.6 ** (max_level - level)) for rid, level in ranks])
+        pick_status = self._weighted(PERSONNEL_STATUS)
+        pick_grant_status = self._weighted(GRANT_STATUS)
+        pick_permission = self._permission_picker(permission_ids) if permission_ids else None
+        rank_levels = dict(ranks)
+        deepest = len(units_by_depth) - 1
+        officer_ids = []
+
+        done = 0
+        started = time.monotonic()
+        while done < count:
+            n = min(self.batch_size, count - done)
+            people = []
+            for i in range(done + 1, done + n + 1):
+                rank_id, level = pick_rank()
+                frac = (level - min_level) / span
+                # mandos en unidades altas de la jerarquía, tropa en compañías y pelotones
+                if frac >= 0.8:
+                    depth = self.rng.randint(0, min(1, deepest))
+                elif frac >= 0.5:
+                    depth = self.rng.randint(min(1, deepest), min(2, deepest))
+                else:
+                    depth = self.rng.randint(min(3, deepest), deepest)
+                clearance_idx = min(len(clearances) - 1, int(frac * len(clearances)))
+                if clearance_idx and self.rng.random() < 0.1:
+                    clearance_idx -= 1
+                first = self.rng.choice(FIRST_NAMES)
+                last = self.rng.choice(LAST_NAMES)
+                dob = self.base_date - timedelta(days=self.rng.randint(20 * 365, 55 * 365))
+                enlisted = dob + timedelta(days=18 * 365 + self.rng.randint(0, max((self.base_date - dob).days - 18 * 365, 0)))
+                status = pick_status()
+                people.append(Personnel(
+                    service_number=f"{self.prefix}-{i:010d}",
+                    badge_id=f"{self.prefix}B{i:010d}",
+                    first_name=first,
+                    last_name=last,
+                    dob=dob,
+                    rank_id=rank_id,
+                    unit_id=self.rng.choice(units_by_depth[depth]),
+                    clearance_id=clearances[clearance_idx],
+                    email=f"{first}.{last}.{self.prefix}{i}@mil.local".lower(),
+                    phone=f"+5939{self.rng.randint(0, 99999999):08d}",
+                    status=status,
+                    enlisted_date=enlisted,
+                    discharge_date=(
+                        enlisted + timedelta(days=self.rng.randint(365, 20 * 365))
+                        if status in (Personnel.STATUS_RETIRED, Personnel.STATUS_TERMINATED) else None
+                    ),
+                ))
+
+            with transaction.atomic(using=self.db):
+                Personnel.objects.using(self.db).bulk_create(people, batch_size=self.batch_size)
+                ids = self._ids_by(Personnel, "service_number", [p.service_number for p in people])
+                assignments, grants, badges = [], [], []
+                for p in people:
+                    pid = ids[p.service_number]
+                    # quienes otorgan permisos y grants: los primeros oficiales creados
+                    if len(officer_ids) < 1000 and (rank_levels[p.rank_id] - min_level) / span >= 0.5:
+                        officer_ids.append(pid)
+                    granted_by = self.rng.choice(officer_ids) if officer_ids else None
+
+                    if pick_permission is not None:
+                        # cantidad ~ Poisson(permissions_per_person) con distintos permisos
+                        k = min(len(permission_ids), self._poisson(permissions_per_person))
+                        for perm_id in {pick_permission() for _ in range(k)}:
+                            roll = self.rng.random()
+                            if roll < 0.05:
+                                # vencido y ya barrido por sweep_expirations
+                                expires, active = self._days_ago(1, 365), False
+                            elif roll < 0.20:
+                                expires, active = self.base_dt + timedelta(days=self.rng.randint(1, 365)), True
+                            else:
+                                expires, active = None, True
+                            assignments.append(PersonnelPermission(
+                                personnel_id=pid, permission_id=perm_id, granted_by_id=granted_by,
+                                expires_at=expires, active=active, reason="seed_policy_data",
+                            ))
+
+                    if special_zone_ids and self.rng.random() < grant_rate:
+                        for zone_id in {self.rng.choice(special_zone_ids) for _ in range(self.rng.randint(1, 2))}:
+                            status = pick_grant_status()
+                            if status == SpecialAccessGrant.STATUS_ACTIVE:
+                                expires = self.base_dt + timedelta(days=self.rng.randint(1, 90)) if self.rng.random() < 0.8 else None
+                            else:
+                                expires = self._days_ago(1, 180)
+                            grants.append(SpecialAccessGrant(
+                                zone_id=zone_id, personnel_id=pid, granted_by_id=granted_by,
+                                expires_at=expires, status=status, reason="seed_policy_data",
+                            ))
+
+                    # badge vigente = personnel.badge_id; algunos con un badge anterior perdido o revocado
+                    if self.rng.random() < 0.97:
+                        badges.append(Badge(
+                            badge_code=p.badge_id, personnel_id=pid,
+                            issued_at=self._days_ago(0, 5 * 365), status=Badge.STATUS_ISSUED,
+                        ))
+                    if self.rng.random() < 0.03:
+                        badges.append(Badge(
+                            badge_code=f"{p.badge_id}-OLD", personnel_id=pid,
+                            issued_at=self._days_ago(365, 10 * 365), revoked_at=self._days_ago(0, 365),
+                            status=self.rng.choice([Badge.STATUS_LOST, Badge.STATUS_REVOKED]),
+                        ))
+
+                PersonnelPermission.objects.using(self.db).bulk_create(assignments, batch_size=self.batch_size)
+                SpecialAccessGrant.objects.using(self.db).bulk_create(grants, batch_size=self.batch_size)
+                Badge.objects.using(self.db).bulk_create(badges, batch_size=self.batch_size)
+
+            done += n
+            rate = done / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"personal: {done}/{count} ({rate:,.0f}/s)")
+
+    def _poisson(self, lam):
+        # Knuth; lam es chico (permisos por persona)
+        limit, k, p = math.exp(-lam), 0, 1.0
+        while True:
+            p *= self.rng.random()
+            if p <= limit:
+                return k
+            k += 1
@@ -0,0 +1,100 @@
+# uso
+# ¿cuántos pierden acceso a CZ-01 si se sube el rango mínimo a 6?
+# python manage.py simulate_policy_change --min-rank CZ-01=6
+# exigir un clearance y un permiso nuevo, y quitar otro requisito
+# python manage.py simulate_policy_change --clearance CZ-02=SECRET --add-requirement CZ-02=ACCESS_SENSITIVE_SITE --remove-requirement CZ-03=NIGHT_SHIFT
+# revocar grants (por id o todos los de una zona) y mostrar hasta 10 afectados por zona
+# python manage.py simulate_policy_change --revoke-grant 12 --revoke-zone-grants CZ-04 --show 10
+# cambio armado en un archivo JSON (mismo formato que ws/whatif.py), salida en JSON
+# python manage.py simulate_policy_change --changes-file cambio.json --json
+
+# ws/management/commands/simulate_policy_change.py
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ws import routers
+from ws.whatif import PolicyMatrix
+
+
+def _pair(value):
+    zone, sep, rest = value.partition("=")
+    if not sep or not zone or not rest:
+        raise CommandError(f"se espera ZONA=VALOR: {value!r}")
+    return zone, rest
+
+
+def _none(value):
+    return None if value.lower() == "none" else value
+
+
+class Command(BaseCommand):
+    help = "Simula un cambio de política y cuenta por zona quién gana o pierde acceso, sin modificar la BD."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--min-rank", action="append", default=[], metavar="ZONA=NIVEL", help="Nuevo min_rank_level (none lo quita).")
+        parser.add_argument("--clearance", action="append", default=[], metavar="ZONA=NOMBRE", help="Nuevo required_clearance (none lo quita).")
+        parser.add_argument("--add-requirement", action="append", default=[], metavar="ZONA=PERMISO", help="Agrega un ZonePermissionRequirement requerido.")
+        parser.add_argument("--remove-requirement", action="append", default=[], metavar="ZONA=PERMISO", help="Quita un ZonePermissionRequirement.")
+        parser.add_argument("--revoke-grant", action="append", default=[], type=int, metavar="ID", help="Revoca un SpecialAccessGrant.")
+        parser.add_argument("--revoke-zone-grants", action="append", default=[], metavar="ZONA", help="Revoca todos los grants de la zona.")
+        parser.add_argument("--changes-file", type=str, default=None, help="Cambio en JSON (se combina con las opciones).")
+        parser.add_argument("--show", type=int, default=0, help="Muestra hasta N service_number que ganan/pierden por zona.")
+        parser.add_argument("--all-zones", action="store_true", help="Incluye las zonas sin cambios.")
+        parser.add_argument("--json", action="store_true", help="Salida en JSON.")
+
+    def handle(self, *args, **options):
+        changes = {}
+        if options["changes_file"]:
+            try:
+                with open(options["changes_file"]) as fh:
+                    changes = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"No se pudo leer {options['changes_file']}: {exc}")
+        for value in options["min_rank"]:
+            zone, level = _pair(value)
+            level = _none(level)
+            try:
+                changes.setdefault("min_rank_level", {})[zone] = None if level is None else int(level)
+            except ValueError:
+                raise CommandError(f"nivel inválido: {value!r}")
+        for value in options["clearance"]:
+            zone, name = _pair(value)
+            changes.setdefault("required_clearance", {})[zone] = _none(name)
+        for key, values in (("add_requirements", options["add_requirement"]), ("remove_requirements", options["remove_requirement"])):
+            for value in values:
+                changes.setdefault(key, []).append(list(_pair(value)))
+        if options["revoke_grant"]:
+            changes.setdefault("revoke_grants", []).extend(options["revoke_grant"])
+        if options["revoke_zone_grants"]:
+            changes.setdefault("revoke_zone_grants", []).extend(options["revoke_zone_grants"])
+        if not changes:
+            raise CommandError("No se indicó ningún cambio.")
+
+        start = time.perf_counter()
+        with routers.replica_reads():
+            matrix = PolicyMatrix.load()
+        loaded = time.perf_counter()
+        try:
+            rows = matrix.simulate(changes, show=options["show"], include_unchanged=options["all_zones"])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        done = time.perf_counter()
+
+        if options["json"]:
+            self.stdout.write(json.dumps({"changes": changes, "personnel": len(matrix.people), "zones": rows}, indent=2))
+            return
+        self.stdout.write(f"{len(matrix.people)} personas, {len(matrix.zones)} zonas activas "
+                          f"(carga {loaded - start:.2f}s, simulación {(done - loaded) * 1000:.1f} ms)")
+        if not rows:
+            self.stdout.write("El cambio no modifica el acceso de nadie.")
+            return
+        self.stdout.write(f"{'zona':<16}{'antes':>8}{'después':>9}{'ganan':>8}{'pierden':>9}")
+        for row in rows:
+            self.stdout.write(f"{row['zone']:<16}{row['before']:>8}{row['after']:>9}{row['gained']:>8}{row['lost']:>9}")
+            if options["show"]:
+                if row["gained_sample"]:
+                    self.stdout.write(f"    ganan: {', '.join(row['gained_sample'])}")
+                if row["lost_sample"]:
+                    self.stdout.write(f"    pierden: {', '.join(row['lost_sample'])}")
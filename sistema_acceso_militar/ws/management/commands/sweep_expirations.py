@@ -0,0 +1,105 @@
+# uso
+# daemon: marcar permisos y grants como vencidos justo cuando expiran
+# python manage.py sweep_expirations
+# una sola pasada (p.ej. desde cron)
+# python manage.py sweep_expirations --once
+
+# ws/management/commands/sweep_expirations.py
+import heapq
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ws import changelog
+from ws.models import PersonnelPermission, SpecialAccessGrant
+
+KIND_PERMISSION = "permission"
+KIND_GRANT = "grant"
+
+
+class Command(BaseCommand):
+    help = (
+        "Daemon que desactiva PersonnelPermission (active=False) y vence SpecialAccessGrant "
+        "(status='expired') en su expires_at, usando un min-heap de vencimientos próximos. "
+        "Así las consultas del camino caliente filtran solo por igualdad (active / status)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Hacer una sola pasada y salir.")
+        parser.add_argument("--horizon-hours", type=int, default=24, help="Vencimientos que se cargan en el heap.")
+        parser.add_argument("--refresh", type=int, default=60, help="Cada cuántos segundos revisar el change feed para recargar el heap.")
+        parser.add_argument("--max-sleep", type=float, default=30.0, help="Espera máxima entre revisiones (segundos).")
+
+    def _load_heap(self, horizon):
+        """Vencimientos pendientes hasta now + horizon como (expires_at, kind, id)."""
+        until = timezone.now() + horizon
+        heap = [
+            (exp, KIND_PERMISSION, pk)
+            for pk, exp in PersonnelPermission.objects.filter(
+                active=True, expires_at__isnull=False, expires_at__lte=until
+            ).values_list("id", "expires_at")
+        ]
+        heap += [
+            (exp, KIND_GRANT, pk)
+            for pk, exp in SpecialAccessGrant.objects.filter(
+                status=SpecialAccessGrant.STATUS_ACTIVE, expires_at__isnull=False, expires_at__lte=until
+            ).values_list("id", "expires_at")
+        ]
+        heapq.heapify(heap)
+        return heap
+
+    def _sweep(self, heap):
+        """Saca del heap todo lo vencido y lo actualiza en lote."""
+        now = timezone.now()
+        due = {KIND_PERMISSION: [], KIND_GRANT: []}
+        while heap and heap[0][0] <= now:
+            _, kind, pk = heapq.heappop(heap)
+            due[kind].append(pk)
+        # se vuelve a comprobar expires_at por si se extendió mientras estaba en el heap;
+        # update() deja el cambio en el change feed e invalida las cachés
+        perms = 0
+        grants = 0
+        if due[KIND_PERMISSION]:
+            perms = PersonnelPermission.objects.filter(
+                id__in=due[KIND_PERMISSION], active=True, expires_at__lte=now
+            ).update(active=False)
+        if due[KIND_GRANT]:
+            grants = SpecialAccessGrant.objects.filter(
+                id__in=due[KIND_GRANT], status=SpecialAccessGrant.STATUS_ACTIVE, expires_at__lte=now
+            ).update(status=SpecialAccessGrant.STATUS_EXPIRED)
+        if perms or grants:
+            self.stdout.write(f"{now.isoformat()} vencidos: {perms} permisos, {grants} grants")
+        return perms, grants
+
+    def handle(self, *args, **options):
+        horizon = timedelta(hours=options["horizon_hours"])
+        refresh = options["refresh"]
+        max_sleep = options["max_sleep"]
+
+        # la primera pasada cubre todo lo que ya venció (incluye lo anterior al daemon)
+        heap = self._load_heap(horizon)
+        self._sweep(heap)
+        if options["once"]:
+            return
+
+        checked_at = loaded_at = time.monotonic()
+        seen_version = changelog.latest_version()
+        self.stdout.write(self.style.SUCCESS(f"Sweeper iniciado con {len(heap)} vencimientos en el heap"))
+        while True:
+            # recargar si hubo cambios de política (nuevos permisos/grants o fechas modificadas)
+            # o si pasó medio horizonte: el horizonte avanza con el tiempo
+            now_m = time.monotonic()
+            if now_m - checked_at >= refresh:
+                checked_at = now_m
+                version = changelog.latest_version()
+                if version != seen_version or now_m - loaded_at >= horizon.total_seconds() / 2:
+                    heap = self._load_heap(horizon)
+                    seen_version = version
+                    loaded_at = now_m
+            self._sweep(heap)
+            wait = max_sleep
+            if heap:
+                wait = min(wait, max(0.0, (heap[0][0] - timezone.now()).total_seconds()))
+            time.sleep(min(wait, refresh))
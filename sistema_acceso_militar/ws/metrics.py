@@ -0,0 +1,177 @@
+# ws/metrics.py
+"""
+Métricas de rendimiento por petición.
+
+MetricsMiddleware mide cada petición y la atribuye a la vista (nombre de la
+url): histograma de latencia por vista/método/status, y cantidad y tiempo de
+las consultas SQL. Se publican en /metrics (formato de texto de Prometheus)
+y, por petición, en la cabecera Server-Timing (total, db) para verlas desde
+el navegador o el gate.
+
+Los contadores viven en memoria del proceso: con varios workers cada uno
+expone los suyos (Prometheus los suma por instancia).
+"""
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+METRICS_LATENCY_BUCKETS = tuple(getattr(
+    settings, "METRICS_LATENCY_BUCKETS", (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+))
+METRICS_SERVER_TIMING = getattr(settings, "METRICS_SERVER_TIMING", True)
+
+# componente -> (métrica de cantidad, métrica de segundos, descripción)
+COMPONENTS = {
+    "db": ("db_queries_total", "db_query_seconds_total", "consultas SQL"),
+}
+
+BACKGROUND_VIEW = "<background>"
+UNRESOLVED_VIEW = "<unresolved>"
+
+# tiempos del request en curso: componente -> [cantidad, segundos]
+_current = ContextVar("ws_metrics_request", default=None)
+
+
+class Registry:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._latency = {}   # (view, method, status) -> [contadores por bucket..., suma, cantidad]
+        self._components = {}  # (componente, view) -> [cantidad, segundos]
+
+    def observe_request(self, view, method, status, seconds, timings):
+        with self._lock:
+            row = self._latency.get((view, method, status))
+            if row is None:
+                row = self._latency[(view, method, status)] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    row[i] += 1
+            row[-2] += seconds
+            row[-1] += 1
+            for component, (count, secs) in timings.items():
+                self._add(component, view, count, secs)
+
+    def observe_component(self, component, view, count, seconds):
+        with self._lock:
+            self._add(component, view, count, seconds)
+
+    def _add(self, component, view, count, seconds):
+        total = self._components.setdefault((component, view), [0, 0.0])
+        total[0] += count
+        total[1] += seconds
+
+    def render(self):
+        """Texto de exposición de Prometheus (version 0.0.4)."""
+        with self._lock:
+            latency = {k: list(v) for k, v in self._latency.items()}
+            components = {k: list(v) for k, v in self._components.items()}
+        lines = [
+            "# HELP http_request_duration_seconds Latencia de las peticiones por vista.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (view, method, status), row in sorted(latency.items()):
+            labels = f'view="{_escape(view)}",method="{method}",status="{status}"'
+            for bound, count in zip(self.buckets, row):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {row[-1]}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {row[-2]}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {row[-1]}")
+        for component, (count_name, seconds_name, desc) in COMPONENTS.items():
+            rows = sorted((view, v) for (c, view), v in components.items() if c == component)
+            lines.append(f"# HELP {count_name} Cantidad de {desc} por vista.")
+            lines.append(f"# TYPE {count_name} counter")
+            for view, (count, _) in rows:
+                lines.append(f'{count_name}{{view="{_escape(view)}"}} {count}')
+            lines.append(f"# HELP {seconds_name} Tiempo en {desc} por vista.")
+            lines.append(f"# TYPE {seconds_name} counter")
+            for view, (_, seconds) in rows:
+                lines.append(f'{seconds_name}{{view="{_escape(view)}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._latency = {}
+            self._components = {}
+
+
+registry = Registry(METRICS_LATENCY_BUCKETS)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def observe(component, seconds, count=1):
+    """Suma tiempo de un componente al request en curso (o a <background> si no hay)."""
+    timings = _current.get()
+    if timings is None:
+        registry.observe_component(component, BACKGROUND_VIEW, count, seconds)
+        return
+    total = timings.setdefault(component, [0, 0.0])
+    total[0] += count
+    total[1] += seconds
+
+
+@contextmanager
+def timed(component):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(component, time.perf_counter() - start)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    with timed("db"):
+        return execute(sql, params, many, context)
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return UNRESOLVED_VIEW
+    return match.view_name or match.route or UNRESOLVED_VIEW
+
+
+def server_timing(total, timings):
+    parts = [f"total;dur={total * 1000:.1f}"]
+    for component, (count, seconds) in timings.items():
+        desc = COMPONENTS.get(component, (None, None, component))[2]
+        parts.append(f'{component};dur={seconds * 1000:.1f};desc="{count} {desc}"')
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Mide cada petición; va primero en MIDDLEWARE para incluir a los demás."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {}
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(_sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        registry.observe_request(_view_label(request), request.method, response.status_code, total, timings)
+        if METRICS_SERVER_TIMING:
+            response["Server-Timing"] = server_timing(total, timings)
+        return response
+
+
+def metrics_view(request):
+    """GET /metrics"""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
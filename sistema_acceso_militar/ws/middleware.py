@@ -0,0 +1,71 @@
+# ws/middleware.py
+import time
+
+from . import changelog, routers
+
+PIN_COOKIE = "ws_primary_pin"
+
+
+def replica_safe(view):
+    """True si la vista se marcó replica_safe (POST que solo lee, p.ej. /access-info/bulk/)."""
+    return bool(getattr(getattr(view, "view_class", view), "replica_safe", False))
+
+
+class ReadYourWritesMiddleware:
+    """
+    Fija a la primaria las peticiones que escriben (métodos no seguros) y,
+    durante REPLICA_PIN_SECONDS, las siguientes de la misma sesión (cookie),
+    para que quien acaba de escribir no lea de una réplica atrasada.
+
+    Las vistas con replica_safe = True reciben POST sin escribir en la base:
+    no se fijan por el método (sí por la cookie, o si al final escriben) y
+    sus replica_reads() van a las réplicas.
+    """
+
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _cookie_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def __call__(self, request):
+        pinned = request.method not in self.SAFE_METHODS or self._cookie_pinned(request)
+        tokens = routers.begin_request(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(tokens)
+        if wrote and routers.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + routers.REPLICA_PIN_SECONDS),
+                max_age=routers.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in self.SAFE_METHODS and replica_safe(view_func) and not self._cookie_pinned(request):
+            routers.release_method_pin()
+        return None
+
+
+class ChangedByMiddleware:
+    """
+    Deja el usuario de la petición para la columna changed_by del change feed
+    (ws/changelog.py). Va después de AuthenticationMiddleware; el usuario se
+    resuelve a personnel solo si la petición cambia alguna política.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = changelog.begin_actor(user=getattr(request, "user", None))
+        try:
+            return self.get_response(request)
+        finally:
+            changelog.end_actor(token)
@@ -0,0 +1,50 @@
+# Índices compuestos para las consultas del camino caliente (evaluate_access,
+# AccessInfoView y sweep_expirations). Las tablas de ws se crean con
+# esquema+tuplas.sql, fuera del estado de migraciones, así que los índices se
+# crean aquí directamente y solo si no existen.
+
+from django.db import migrations
+
+INDEXES = [
+    ("personnel_permissions", "idx_pp_person_active_exp", ["personnel_id", "active", "expires_at", "permission_id"]),
+    ("personnel_permissions", "idx_pp_active_expires", ["active", "expires_at"]),
+    ("special_access_grants", "idx_sag_zone_person_status", ["zone_id", "personnel_id", "status", "expires_at"]),
+    ("special_access_grants", "idx_sag_person_status", ["personnel_id", "status", "expires_at"]),
+    ("special_access_grants", "idx_sag_status_expires", ["status", "expires_at"]),
+    ("badges", "idx_badge_status_code", ["status", "badge_code"]),
+]
+
+
+def _existing(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        return schema_editor.connection.introspection.get_constraints(cursor, table)
+
+
+def create_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for table, name, columns in INDEXES:
+        if name in _existing(schema_editor, table):
+            continue
+        schema_editor.execute("CREATE INDEX %s ON %s (%s)" % (qn(name), qn(table), ", ".join(qn(c) for c in columns)))
+
+
+def drop_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for table, name, columns in INDEXES:
+        if name not in _existing(schema_editor, table):
+            continue
+        if schema_editor.connection.vendor == "mysql":
+            schema_editor.execute("DROP INDEX %s ON %s" % (qn(name), qn(table)))
+        else:
+            schema_editor.execute("DROP INDEX %s" % qn(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ws', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
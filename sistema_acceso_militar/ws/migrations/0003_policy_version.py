@@ -0,0 +1,46 @@
+# Secuencia de versiones del change feed (ws/changelog.py). Como en 0002, las
+# tablas de ws vienen de esquema+tuplas.sql: en una base creada con una versión
+# anterior del script la tabla se crea aquí, arrancando desde la última versión
+# ya registrada en audit_policy_changes.
+
+from django.db import migrations
+
+TABLE = "audit_policy_version"
+
+
+def create_sequence(apps, schema_editor):
+    connection = schema_editor.connection
+    qn = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+    if TABLE not in tables:
+        schema_editor.execute(
+            "CREATE TABLE %s (id SMALLINT NOT NULL PRIMARY KEY, version BIGINT NOT NULL DEFAULT 0)" % qn(TABLE)
+        )
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM %s" % qn(TABLE))
+        if cursor.fetchone()[0]:
+            return
+        version = 0
+        if "audit_policy_changes" in tables:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM %s" % qn("audit_policy_changes"))
+            version = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO %s (id, version) VALUES (1, %%s)" % qn(TABLE), [version])
+
+
+def drop_sequence(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        tables = schema_editor.connection.introspection.table_names(cursor)
+    if TABLE in tables:
+        schema_editor.execute("DROP TABLE %s" % schema_editor.quote_name(TABLE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ws', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -1,9 +1,68 @@
 # models.py
-from django.db import models
+from django.db import models, router, transaction
 from django.utils import timezone
 
 
-class Rank(models.Model):
+class PolicyQuerySet(models.QuerySet):
+    """
+    QuerySet de los modelos de política: update(), bulk_create() y
+    bulk_update() no disparan señales, así que registran ellos mismos el
+    cambio en audit_policy_changes dentro de la misma transacción.
+    (delete() ya emite post_delete por objeto.)
+    """
+
+    def _log_rows(self):
+        from .changelog import POLICY_CHANGES_BULK_ROW_LIMIT
+        fields = ["pk"] + (["personnel_id"] if any(f.attname == "personnel_id" for f in self.model._meta.concrete_fields) else [])
+        rows = list(self.values(*fields)[:POLICY_CHANGES_BULK_ROW_LIMIT + 1])
+        return rows if len(rows) <= POLICY_CHANGES_BULK_ROW_LIMIT else None
+
+    def update(self, **kwargs):
+        from .changelog import log_bulk, policy_values
+        with transaction.atomic(using=self.db):
+            rows = self._log_rows()
+            count = super().update(**kwargs)
+            # "fields" nombra todo lo que cambió; "set" solo lleva los valores que pueden ir al feed
+            log_bulk(self.model, "update", rows, count,
+                     {"set": policy_values(self.model, kwargs), "fields": list(kwargs)}, using=self.db)
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .changelog import log_bulk, rows_for
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            log_bulk(self.model, "create", rows_for(objs), len(objs), using=self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        from .changelog import log_bulk, rows_for
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            # el bulk_update de Django llama a update() por lote: con un QuerySet
+            # común no se registra cada lote otra vez
+            count = models.QuerySet(self.model, using=self._db).bulk_update(objs, fields, *args, **kwargs)
+            log_bulk(self.model, "update", rows_for(objs), len(objs), {"fields": list(fields)}, using=self.db)
+        return count
+
+
+class PolicyModel(models.Model):
+    """
+    Base de los modelos de política: save() corre en una transacción para que
+    la fila de audit_policy_changes (escrita por post_save) se confirme o
+    revierta junto con el cambio.
+    """
+    objects = PolicyQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Rank(PolicyModel):
     id = models.AutoField(primary_key=True)
     code = models.CharField(max_length=16, unique=True)  # e.g. 'CPT'
     name = models.CharField(max_length=64)
@@ -19,7 +78,7 @@ class Rank(models.Model):
         return f"{self.code} - {self.name}"
 
 
-class ClearanceLevel(models.Model):
+class ClearanceLevel(PolicyModel):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=50, unique=True)  # e.g. 'CONFIDENTIAL'
     level_value = models.PositiveSmallIntegerField()
@@ -34,7 +93,38 @@ class ClearanceLevel(models.Model):
         return self.name
 
 
-class Unit(models.Model):
+class UnitQuerySet(PolicyQuerySet):
+    """
+    update()/bulk_create()/bulk_update() no emiten señales: si tocan la
+    jerarquía se reconstruye la tabla unit_closure en la misma transacción.
+    """
+
+    def _rebuild_closure(self):
+        from .hierarchy import rebuild
+        rebuild(using=self.db)
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            count = super().update(**kwargs)
+            if "parent_unit" in kwargs or "parent_unit_id" in kwargs:
+                self._rebuild_closure()
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            self._rebuild_closure()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            count = super().bulk_update(objs, fields, *args, **kwargs)
+            if "parent_unit" in fields or "parent_unit_id" in fields:
+                self._rebuild_closure()
+        return count
+
+
+class Unit(PolicyModel):
     id = models.AutoField(primary_key=True)
     code = models.CharField(max_length=20, unique=True)  # 'U-005'
     name = models.CharField(max_length=128)
@@ -44,6 +134,8 @@ class Unit(models.Model):
     location = models.CharField(max_length=128, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = UnitQuerySet.as_manager()
+
     class Meta:
         db_table = "units"
 
@@ -51,7 +143,32 @@ class Unit(models.Model):
         return f"{self.code} - {self.name}"
 
 
-class Personnel(models.Model):
+class UnitClosure(models.Model):
+    """
+    Tabla de clausura de la jerarquía de unidades: una fila por cada par
+    (ancestro, descendiente), incluida la propia unidad con depth=0.
+    "Todo lo que cuelga de esta brigada" es un único join por ancestor_id,
+    sin importar la profundidad. La mantiene ws/hierarchy.py.
+    """
+    id = models.AutoField(primary_key=True)
+    ancestor = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name="descendant_links")
+    descendant = models.ForeignKey(Unit, on_delete=models.CASCADE, related_name="ancestor_links")
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        db_table = "unit_closure"
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="uk_unit_closure")
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"], name="idx_unit_closure_desc"),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
+class Personnel(PolicyModel):
     STATUS_ACTIVE = "active"
     STATUS_SUSPENDED = "suspended"
     STATUS_RETIRED = "retired"
@@ -93,7 +210,7 @@ class Personnel(models.Model):
         return f"{self.service_number} - {self.first_name} {self.last_name}"
 
 
-class Permission(models.Model):
+class Permission(PolicyModel):
     id = models.AutoField(primary_key=True)
     code = models.CharField(max_length=50, unique=True)  # e.g. 'ACCESS_SENSITIVE_SITE'
     name = models.CharField(max_length=100)
@@ -107,7 +224,7 @@ class Permission(models.Model):
         return self.code
 
 
-class PersonnelPermission(models.Model):
+class PersonnelPermission(PolicyModel):
     id = models.AutoField(primary_key=True)
     personnel = models.ForeignKey(Personnel, on_delete=models.CASCADE, related_name="permissions_assigned")
     permission = models.ForeignKey(Permission, on_delete=models.CASCADE, related_name="personnel_assignments")
@@ -129,12 +246,18 @@ class PersonnelPermission(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["personnel", "permission"], name="uk_person_perm")
         ]
+        indexes = [
+            # permisos activos de una persona (cubre también permission_id)
+            models.Index(fields=["personnel", "active", "expires_at", "permission"], name="idx_pp_person_active_exp"),
+            # sweep_expirations
+            models.Index(fields=["active", "expires_at"], name="idx_pp_active_expires"),
+        ]
 
     def __str__(self):
         return f"{self.personnel} → {self.permission} ({'active' if self.active else 'inactive'})"
 
 
-class RestrictedZone(models.Model):
+class RestrictedZone(PolicyModel):
     id = models.AutoField(primary_key=True)
     code = models.CharField(max_length=32, unique=True)  # 'CZ-01'
     name = models.CharField(max_length=120)
@@ -158,7 +281,7 @@ class RestrictedZone(models.Model):
         return f"{self.code} - {self.name}"
 
 
-class ZonePermissionRequirement(models.Model):
+class ZonePermissionRequirement(PolicyModel):
     id = models.AutoField(primary_key=True)
     zone = models.ForeignKey(RestrictedZone, on_delete=models.CASCADE, related_name="permission_requirements")
     permission = models.ForeignKey(Permission, on_delete=models.CASCADE, related_name="zone_requirements")
@@ -175,7 +298,7 @@ class ZonePermissionRequirement(models.Model):
         return f"{self.zone.code} requires {self.permission.code} ({'required' if self.required else 'optional'})"
 
 
-class SpecialAccessGrant(models.Model):
+class SpecialAccessGrant(PolicyModel):
     STATUS_ACTIVE = "active"
     STATUS_REVOKED = "revoked"
     STATUS_EXPIRED = "expired"
@@ -204,14 +327,20 @@ class SpecialAccessGrant(models.Model):
     class Meta:
         db_table = "special_access_grants"
         indexes = [
-            models.Index(fields=["zone", "personnel"], name="idx_sag_zone_personnel")
+            models.Index(fields=["zone", "personnel"], name="idx_sag_zone_personnel"),
+            # grant activo para (zona, persona) en evaluate_access
+            models.Index(fields=["zone", "personnel", "status", "expires_at"], name="idx_sag_zone_person_status"),
+            # grants activos de una persona (caché de AccessInfoView)
+            models.Index(fields=["personnel", "status", "expires_at"], name="idx_sag_person_status"),
+            # sweep_expirations
+            models.Index(fields=["status", "expires_at"], name="idx_sag_status_expires"),
         ]
 
     def __str__(self):
         return f"Grant {self.id}: {self.personnel} → {self.zone.code} ({self.status})"
 
 
-class Badge(models.Model):
+class Badge(PolicyModel):
     STATUS_ISSUED = "issued"
     STATUS_REVOKED = "revoked"
     STATUS_LOST = "lost"
@@ -231,8 +360,61 @@ class Badge(models.Model):
     class Meta:
         db_table = "badges"
         indexes = [
-            models.Index(fields=["personnel"], name="idx_badge_personnel")
+            models.Index(fields=["personnel"], name="idx_badge_personnel"),
+            # conjunto de badges revocados/perdidos
+            models.Index(fields=["status", "badge_code"], name="idx_badge_status_code"),
         ]
 
     def __str__(self):
         return self.badge_code
+
+
+class PolicyVersion(models.Model):
+    """
+    Secuencia de versiones de audit_policy_changes (una sola fila, id=1).
+    Quien registra un cambio la bloquea (select_for_update) hasta su commit:
+    las versiones se asignan y se hacen visibles en el mismo orden, así un
+    consumidor que ve la versión N no puede recibir después una menor.
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "audit_policy_version"
+
+
+class PolicyChange(models.Model):
+    """
+    Log append-only de cambios de política. El id es la versión (la asigna
+    PolicyVersion, no el auto_increment): crece en orden de commit y los
+    consumidores piden /ws/policy/changes/?since=<id>.
+    entity_id NULL significa "cambió toda la entidad" (operaciones masivas).
+    """
+    ACTION_CREATE = "create"
+    ACTION_UPDATE = "update"
+    ACTION_DELETE = "delete"
+
+    id = models.BigAutoField(primary_key=True)
+    changed_by = models.ForeignKey(
+        Personnel,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="policy_changes",
+        db_column="changed_by"
+    )
+    changed_at = models.DateTimeField(auto_now_add=True)
+    entity = models.CharField(max_length=64)  # p.ej. 'restricted_zones'
+    entity_id = models.IntegerField(null=True, blank=True)
+    action = models.CharField(max_length=32)
+    diff = models.TextField(null=True, blank=True)  # JSON con los valores de la fila
+
+    class Meta:
+        db_table = "audit_policy_changes"
+        indexes = [
+            models.Index(fields=["entity", "entity_id"], name="idx_audit_entity")
+        ]
+
+    def __str__(self):
+        return f"v{self.id} {self.action} {self.entity}#{self.entity_id}"
+
@@ -0,0 +1,74 @@
+# ws/occupancy.py
+"""
+Ocupación en tiempo real por zona.
+
+Un contador por zona en el alias OCCUPANCY_CACHE_ALIAS de settings.CACHES,
+modificado con incr/decr atómicos del backend: ninguna consulta COUNT por
+escaneo. Con varios workers el alias debe ser compartido (redis/memcached);
+el locmem por defecto sirve como sustituto local de un solo proceso.
+
+  - entrada: reserve_entry() incrementa y, si se pasa de la capacidad,
+    deshace el incremento y rechaza (dos gates no pueden llenar el último lugar).
+  - salida: record_exit() decrementa sin bajar de 0.
+  - reconciliación: set_occupancy() con los valores calculados a partir del
+    log de intentos en Mongo (historial: reconcile_occupancy).
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+OCCUPANCY_CACHE_ALIAS = getattr(settings, "OCCUPANCY_CACHE_ALIAS", "default")
+
+OCCUPANCY_KEY = "ws:occupancy:zone:{}"
+
+
+def _backend():
+    return caches[OCCUPANCY_CACHE_ALIAS]
+
+
+def _key(zone_id):
+    return OCCUPANCY_KEY.format(zone_id)
+
+
+def _incr(zone_id, delta):
+    backend = _backend()
+    key = _key(zone_id)
+    try:
+        return backend.incr(key, delta)
+    except ValueError:
+        # la clave no existe: se crea en 0 (add es atómico) y se reintenta
+        backend.add(key, 0, None)
+        return backend.incr(key, delta)
+
+
+def get_occupancy(zone_id):
+    return _backend().get(_key(zone_id)) or 0
+
+
+def get_many(zone_ids):
+    """{zone_id: ocupación} en un solo get_many."""
+    keys = {_key(z): z for z in zone_ids}
+    found = _backend().get_many(list(keys))
+    return {z: found.get(k) or 0 for k, z in keys.items()}
+
+
+def reserve_entry(zone_id, capacity=None):
+    """
+    Registra una entrada. Devuelve (aceptada, ocupación). Si la zona tiene
+    capacidad y ya está llena, no cambia el contador.
+    """
+    value = _incr(zone_id, 1)
+    if capacity is not None and value > capacity:
+        return False, _incr(zone_id, -1)
+    return True, value
+
+
+def record_exit(zone_id):
+    value = _incr(zone_id, -1)
+    if value < 0:
+        # salida sin entrada registrada (p.ej. antes de reconciliar)
+        value = _incr(zone_id, -value)
+    return value
+
+
+def set_occupancy(zone_id, value):
+    _backend().set(_key(zone_id), max(0, int(value)), None)
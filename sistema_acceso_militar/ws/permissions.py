@@ -0,0 +1,47 @@
+# ws/permissions.py
+"""
+Permisos de DRF para los endpoints que usan gates y servicios (no personas).
+
+IsServiceOrStaff deja pasar:
+  - a quien manda "Authorization: Bearer <token>" con uno de SERVICE_TOKENS
+    (un token por gate o servicio, p.ej. historial, para poder revocarlos de a uno),
+  - o a un usuario staff con sesión (admin, pruebas desde el navegador).
+
+Sin SERVICE_TOKENS configurados no pasa ningún token: el endpoint queda solo
+para staff (falla cerrado).
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+SERVICE_TOKENS = getattr(settings, "SERVICE_TOKENS", ())
+
+
+def service_token(request):
+    """Token Bearer de la petición, o None."""
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+def has_service_token(request):
+    token = service_token(request)
+    if token is None:
+        return False
+    # se comparan todos para no filtrar cuál coincide por tiempo de respuesta
+    token = token.encode()
+    matches = [hmac.compare_digest(token, expected.encode()) for expected in SERVICE_TOKENS if expected]
+    return any(matches)
+
+
+class IsServiceOrStaff(BasePermission):
+    message = "service token or staff session required"
+
+    def has_permission(self, request, view):
+        if has_service_token(request):
+            return True
+        user = getattr(request, "user", None)
+        return bool(user is not None and user.is_authenticated and user.is_staff)
@@ -0,0 +1,227 @@
+# ws/profiling.py
+"""
+Captura de perfiles por petición (cProfile) bajo demanda.
+
+ProfilingMiddleware perfila una petición cuando:
+  - trae la cabecera X-Profile o el parámetro ?profile=1 y quien la hace es
+    staff (sesión) o manda PROFILE_TOKEN como valor; la respuesta lleva
+    X-Profile-Id con el id de la captura.
+  - o le toca por muestreo: 1 de cada N peticiones (N = PROFILE_SAMPLE_EVERY,
+    0 desactiva). N se puede cambiar en caliente desde la página de perfiles;
+    el valor queda en caches[PROFILE_CACHE_ALIAS] y cada worker lo relee cada
+    pocos segundos. Con un alias locmem el cambio solo llega al worker que
+    atendió la página (la página lo avisa); con varios workers el alias debe
+    ser compartido (redis/memcached).
+
+Cada captura es un .prof (pstats / snakeviz) y un .json con la petición
+(ruta, vista, status, duración) en PROFILE_DIR; se conservan las últimas
+PROFILE_KEEP. ws/admin/profiles/ (solo staff) las lista de la más lenta a la
+más rápida.
+
+Este módulo y historial/profiling.py son el mismo código: cada proyecto se despliega
+solo, sin dependencias entre ellos. Un cambio en uno va también al otro.
+"""
+import cProfile
+import hmac
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.shortcuts import render
+
+PROFILE_DIR = getattr(settings, "PROFILE_DIR", os.path.join(settings.BASE_DIR, "profiles"))
+PROFILE_KEEP = getattr(settings, "PROFILE_KEEP", 200)
+PROFILE_SAMPLE_EVERY = getattr(settings, "PROFILE_SAMPLE_EVERY", 0)
+PROFILE_TOKEN = getattr(settings, "PROFILE_TOKEN", None)
+PROFILE_PARAM = "profile"
+# alias de settings.CACHES donde vive el N del muestreo (compartido entre workers)
+PROFILE_CACHE_ALIAS = getattr(settings, "PROFILE_CACHE_ALIAS", "default")
+
+SAMPLE_EVERY_CACHE_KEY = "ws:profiling:sample_every"
+_SAMPLE_EVERY_RECHECK_SECONDS = 5
+
+_ID_RE = re.compile(r"^[\w.-]+$")
+_counter = itertools.count(1)
+_sample_every = (0.0, PROFILE_SAMPLE_EVERY)  # (leído en, valor)
+
+
+def sample_every():
+    """N del muestreo 1-en-N: el del caché (página de perfiles) o PROFILE_SAMPLE_EVERY."""
+    global _sample_every
+    read_at, value = _sample_every
+    now = time.monotonic()
+    if now - read_at >= _SAMPLE_EVERY_RECHECK_SECONDS:
+        value = caches[PROFILE_CACHE_ALIAS].get(SAMPLE_EVERY_CACHE_KEY, PROFILE_SAMPLE_EVERY)
+        _sample_every = (now, value)
+    return value
+
+
+def set_sample_every(value):
+    global _sample_every
+    caches[PROFILE_CACHE_ALIAS].set(SAMPLE_EVERY_CACHE_KEY, value, None)
+    _sample_every = (time.monotonic(), value)
+
+
+def sample_every_is_local():
+    """True si el muestreo vive en un caché de este proceso (locmem): no se comparte entre workers."""
+    return isinstance(caches[PROFILE_CACHE_ALIAS], LocMemCache)
+
+
+def _requested(request):
+    asked = request.META.get("HTTP_X_PROFILE") or request.GET.get(PROFILE_PARAM)
+    if not asked:
+        return False
+    if PROFILE_TOKEN and hmac.compare_digest(asked, PROFILE_TOKEN):
+        return True
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_staff)
+
+
+def _trigger(request):
+    if _requested(request):
+        return "requested"
+    every = sample_every()
+    if every and next(_counter) % every == 0:
+        return "sample"
+    return None
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+def save_capture(profiler, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    capture_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, capture_id + ".prof"))
+    with open(os.path.join(PROFILE_DIR, capture_id + ".json"), "w") as fh:
+        json.dump({"id": capture_id, **meta}, fh)
+    _prune()
+    return capture_id
+
+
+def _prune():
+    metas = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for name in metas[:-PROFILE_KEEP] if PROFILE_KEEP else []:
+        for ext in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-5] + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures():
+    try:
+        names = [f for f in os.listdir(PROFILE_DIR) if f.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    captures = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as fh:
+                captures.append(json.load(fh))
+        except (OSError, ValueError):
+            # borrado por otro worker o a medio escribir
+            continue
+    return captures
+
+
+def _prof_path(capture_id):
+    path = os.path.join(PROFILE_DIR, capture_id + ".prof")
+    if not _ID_RE.match(capture_id) or not os.path.exists(path):
+        raise Http404("No existe ese perfil.")
+    return path
+
+
+class ProfilingMiddleware:
+    """Va después de AuthenticationMiddleware (necesita request.user)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = _trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+        capture_id = save_capture(profiler, {
+            "at": time.time(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": _view_name(request),
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "trigger": trigger,
+        })
+        if trigger == "requested":
+            response["X-Profile-Id"] = capture_id
+        return response
+
+
+@staff_member_required
+def profiles_index(request):
+    """
+    GET  ws/admin/profiles/?order=recent   capturas (por defecto las más lentas primero)
+    POST ws/admin/profiles/ sample_every=N  cambia el muestreo sin reiniciar (0 lo apaga)
+    """
+    if request.method == "POST":
+        try:
+            value = max(0, int(request.POST.get("sample_every", 0)))
+        except ValueError:
+            value = 0
+        set_sample_every(value)
+        return HttpResponseRedirect(request.path)
+    order = request.GET.get("order")
+    key = (lambda c: c.get("at", 0)) if order == "recent" else (lambda c: c.get("duration_ms", 0))
+    captures = sorted(list_captures(), key=key, reverse=True)
+    for c in captures:
+        c["at_display"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(c.get("at", 0)))
+    return render(request, "ws/profiles.html", {
+        "captures": captures,
+        "order": order,
+        "sample_every": sample_every(),
+        "sample_every_local": sample_every_is_local(),
+        "profile_dir": PROFILE_DIR,
+    })
+
+
+@staff_member_required
+def profile_detail(request, capture_id):
+    """GET ws/admin/profiles/<id>/?sort=cumulative&limit=40  (?download=1 baja el .prof)"""
+    path = _prof_path(capture_id)
+    if request.GET.get("download"):
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=capture_id + ".prof")
+    sort = request.GET.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "ncalls"):
+        sort = "cumulative"
+    try:
+        limit = int(request.GET.get("limit", 40))
+    except ValueError:
+        limit = 40
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return render(request, "ws/profile_detail.html", {
+        "capture_id": capture_id,
+        "sort": sort,
+        "stats": out.getvalue(),
+    })
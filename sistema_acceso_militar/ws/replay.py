@@ -0,0 +1,187 @@
+# ws/replay.py
+"""
+Re-evaluación masiva de intentos guardados contra la política actual.
+
+Como ws/offline.py, este módulo no depende de Django: los procesos del pool
+cargan el bundle de políticas una vez (init_worker) y evalúan con
+OfflinePolicy, que aplica rules.evaluate igual que evaluate_access. El
+proceso principal solo reparte trabajo:
+
+  - dump de mongodump (.bson): se recorre el archivo leyendo únicamente los
+    largos de cada documento y se reparten rangos de bytes; cada proceso lee
+    y decodifica su rango.
+  - MongoDB: find_raw_batches() con proyección de los pocos campos que hacen
+    falta; cada lote viaja a un proceso como bytes BSON sin decodificar.
+
+Los documentos se decodifican como RawBSONDocument: ws_response y el resto de
+los subdocumentos que no se leen nunca se decodifican. Cada proceso guarda
+el resultado por (persona, zona), así que escanear mil veces a la misma
+persona en la misma zona es una evaluación.
+
+La capacidad no se re-evalúa (depende de la ocupación de ese momento): un
+intento guardado como zone_full se compara sin ella y se cuenta aparte.
+"""
+import mmap
+import struct
+from collections import Counter
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+from .offline import OfflinePolicy
+
+RAW = CodecOptions(document_class=RawBSONDocument)
+PROJECTION = {
+    "personnel": 1,
+    "personnel_full.service_number": 1,
+    "personnel_full.badge_id": 1,
+    "zone.code": 1,
+    "validation.allowed": 1,
+    "validation.reason": 1,
+    "attempt.timestamp": 1,
+}
+_LENGTH = struct.Struct("<i")
+_MEMO_MAX = 200000
+
+_policy = None
+_now = None
+_memo = {}
+
+
+def init_worker(bundle_bytes, now):
+    """Initializer del pool: decodifica el bundle una vez por proceso."""
+    global _policy, _now, _memo
+    _policy = OfflinePolicy.from_bytes(bundle_bytes)
+    _now = now
+    _memo = {}
+
+
+def dump_ranges(path, docs_per_chunk, limit=None):
+    """(inicio, fin) en bytes de bloques de docs_per_chunk documentos del .bson."""
+    with open(path, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # archivo vacío
+            return
+        try:
+            size = len(mm)
+            pos = start = 0
+            count = total = 0
+            while pos < size and (limit is None or total < limit):
+                pos += _LENGTH.unpack_from(mm, pos)[0]
+                count += 1
+                total += 1
+                if count == docs_per_chunk:
+                    yield start, pos
+                    start, count = pos, 0
+            if count:
+                yield start, pos
+        finally:
+            mm.close()
+
+
+def count_documents(data):
+    """Documentos en un bloque de BSON concatenado (sin decodificarlos)."""
+    pos = count = 0
+    while pos < len(data):
+        pos += _LENGTH.unpack_from(data, pos)[0]
+        count += 1
+    return count
+
+
+def _sub(doc, key):
+    try:
+        return doc[key]
+    except KeyError:
+        return None
+
+
+def _failed_checks(result):
+    out = []
+    for e in result["evidence"]:
+        if e.get("passed") is False:
+            if "required" in e:
+                out.append(f"{e['check']} ({e.get('value')} < {e['required']})")
+            else:
+                out.append(e["check"])
+    return out
+
+
+def _evaluate(service_number, badge_id, zone_code):
+    key = (service_number, badge_id, zone_code)
+    found = _memo.get(key)
+    if found is None:
+        result = _policy.evaluate(zone_code, service_number=service_number, badge_id=badge_id, now=_now)
+        if result is None:
+            found = (None, "not_found_now", ())
+        else:
+            found = (result["allowed"], result["reason"], tuple(_failed_checks(result)))
+        if len(_memo) >= _MEMO_MAX:
+            _memo.clear()
+        _memo[key] = found
+    return found
+
+
+def replay_documents(docs, keep_diffs=True):
+    """
+    Compara cada intento con la política cargada. Devuelve
+    (contadores, transiciones, zonas con diferencias, diferencias).
+    """
+    counts = Counter()
+    transitions = Counter()
+    zones = Counter()
+    diffs = []
+    for doc in docs:
+        counts["total"] += 1
+        full = _sub(doc, "personnel_full") or {}
+        service_number = _sub(full, "service_number")
+        badge_id = None if service_number else (_sub(full, "badge_id") or _sub(doc, "personnel"))
+        zone_code = _sub(_sub(doc, "zone") or {}, "code")
+        validation = _sub(doc, "validation") or {}
+        old_allowed = _sub(validation, "allowed")
+        old_reason = _sub(validation, "reason")
+        if not zone_code or not (service_number or badge_id):
+            counts["unusable"] += 1
+            continue
+        if old_reason == "zone_full":
+            counts["capacity_not_replayed"] += 1
+            continue
+        new_allowed, new_reason, failed = _evaluate(service_number, badge_id, zone_code)
+        if new_allowed == old_allowed and new_reason == old_reason:
+            counts["same"] += 1
+            continue
+        if new_allowed is None:
+            # el WS respondería 404: no es una decisión distinta sino un dato que ya no existe
+            counts["not_found_now"] += 1
+        elif new_allowed == old_allowed:
+            counts["reason_changed"] += 1
+        else:
+            counts["gained" if new_allowed else "lost"] += 1
+        transitions[(old_allowed, old_reason, new_allowed, new_reason)] += 1
+        zones[zone_code] += 1
+        if keep_diffs:
+            attempt = _sub(doc, "attempt") or {}
+            diffs.append({
+                "_id": str(_sub(doc, "_id")),
+                "timestamp": str(_sub(attempt, "timestamp")),
+                "personnel": service_number or badge_id,
+                "zone": zone_code,
+                "before": {"allowed": old_allowed, "reason": old_reason},
+                "after": {"allowed": new_allowed, "reason": new_reason, "failed": list(failed)},
+            })
+    return counts, transitions, zones, diffs
+
+
+def replay_dump_range(args):
+    path, start, end, keep_diffs = args
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    return replay_documents(bson.decode_all(data, RAW), keep_diffs)
+
+
+def replay_raw_batch(args):
+    data, keep_diffs = args
+    return replay_documents(bson.decode_all(data, RAW), keep_diffs)
@@ -0,0 +1,126 @@
+# ws/routers.py
+"""
+Router primaria/réplicas para ws.
+
+Todo va a la primaria ('default') salvo las lecturas que se hacen dentro de
+replica_reads(): los caminos calientes de solo lectura (AccessInfoView,
+AccessInfoBulkView, ZoneListAPI, export_policy_bundle,
+generate_access_attempts) las abren explícitamente, así ninguna otra lectura
+puede ver datos atrasados.
+
+  - DATABASE_REPLICAS: alias de settings.DATABASES que son réplicas; cada
+    bloque replica_reads() elige una al azar y lee todo de ella, así un export
+    no mezcla estados de réplicas distintas (agregar réplicas escala las
+    lecturas de los gates). Lista vacía: todo va a la primaria.
+  - escrituras: siempre a la primaria, y marcan la petición como "con
+    escritura" para que ReadYourWritesMiddleware fije a la primaria las
+    siguientes peticiones de esa sesión durante REPLICA_PIN_SECONDS.
+  - dentro de primary_reads() (o con la petición fijada) replica_reads() no
+    tiene efecto.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY_DB = "default"
+DATABASE_REPLICAS = list(getattr(settings, "DATABASE_REPLICAS", []))
+# retraso de replicación que se tolera; ver recently_changed()
+REPLICA_LAG_SECONDS = getattr(settings, "REPLICA_LAG_SECONDS", 5)
+REPLICA_PIN_SECONDS = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+
+# alias de la réplica elegida por el replica_reads() en curso, o None
+_use_replica = ContextVar("ws_use_replica", default=None)
+_pinned = ContextVar("ws_pinned_to_primary", default=False)
+_wrote = ContextVar("ws_wrote_to_primary", default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Las lecturas dentro del bloque van a una réplica (si hay y la petición no está fijada)."""
+    token = _use_replica.set(_use_replica.get() or (random.choice(DATABASE_REPLICAS) if DATABASE_REPLICAS else None))
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    token = _use_replica.set(None)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def recently_changed(*version_tokens):
+    """
+    True si alguna versión de ws/cache.py (tokens time_ns) es más nueva que
+    REPLICA_LAG_SECONDS: una réplica podría no tener todavía ese cambio.
+    """
+    limit = time.time_ns() - int(REPLICA_LAG_SECONDS * 1e9)
+    return any(isinstance(t, int) and t > limit for t in version_tokens)
+
+
+@contextmanager
+def primary_reads_if(condition):
+    if condition:
+        with primary_reads():
+            yield
+    else:
+        yield
+
+
+def reading_from_replica():
+    return _use_replica.get() is not None and not _pinned.get()
+
+
+def begin_request(pinned):
+    """Estado por petición (lo usa ReadYourWritesMiddleware). Devuelve tokens para end_request."""
+    return _pinned.set(pinned), _wrote.set(False), _use_replica.set(None)
+
+
+def release_method_pin():
+    """
+    Quita la fijación por método de la petición en curso (POST de solo lectura,
+    ver ReadYourWritesMiddleware.process_view). Si ya escribió sigue fijada.
+    """
+    if not _wrote.get():
+        _pinned.set(False)
+
+
+def end_request(tokens):
+    wrote = _wrote.get()
+    pinned_token, wrote_token, replica_token = tokens
+    _pinned.reset(pinned_token)
+    _wrote.reset(wrote_token)
+    _use_replica.reset(replica_token)
+    return wrote
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica():
+            return _use_replica.get()
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        _pinned.set(True)
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {PRIMARY_DB, *DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # las réplicas reciben el esquema por replicación
+        if db in DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,77 @@
+# ws/rules.py
+"""
+Reglas de evaluate_access sobre datos planos (sin ORM ni Django), para que la
+vista, la caché de personal y cualquier evaluación fuera de la BD compartan
+exactamente la misma lógica. historial/rules.py es una copia (un cambio en
+uno va también al otro).
+
+  person: {"status", "rank_level", "clearance_level"}
+  zone:   {"min_rank_level", "required_clearance_level",
+           "requires_special_permission", "permission_requirements": [
+               {"permission_id", "required"}, ...], "capacity" (opcional)}
+  perm_ids: ids de permisos asignados y activos
+  grant: dict del special_access activo (id, granted_by, granted_at,
+         expires_at, status, reason) o None
+  occupancy: ocupación actual de la zona (ws/occupancy.py) o None si no se
+         controla la capacidad (p.ej. salidas o gates offline)
+"""
+
+
+def evaluate(person, zone, perm_ids, grant=None, occupancy=None):
+    evidence = []
+    # exists
+    evidence.append({"check": "exists", "passed": True})
+    # status active
+    status_ok = (person["status"] == "active")
+    evidence.append({"check": "status_active", "passed": status_ok})
+    # min rank
+    min_rank = zone["min_rank_level"]
+    rank_level = person["rank_level"]
+    rank_ok = min_rank is None or (rank_level is not None and rank_level >= min_rank)
+    if min_rank is not None:
+        evidence.append({"check": "min_rank", "passed": rank_ok, "value": rank_level, "required": min_rank})
+    # clearance
+    required_clearance = zone["required_clearance_level"]
+    p_cl = person["clearance_level"]
+    clearance_ok = required_clearance is None or (p_cl is not None and p_cl >= required_clearance)
+    if required_clearance is not None:
+        evidence.append({"check": "clearance", "passed": clearance_ok, "value": p_cl, "required": required_clearance})
+    # zone permission requirements
+    matching_permissions = []
+    perm_ok = True
+    for r in zone["permission_requirements"]:
+        if r["required"]:
+            if r["permission_id"] in perm_ids:
+                matching_permissions.append(r["permission_id"])
+            else:
+                perm_ok = False
+    evidence.append({"check": "zone_permission", "passed": perm_ok, "matching_permissions": matching_permissions})
+    # capacity: la zona llena deniega incluso con grant especial
+    capacity = zone.get("capacity")
+    capacity_ok = True
+    if capacity is not None and occupancy is not None:
+        capacity_ok = occupancy < capacity
+        evidence.append({"check": "capacity", "passed": capacity_ok, "value": occupancy, "required": capacity})
+    # special access check (active grant for this zone and personnel)
+    if grant:
+        evidence.append({"check": "special_access_grant", "passed": True, "grant_id": grant["id"]})
+        # override
+        allowed = True
+        reason = "special_grant"
+    else:
+        allowed = status_ok and rank_ok and clearance_ok and perm_ok
+        # decide a reason code for logging
+        if not status_ok:
+            reason = "status_not_active"
+        elif not rank_ok:
+            reason = "rank_too_low"
+        elif not clearance_ok:
+            reason = "clearance_insufficient"
+        elif not perm_ok and zone["requires_special_permission"]:
+            reason = "missing_zone_permission"
+        else:
+            reason = "rank_ok_and_permission" if allowed else "unspecified_denial"
+    if allowed and not capacity_ok:
+        allowed = False
+        reason = "zone_full"
+    return {"allowed": allowed, "reason": reason, "evidence": evidence, "special_access": grant or None}
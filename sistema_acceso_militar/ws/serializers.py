@@ -120,3 +120,19 @@ class ZoneSerializer(serializers.ModelSerializer):
         return out
 
 
+# subárbol de unidades (ver ws/hierarchy.py)
+
+class SubtreeUnitSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    code = serializers.CharField()
+    name = serializers.CharField()
+    parent_unit_id = serializers.IntegerField(allow_null=True)
+    depth = serializers.IntegerField()
+
+class SubtreePersonnelSerializer(serializers.ModelSerializer):
+    rank = RankSerializer()
+    unit = UnitSerializer(allow_null=True)
+
+    class Meta:
+        model = Personnel
+        fields = ("id", "service_number", "badge_id", "first_name", "last_name", "status", "rank", "unit")
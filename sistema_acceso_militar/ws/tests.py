@@ -1,3 +1,496 @@
-from django.test import TestCase
+import ast
+import json
+import unittest
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from itertools import zip_longest
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from . import cache as access_cache
+from . import changelog, hierarchy, routers
+from .cache import BadgeRejected
+from .fastrender import compile_serializer, render_access_info
+from .middleware import PIN_COOKIE, ReadYourWritesMiddleware
+from .models import Badge, Personnel, PolicyChange, Rank, RestrictedZone, Unit, UnitClosure
+from .serializers import AccessInfoSerializer, ValidationSerializer
+from .views import badge_rejected_payload, build_access_info
+
+
+def _person(**overrides):
+    """Registro de personal con la forma de ws/cache.py (_load_personnel)."""
+    person = {
+        "id": 1,
+        "service_number": "SN-1",
+        "badge_id": "B-1",
+        "first_name": "Ana",
+        "last_name": "Pérez",
+        "status": "active",
+        "rank": {"id": 3, "code": "CPT", "name": "Capitán", "level": 5},
+        "unit": {"id": 2, "code": "U-2", "name": "Batallón 2"},
+        "clearance": {"id": 1, "name": "Secreto", "level_value": 3},
+        "rank_level": 5,
+        "clearance_level": 3,
+        "permissions": [
+            {"id": 10, "code": "P-10", "name": "Armería", "expires_at": "2030-01-01T00:00:00+00:00"},
+        ],
+        "permission_ids": frozenset({10}),
+        "grants": {},
+        "valid_until": None,
+    }
+    person.update(overrides)
+    return person
+
+
+def _zone(**overrides):
+    """Registro de zona con la forma de ws/cache.py (get_zone_record)."""
+    zone = {
+        "id": 7,
+        "code": "CZ-01",
+        "name": "Armería",
+        "min_rank_level": 3,
+        "required_clearance_name": "Secreto",
+        "required_clearance_level": 3,
+        "requires_special_permission": False,
+        "capacity": None,
+        "permission_requirements": [{"permission_id": 10, "code": "P-10", "required": True}],
+    }
+    zone.update(overrides)
+    return zone
+
+
+def _dump(data):
+    # compara también el orden de las claves
+    return json.dumps(data, default=str)
+
+
+class FastRenderParityTests(SimpleTestCase):
+    """render_access_info (ws/fastrender.py) debe emitir lo mismo que AccessInfoSerializer."""
+
+    def assertParity(self, payload):
+        self.assertEqual(_dump(render_access_info(payload)), _dump(AccessInfoSerializer(payload).data))
+
+    def test_allowed(self):
+        payload = build_access_info(_person(), _zone())
+        self.assertTrue(payload["validation"]["allowed"])
+        self.assertParity(payload)
+
+    def test_special_grant(self):
+        grant = {
+            "id": 4, "granted_by": 2, "granted_at": "2024-01-01T00:00:00+00:00",
+            "expires_at": None, "status": "active", "reason": "inspección",
+        }
+        person = _person(rank_level=1, permission_ids=frozenset(), permissions=[], grants={7: grant})
+        payload = build_access_info(person, _zone())
+        self.assertEqual(payload["validation"]["reason"], "special_grant")
+        self.assertParity(payload)
+        # grant_id de la evidencia no está declarado: se descarta en ambos
+        evidence = render_access_info(payload)["validation"]["evidence"]
+        self.assertNotIn("grant_id", evidence[-1])
+
+    def test_zone_full(self):
+        payload = build_access_info(_person(), _zone(capacity=2), current_occupancy=2)
+        self.assertFalse(payload["validation"]["allowed"])
+        self.assertParity(payload)
+
+    def test_badge_rejected_validation(self):
+        # el 403 de badge revocado no pasa por el serializer completo, solo su validación
+        payload = badge_rejected_payload(BadgeRejected("B-9", "revoked"), "CZ-01")
+        render = compile_serializer(ValidationSerializer())
+        self.assertEqual(
+            _dump(render(payload["validation"])), _dump(ValidationSerializer(payload["validation"]).data)
+        )
+
+    def test_none_and_missing_fields(self):
+        person = _person(badge_id=None, unit=None, clearance=None, clearance_level=None)
+        payload = build_access_info(person, _zone(min_rank_level=None, required_clearance_name=None,
+                                                  required_clearance_level=None))
+        payload["permissions"][0]["expires_at"] = None
+        self.assertParity(payload)
+        # special_access admite null: ausente se emite como None
+        del payload["special_access"]
+        self.assertParity(payload)
+        self.assertIsNone(render_access_info(payload)["special_access"])
+
+    def test_missing_required_field_raises(self):
+        payload = build_access_info(_person(), _zone())
+        del payload["first_name"]
+        with self.assertRaises(KeyError):
+            render_access_info(payload)
+
+    def test_decimal_and_datetime_values(self):
+        person = _person(
+            rank={"id": Decimal("3"), "code": "CPT", "name": "Capitán", "level": Decimal("5")},
+            clearance={"id": 1, "name": "Secreto", "level_value": Decimal("3")},
+            permissions=[{
+                "id": 10, "code": "P-10", "name": "Armería",
+                "expires_at": datetime(2030, 1, 1, 12, 30, tzinfo=dt_timezone.utc),
+            }],
+        )
+        payload = build_access_info(person, _zone(id=Decimal("7")))
+        self.assertParity(payload)
+        out = render_access_info(payload)
+        self.assertEqual(out["rank"]["level"], 5)
+        self.assertIsInstance(out["permissions"][0]["expires_at"], str)
+
+
+# solo con sistema_acceso_militar/settings_replica_test.py (dos alias SQLite)
+REPLICA_TESTS = "replica1" in settings.DATABASES and "replica1" in routers.DATABASE_REPLICAS
+
+
+@unittest.skipUnless(REPLICA_TESTS, "requiere --settings=sistema_acceso_militar.settings_replica_test")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    PrimaryReplicaRouter y ReadYourWritesMiddleware (ws/routers.py, ws/middleware.py).
+    TransactionTestCase: la conexión de la réplica solo ve lo que la primaria ya confirmó.
+    """
+
+    # sin réplica configurada no se pide ninguna base (el resto de ws/tests.py no la usa)
+    databases = {"default", "replica1"} if REPLICA_TESTS else set()
+
+    def setUp(self):
+        Rank.objects.create(code="CPT", name="Capitán", level=5)
+        # estado de una petición nueva: sin fijar y sin escrituras
+        tokens = routers.begin_request(False)
+        self.addCleanup(routers.end_request, tokens)
+        self.factory = RequestFactory()
+
+    def _queries(self, read):
+        """(consultas a la réplica, consultas a la primaria) que hace read()."""
+        with CaptureQueriesContext(connections["replica1"]) as replica, \
+                CaptureQueriesContext(connections["default"]) as primary:
+            read()
+        return len(replica), len(primary)
+
+    def _read_rank(self):
+        with routers.replica_reads():
+            return Rank.objects.get(code="CPT")
+
+    def test_replica_reads_go_to_replica(self):
+        self.assertEqual(self._queries(self._read_rank), (1, 0))
+        self.assertEqual(self._read_rank()._state.db, "replica1")
+
+    def test_reads_outside_replica_reads_go_to_primary(self):
+        self.assertEqual(self._queries(lambda: Rank.objects.get(code="CPT")), (0, 1))
+
+    def test_reads_stay_on_primary_after_write(self):
+        Rank.objects.create(code="MAY", name="Mayor", level=6)
+        self.assertEqual(self._queries(self._read_rank), (0, 1))
+
+    def test_primary_reads_inside_replica_reads(self):
+        def read():
+            with routers.replica_reads(), routers.primary_reads():
+                Rank.objects.get(code="CPT")
+        self.assertEqual(self._queries(read), (0, 1))
+
+    def test_middleware_sets_pin_cookie_after_write(self):
+        def writer(request):
+            Rank.objects.filter(code="CPT").update(name="Capitán de navío")
+            return HttpResponse("ok")
+        response = ReadYourWritesMiddleware(writer)(self.factory.post("/"))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], routers.REPLICA_PIN_SECONDS)
+
+    def test_middleware_read_only_request_sets_no_cookie(self):
+        response = ReadYourWritesMiddleware(lambda request: HttpResponse(self._read_rank()._state.db))(
+            self.factory.get("/"))
+        self.assertEqual(response.content, b"replica1")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_middleware_honors_pin_cookie(self):
+        def reader(request):
+            return HttpResponse(self._read_rank()._state.db)
+        request = self.factory.get("/")
+        request.COOKIES[PIN_COOKIE] = "9999999999"
+        self.assertEqual(ReadYourWritesMiddleware(reader)(request).content, b"default")
+        # vencida: vuelve a la réplica
+        request = self.factory.get("/")
+        request.COOKIES[PIN_COOKIE] = "1"
+        self.assertEqual(ReadYourWritesMiddleware(reader)(request).content, b"replica1")
+
+    def test_unsafe_method_is_pinned(self):
+        def reader(request):
+            return HttpResponse(self._read_rank()._state.db)
+        self.assertEqual(ReadYourWritesMiddleware(reader)(self.factory.post("/")).content, b"default")
+
+    def test_bulk_post_reads_from_replica(self):
+        # POST de solo lectura (replica_safe): no lo fija el método ni deja la cookie
+        rank = Rank.objects.get(code="CPT")
+        Personnel.objects.create(service_number="SN-1", first_name="Ana", last_name="Pérez", rank=rank)
+        RestrictedZone.objects.create(code="CZ-01", name="Armería", min_rank_level=3)
+        access_cache.clear_local()
+        caches[access_cache.ACCESS_CACHE_ALIAS].clear()
+        items = {"items": [{"service_number": "SN-1", "zone_code": "CZ-01"}]}
+        # versiones del caché recién creadas: sin esto cuentan como cambios que la réplica no tiene
+        with mock.patch.object(routers, "REPLICA_LAG_SECONDS", 0), \
+                CaptureQueriesContext(connections["replica1"]) as replica, \
+                CaptureQueriesContext(connections["default"]) as primary:
+            response = Client().post("/ws/access-info/bulk/", items, content_type="application/json")
+        self.assertEqual(response.json()["results"][0]["status"], 200)
+        self.assertGreater(len(replica), 0)
+        self.assertEqual(len(primary), 0)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_bulk_post_honors_pin_cookie(self):
+        client = Client()
+        client.cookies[PIN_COOKIE] = "9999999999"
+        with CaptureQueriesContext(connections["replica1"]) as replica:
+            client.post("/ws/access-info/bulk/", {"items": [{"service_number": "SN-9", "zone_code": "CZ-01"}]},
+                        content_type="application/json")
+        self.assertEqual(len(replica), 0)
+
+
+@unittest.skipUnless(REPLICA_TESTS, "requiere --settings=sistema_acceso_militar.settings_replica_test")
+class BadgeRejectionTests(TransactionTestCase):
+    """
+    Badges revocados/perdidos en /ws/access-info/ (ws/cache.py): 403 con la
+    validación denegada, también si el badge ya estaba en caché como emitido.
+    """
+
+    databases = {"default", "replica1"} if REPLICA_TESTS else set()
+
+    def setUp(self):
+        rank = Rank.objects.create(code="CPT", name="Capitán", level=5)
+        person = Personnel.objects.create(service_number="SN-1", first_name="Ana", last_name="Pérez", rank=rank)
+        RestrictedZone.objects.create(code="CZ-01", name="Armería", min_rank_level=3)
+        self.badge = Badge.objects.create(badge_code="B-1", personnel=person)
+        access_cache.clear_local()
+        caches[access_cache.ACCESS_CACHE_ALIAS].clear()
+
+    def _scan(self, badge_id):
+        return Client().get("/ws/access-info/", {"badge_id": badge_id, "zone_code": "CZ-01"})
+
+    def assertRejected(self, response, status):
+        self.assertEqual(response.status_code, 403)
+        data = response.json()
+        self.assertIsNone(data["service_number"])
+        self.assertFalse(data["validation"]["allowed"])
+        self.assertEqual(data["validation"]["reason"], f"badge_{status}")
+        self.assertEqual(data["validation"]["evidence"][0]["status"], status)
+
+    def test_issued_badge_is_evaluated(self):
+        response = self._scan("B-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["service_number"], "SN-1")
+        self.assertTrue(response.json()["validation"]["allowed"])
+
+    def test_revoked_badge_is_rejected_after_save(self):
+        self.assertEqual(self._scan("B-1").status_code, 200)
+        self.badge.status = Badge.STATUS_REVOKED
+        self.badge.save()
+        self.assertRejected(self._scan("B-1"), Badge.STATUS_REVOKED)
+
+    def test_lost_badge_is_rejected_after_queryset_update(self):
+        self.assertEqual(self._scan("B-1").status_code, 200)
+        Badge.objects.filter(badge_code="B-1").update(status=Badge.STATUS_LOST)
+        self.assertRejected(self._scan("B-1"), Badge.STATUS_LOST)
+
+    def test_bulk_rejects_only_the_blocked_badge(self):
+        Badge.objects.filter(badge_code="B-1").update(status=Badge.STATUS_REVOKED)
+        items = [{"badge_id": "B-1", "zone_code": "CZ-01"}, {"service_number": "SN-1", "zone_code": "CZ-01"}]
+        response = Client().post("/ws/access-info/bulk/", {"items": items}, content_type="application/json")
+        results = response.json()["results"]
+        self.assertEqual([r["status"] for r in results], [403, 200])
+        self.assertEqual(results[0]["data"]["validation"]["reason"], "badge_revoked")
+
+
+@unittest.skipUnless(REPLICA_TESTS, "requiere --settings=sistema_acceso_militar.settings_replica_test")
+class PolicyChangeLogTests(TestCase):
+    """Filas de audit_policy_changes de update()/bulk_create()/bulk_update() (PolicyQuerySet, ws/changelog.py)."""
+
+    databases = {"default"} if REPLICA_TESTS else set()
+
+    def setUp(self):
+        self.cpt = Rank.objects.create(code="CPT", name="Capitán", level=5)
+        self.may = Rank.objects.create(code="MAY", name="Mayor", level=6)
+        self.version = changelog.latest_version()
+
+    def _changes(self):
+        return changelog.changes_since(self.version)["changes"]
+
+    def test_update_logs_one_row_per_object(self):
+        Rank.objects.filter(level__gte=5).update(description="Oficial")
+        changes = self._changes()
+        self.assertEqual(sorted(c["entity_id"] for c in changes), sorted([self.cpt.pk, self.may.pk]))
+        self.assertEqual({c["action"] for c in changes}, {"update"})
+        self.assertEqual(changes[0]["data"]["set"], {"description": "Oficial"})
+        self.assertEqual([c["version"] for c in changes], [self.version + 1, self.version + 2])
+
+    def test_update_keeps_personal_data_out_of_the_feed(self):
+        person = Personnel.objects.create(service_number="SN-1", first_name="Ana", last_name="Pérez", rank=self.cpt)
+        self.version = changelog.latest_version()
+        Personnel.objects.filter(pk=person.pk).update(first_name="Ana María", status="suspended")
+        (change,) = self._changes()
+        self.assertEqual(change["data"]["set"], {"status": "suspended"})
+        self.assertEqual(sorted(change["data"]["fields"]), ["first_name", "status"])
+
+    def test_update_without_matches_logs_nothing(self):
+        Rank.objects.filter(code="GEN").update(name="General")
+        self.assertEqual(self._changes(), [])
+
+    def test_bulk_create_logs_created_objects(self):
+        created = Rank.objects.bulk_create([Rank(code="SGT", name="Sargento", level=3),
+                                            Rank(code="CBO", name="Cabo", level=2)])
+        changes = self._changes()
+        self.assertEqual([c["entity_id"] for c in changes], [r.pk for r in created])
+        self.assertEqual({(c["entity"], c["action"]) for c in changes}, {("ranks", "create")})
+
+    def test_bulk_update_logs_changed_fields(self):
+        self.cpt.name, self.may.name = "Capitana", "Mayora"
+        Rank.objects.bulk_update([self.cpt, self.may], ["name"])
+        changes = self._changes()
+        self.assertEqual(sorted(c["entity_id"] for c in changes), sorted([self.cpt.pk, self.may.pk]))
+        self.assertEqual(changes[0]["data"]["fields"], ["name"])
+
+    def test_over_row_limit_logs_whole_entity(self):
+        with mock.patch.object(changelog, "POLICY_CHANGES_BULK_ROW_LIMIT", 1):
+            Rank.objects.all().update(description="x")
+        (change,) = self._changes()
+        self.assertIsNone(change["entity_id"])
+        self.assertEqual(change["data"]["count"], 2)
+
+    def test_rolled_back_update_leaves_no_row(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Rank.objects.all().update(description="x")
+            raise RuntimeError("rollback")
+        self.assertEqual(self._changes(), [])
+        self.assertFalse(PolicyChange.objects.filter(id__gt=self.version).exists())
+
+
+@unittest.skipUnless(REPLICA_TESTS, "requiere --settings=sistema_acceso_militar.settings_replica_test")
+class UnitClosureTests(TestCase):
+    """unit_closure (ws/hierarchy.py) tras mover, borrar y actualizar en masa unidades."""
+
+    databases = {"default"} if REPLICA_TESTS else set()
+
+    def setUp(self):
+        # 1DIV > 1BRI > 1BAT; 2DIV sola
+        self.div = Unit.objects.create(code="1DIV", name="División 1")
+        self.bri = Unit.objects.create(code="1BRI", name="Brigada 1", parent_unit=self.div)
+        self.bat = Unit.objects.create(code="1BAT", name="Batallón 1", parent_unit=self.bri)
+        self.div2 = Unit.objects.create(code="2DIV", name="División 2")
+
+    def assertClosureMatchesParents(self):
+        """La tabla mantenida fila a fila es la misma que la que reconstruye rebuild()."""
+        maintained = set(UnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+        hierarchy.rebuild()
+        self.assertEqual(maintained, set(UnitClosure.objects.values_list("ancestor_id", "descendant_id", "depth")))
+
+    def _subtree(self, unit):
+        return set(Unit.objects.filter(pk__in=hierarchy.subtree_unit_ids(unit.pk)).values_list("code", flat=True))
+
+    def test_insert_links_every_ancestor(self):
+        self.assertEqual(self._subtree(self.div), {"1DIV", "1BRI", "1BAT"})
+        self.assertEqual(UnitClosure.objects.get(ancestor=self.div, descendant=self.bat).depth, 2)
+        self.assertClosureMatchesParents()
+
+    def test_reparent_moves_the_whole_subtree(self):
+        self.bri.parent_unit = self.div2
+        self.bri.save()
+        self.assertEqual(self._subtree(self.div), {"1DIV"})
+        self.assertEqual(self._subtree(self.div2), {"2DIV", "1BRI", "1BAT"})
+        self.assertClosureMatchesParents()
+
+    def test_reparent_to_root(self):
+        self.bri.parent_unit = None
+        self.bri.save()
+        self.assertEqual(self._subtree(self.div), {"1DIV"})
+        self.assertFalse(UnitClosure.objects.filter(descendant=self.bat, ancestor=self.div).exists())
+        self.assertClosureMatchesParents()
+
+    def test_reparent_under_own_subunit_is_rejected(self):
+        self.div.parent_unit = self.bat
+        with self.assertRaises(ValueError):
+            self.div.save()
+        self.assertClosureMatchesParents()
+
+    def test_delete_detaches_children(self):
+        self.bri.delete()
+        self.bat.refresh_from_db()
+        self.assertIsNone(self.bat.parent_unit_id)
+        self.assertEqual(self._subtree(self.div), {"1DIV"})
+        self.assertClosureMatchesParents()
+
+    def test_queryset_update_rebuilds(self):
+        Unit.objects.filter(pk=self.bri.pk).update(parent_unit=self.div2)
+        self.assertEqual(self._subtree(self.div2), {"2DIV", "1BRI", "1BAT"})
+        self.assertClosureMatchesParents()
+
+    def test_bulk_update_rebuilds(self):
+        self.bat.parent_unit = self.div2
+        Unit.objects.bulk_update([self.bat], ["parent_unit"])
+        self.assertEqual(self._subtree(self.bri), {"1BRI"})
+        self.assertEqual(self._subtree(self.div2), {"2DIV", "1BAT"})
+        self.assertClosureMatchesParents()
+
+    def test_subtree_personnel_follows_the_move(self):
+        rank = Rank.objects.create(code="CPT", name="Capitán", level=5)
+        Personnel.objects.create(service_number="SN-1", first_name="Ana", last_name="Pérez", rank=rank, unit=self.bat)
+        self.assertEqual(list(hierarchy.subtree_personnel(self.div.pk).values_list("service_number", flat=True)), ["SN-1"])
+        self.bri.parent_unit = self.div2
+        self.bri.save()
+        self.assertFalse(hierarchy.subtree_personnel(self.div.pk).exists())
+        self.assertTrue(hierarchy.subtree_personnel(self.div2.pk).exists())
+
+
+# copia de historial al lado de este proyecto (en el repositorio; cada proyecto se despliega solo)
+HISTORIAL_APP_DIR = Path(settings.BASE_DIR).parent / "historial_registros_acceso_militar" / "historial"
+WS_APP_DIR = Path(__file__).resolve().parent
+
+# módulo -> definiciones de nivel superior que difieren a propósito entre las copias
+# (None: el módulo entero, salvo docstrings, es el mismo código)
+COPIED_MODULES = {
+    "rules.py": None,
+    "offline.py": None,
+    # DRF de un lado, bson/DjangoJSONEncoder del otro
+    "jsoncodec.py": {"_default", "dumps"},
+    # historial mide además MongoDB y las llamadas al WS
+    "metrics.py": {"COMPONENTS", "_current"},
+    # clave de caché y rutas de la página de capturas
+    "profiling.py": {"SAMPLE_EVERY_CACHE_KEY", "profiles_index", "profile_detail"},
+}
+
+
+def _code(path):
+    """Sentencias de nivel superior de un módulo sin docstrings: [(nombre o None, ast.dump)]."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) \
+                and ast.get_docstring(node, clean=False) is not None:
+            node.body = node.body[1:] or [ast.Pass()]
+    out = []
+    for node in tree.body:
+        name = getattr(node, "name", None)
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+        out.append((name, ast.dump(node)))
+    return out
+
+
+@unittest.skipUnless(HISTORIAL_APP_DIR.is_dir(), "sin la copia de historial al lado")
+class CopiedModulesTests(SimpleTestCase):
+    """ws/ y historial/ comparten módulos copiados: falla si una copia cambia sin la otra."""
+
+    def test_copies_match(self):
+        for module, differs in COPIED_MODULES.items():
+            with self.subTest(module=module):
+                ws_code, historial_code = _code(WS_APP_DIR / module), _code(HISTORIAL_APP_DIR / module)
+                if differs is None:
+                    drifted = [
+                        (a or b)[0] or f"sentencia {i + 1}"
+                        for i, (a, b) in enumerate(zip_longest(ws_code, historial_code)) if a != b
+                    ]
+                else:
+                    ws_defs, historial_defs = (
+                        {name: dump for name, dump in code if name is not None and name not in differs}
+                        for code in (ws_code, historial_code)
+                    )
+                    drifted = sorted(n for n in ws_defs.keys() & historial_defs.keys() if ws_defs[n] != historial_defs[n])
+                self.assertEqual(drifted, [], f"ws/{module} y historial/{module} ya no son el mismo código")
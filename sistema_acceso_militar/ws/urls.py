@@ -1,7 +1,25 @@
 from django.urls import path
-from .views import AccessInfoView, ZoneListAPI
+
+from .profiling import profile_detail, profiles_index
+from .views import (
+    AccessInfoView, AccessInfoBulkView, ZoneListAPI, PolicyBundleView, PolicyDeltaView, PolicyChangesView, UnitSubtreeView, UnitPersonnelView,
+    OccupancyListView, OccupancyEntryView, OccupancyExitView, OccupancyBulkView, OccupancyReconcileView,
+)
 
 urlpatterns = [
     path("access-info/", AccessInfoView.as_view(), name="access_info"),
+    path("access-info/bulk/", AccessInfoBulkView.as_view(), name="access_info_bulk"),
     path("zones/", ZoneListAPI.as_view(), name="api_zones"),
+    path("policy/bundle/", PolicyBundleView.as_view(), name="policy_bundle"),
+    path("policy/delta/", PolicyDeltaView.as_view(), name="policy_delta"),
+    path("policy/changes/", PolicyChangesView.as_view(), name="policy_changes"),
+    path("units/<str:code>/subtree/", UnitSubtreeView.as_view(), name="unit_subtree"),
+    path("units/<str:code>/personnel/", UnitPersonnelView.as_view(), name="unit_personnel"),
+    path("occupancy/", OccupancyListView.as_view(), name="occupancy"),
+    path("occupancy/entry/", OccupancyEntryView.as_view(), name="occupancy_entry"),
+    path("occupancy/exit/", OccupancyExitView.as_view(), name="occupancy_exit"),
+    path("occupancy/bulk/", OccupancyBulkView.as_view(), name="occupancy_bulk"),
+    path("occupancy/reconcile/", OccupancyReconcileView.as_view(), name="occupancy_reconcile"),
+    path("admin/profiles/", profiles_index, name="profiles"),
+    path("admin/profiles/<str:capture_id>/", profile_detail, name="profile_detail"),
 ]
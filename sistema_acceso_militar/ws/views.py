@@ -3,100 +3,193 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
-from django.shortcuts import get_object_or_404
-from .models import Personnel, RestrictedZone, PersonnelPermission, Permission, SpecialAccessGrant, ZonePermissionRequirement
-from .serializers import AccessInfoSerializer
+from django.http import Http404, HttpResponse
+from .models import RestrictedZone, PersonnelPermission, SpecialAccessGrant, Unit, UnitClosure, ZonePermissionRequirement
+from .serializers import AccessInfoSerializer, SubtreePersonnelSerializer, SubtreeUnitSerializer
+from . import cache as access_cache
+from . import rules
+from . import bundle as policy_bundle
+from . import changelog
+from . import hierarchy
+from . import occupancy
+from . import fastrender
+from . import routers
+from .permissions import IsServiceOrStaff
 from datetime import datetime
 
-from django.db import models
+from django.conf import settings
 
 from rest_framework import generics
+from rest_framework.pagination import LimitOffsetPagination
 # from .models import RestrictedZone, ZonePermissionRequirement
 from .serializers import ZoneSerializer
 
+# máximo de escaneos por petición en AccessInfoBulkView
+ACCESS_INFO_BULK_MAX = getattr(settings, "ACCESS_INFO_BULK_MAX", 1000)
 
 
-def evaluate_access(personnel, zone):
+
+def evaluate_access(personnel, zone, check_capacity=True):
     """
     Devuelve dict con 'allowed', 'reason' y 'evidence' (lista).
-    Lógica:
+    Lógica (ver ws/rules.py):
       - exists
       - status active
       - check min_rank_level (compara personnel.rank.level)
       - check clearance (compara clearance.level_value)
       - check zone permission requirements (perm asignadas y activas)
       - special_access overrides (si existe grant activo para esta persona y zona)
+      - capacity (si la zona tiene capacity y check_capacity; ver ws/occupancy.py)
     """
-    evidence = []
-    # exists
-    evidence.append({"check": "exists", "passed": True})
-    # status active
-    status_ok = (personnel.status == "active")
-    evidence.append({"check": "status_active", "passed": status_ok})
-    # min rank
-    min_rank = zone.min_rank_level
-    rank_level = getattr(personnel.rank, "level", None)
-    if min_rank is not None:
-        passed = (rank_level is not None and rank_level >= min_rank)
-        evidence.append({"check": "min_rank", "passed": passed, "value": rank_level, "required": min_rank})
-    # clearance
-    required_clearance = zone.required_clearance
-    if required_clearance:
-        p_cl = getattr(personnel.clearance, "level_value", None)
-        passed = (p_cl is not None and p_cl >= required_clearance.level_value)
-        evidence.append({"check": "clearance", "passed": passed, "value": p_cl, "required": required_clearance.level_value})
-    # zone permission requirements
-    reqs = ZonePermissionRequirement.objects.filter(zone=zone)
-    matching_permissions = []
-    perms = PersonnelPermission.objects.filter(personnel=personnel, active=True)
-    perm_ids = set(p.permission_id for p in perms)
-    perm_ok = True
-    for r in reqs:
-        if r.required:
-            if r.permission_id in perm_ids:
-                matching_permissions.append(r.permission_id)
-            else:
-                perm_ok = False
-    evidence.append({"check": "zone_permission", "passed": perm_ok, "matching_permissions": matching_permissions})
-    # special access check (active grant for this zone and personnel)
+    person = {
+        "status": personnel.status,
+        "rank_level": getattr(personnel.rank, "level", None),
+        "clearance_level": getattr(personnel.clearance, "level_value", None),
+    }
+    zone_data = {
+        "min_rank_level": zone.min_rank_level,
+        "required_clearance_level": zone.required_clearance.level_value if zone.required_clearance else None,
+        "requires_special_permission": zone.requires_special_permission,
+        "capacity": zone.capacity,
+        "permission_requirements": [
+            {"permission_id": r.permission_id, "required": r.required}
+            for r in ZonePermissionRequirement.objects.filter(zone=zone)
+        ],
+    }
+    current = occupancy.get_occupancy(zone.id) if check_capacity and zone.capacity is not None else None
+    # filtros por igualdad (indexables); sweep_expirations apaga lo vencido y
+    # la comprobación de expires_at en Python cubre el hueco hasta la siguiente pasada
     now = timezone.now()
-    special = SpecialAccessGrant.objects.filter(zone=zone, personnel=personnel, status="active").filter(
-        models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=now)
-    ).first()
-    if special:
-        evidence.append({"check": "special_access_grant", "passed": True, "grant_id": special.id})
-        # override
-        allowed = True
-        reason = "special_grant"
-    else:
-        # aggregate results
-        allowed = status_ok and (min_rank is None or (rank_level is not None and rank_level >= (min_rank or 0))) \
-                  and (required_clearance is None or (getattr(personnel.clearance, "level_value", None) is not None and getattr(personnel.clearance, "level_value") >= required_clearance.level_value)) \
-                  and perm_ok
-        # decide a reason code for logging
-        if not status_ok:
-            reason = "status_not_active"
-        elif min_rank is not None and not (rank_level is not None and rank_level >= min_rank):
-            reason = "rank_too_low"
-        elif required_clearance and not (getattr(personnel.clearance, "level_value", None) is not None and getattr(personnel.clearance, "level_value") >= required_clearance.level_value):
-            reason = "clearance_insufficient"
-        elif not perm_ok and zone.requires_special_permission:
-            reason = "missing_zone_permission"
-        else:
-            reason = "rank_ok_and_permission" if allowed else "unspecified_denial"
-    return {"allowed": allowed, "reason": reason, "evidence": evidence, "special_access": None if not special else {
+    perms = PersonnelPermission.objects.filter(personnel=personnel, active=True)
+    perm_ids = set(p.permission_id for p in perms if p.expires_at is None or p.expires_at > now)
+    special = next((
+        g for g in SpecialAccessGrant.objects.filter(zone=zone, personnel=personnel, status="active").order_by("id")
+        if g.expires_at is None or g.expires_at > now
+    ), None)
+    grant = None if not special else {
         "id": special.id,
         "granted_by": special.granted_by_id,
         "granted_at": special.granted_at.isoformat() if special.granted_at else None,
         "expires_at": special.expires_at.isoformat() if special.expires_at else None,
         "status": special.status,
         "reason": special.reason
-    }}
+    }
+    return rules.evaluate(person, zone_data, perm_ids, grant, current)
+
+
+def build_access_info(person, zone, current_occupancy=None):
+    """
+    Arma el payload de /access-info/ a partir de los registros resueltos de
+    ws/cache.py (sin tocar la BD).
+    """
+    eval_out = rules.evaluate(
+        person, zone, person["permission_ids"], person["grants"].get(zone["id"]), current_occupancy
+    )
+    return {
+        "service_number": person["service_number"],
+        "badge_id": person["badge_id"],
+        "first_name": person["first_name"],
+        "last_name": person["last_name"],
+        "rank": person["rank"],
+        "unit": person["unit"],
+        "clearance": person["clearance"],
+        "permissions": person["permissions"],
+        "special_access": eval_out.get("special_access"),
+        "zone": {
+            "id": zone["id"], "code": zone["code"], "name": zone["name"],
+            "min_rank_level": zone["min_rank_level"],
+            "required_clearance_name": zone["required_clearance_name"],
+            "requires_special_permission": zone["requires_special_permission"],
+            "permission_requirements": zone["permission_requirements"]
+        },
+        "validation": {
+            "allowed": eval_out["allowed"],
+            "reason": eval_out["reason"],
+            "evidence": eval_out["evidence"]
+        }
+    }
+
+
+def badge_rejected_payload(exc, zone_code):
+    """
+    Respuesta 403 para badges revocados/perdidos: lleva 'validation' para que
+    el historial registre el intento como denegado.
+    """
+    reason = f"badge_{exc.status}"
+    return {
+        "detail": str(exc),
+        "service_number": None,
+        "badge_id": exc.badge_code,
+        "zone": {"code": zone_code},
+        "validation": {
+            "allowed": False,
+            "reason": reason,
+            "evidence": [{"check": "badge_status", "passed": False, "status": exc.status}]
+        }
+    }
+
+
+def _read_with_primary_fallback(lookup, *args, **kwargs):
+    """
+    Lee en una réplica (ws/routers.py); si no encuentra nada reintenta en la
+    primaria, por si la réplica todavía no tiene un alta reciente.
+    """
+    with routers.replica_reads():
+        found = lookup(*args, **kwargs)
+    if found is None and routers.DATABASE_REPLICAS:
+        with routers.primary_reads():
+            found = lookup(*args, **kwargs)
+    return found
+
+
+def resolve_access_info(svc, badge, zone_code, direction=None, zones=None):
+    """
+    (status, payload) de /access-info/ para una persona y zona: 200 con la
+    evaluación, 403 si el badge está revocado/perdido, 404 si no existe la
+    persona o la zona. `zones` (code -> registro) evita resolver la misma zona
+    varias veces dentro de un lote.
+    """
+    # obtener persona (rank, unit, clearance, permisos y grants ya resueltos)
+    if svc:
+        person = _read_with_primary_fallback(access_cache.get_personnel_record, service_number=svc)
+    else:
+        try:
+            person = _read_with_primary_fallback(access_cache.get_personnel_record, badge_id=badge)
+        except access_cache.BadgeRejected as exc:
+            return status.HTTP_403_FORBIDDEN, badge_rejected_payload(exc, zone_code)
+    if person is None:
+        return status.HTTP_404_NOT_FOUND, {"detail": "No Personnel matches the given query."}
+
+    if zones is not None and zone_code in zones:
+        zone = zones[zone_code]
+    else:
+        zone = _read_with_primary_fallback(access_cache.get_zone_record, zone_code)
+        if zones is not None:
+            zones[zone_code] = zone
+    if zone is None:
+        return status.HTTP_404_NOT_FOUND, {"detail": "No RestrictedZone matches the given query."}
+
+    # la capacidad es un get del contador en memoria compartida, solo si la zona la define
+    current = None
+    if zone.get("capacity") is not None and direction != "exit":
+        current = occupancy.get_occupancy(zone["id"])
+    payload = build_access_info(person, zone, current)
+
+    # render precompilado (ws/fastrender.py); ACCESS_INFO_FAST_RENDER=False usa el serializer de DRF
+    if fastrender.ACCESS_INFO_FAST_RENDER:
+        return status.HTTP_200_OK, fastrender.render_access_info(payload)
+    return status.HTTP_200_OK, AccessInfoSerializer(payload).data
+
 
 class AccessInfoView(APIView):
     """
     GET /api/access-info/?service_number=SN-20245&zone_code=CZ-01
-    (o usar badge_id en vez de service_number)
+    (o usar badge_id en vez de service_number; direction=exit no aplica la capacidad)
+
+    Persona y zona se resuelven con la caché de ws/cache.py: escanear de nuevo
+    a la misma persona no ejecuta consultas SQL mientras no cambien sus datos.
+    El badge_id se resuelve por badges.badge_code; un badge revocado o perdido
+    devuelve 403 sin tocar MySQL. Lo que no está en caché se lee de una réplica.
     """
     def get(self, request, *args, **kwargs):
         svc = request.query_params.get("service_number")
@@ -105,71 +198,87 @@ class AccessInfoView(APIView):
         if not zone_code or (not svc and not badge):
             return Response({"detail":"zone_code and (service_number or badge_id) required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # obtener persona
-        if svc:
-            personnel = get_object_or_404(Personnel, service_number=svc)
-        else:
-            personnel = get_object_or_404(Personnel, badge_id=badge)
+        code, payload = resolve_access_info(svc, badge, zone_code, request.query_params.get("direction"))
+        if code == status.HTTP_404_NOT_FOUND:
+            raise Http404(payload["detail"])
+        return Response(payload, status=code)
 
-        zone = get_object_or_404(RestrictedZone, code=zone_code)
 
-        # permisos activos del personal (no expirados)
-        now = timezone.now()
-        perms_qs = PersonnelPermission.objects.filter(personnel=personnel, active=True).filter(
-            models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=now)
-        ).select_related("permission")
-        perms_out = [
-            {
-                "id": p.permission.id,
-                "code": p.permission.code,
-                "name": p.permission.name,
-                "expires_at": p.expires_at.isoformat() if p.expires_at else None
-            } for p in perms_qs
-        ]
+def _record_occupancy(payload, zone, direction):
+    """Salida permitida: libera un lugar. Entrada permitida: lo reserva o la deniega por zone_full."""
+    if not payload["validation"]["allowed"]:
+        return None
+    if direction == "exit":
+        current = occupancy.record_exit(zone["id"])
+    else:
+        accepted, current = occupancy.reserve_entry(zone["id"], zone.get("capacity"))
+        if not accepted:
+            validation = payload["validation"]
+            validation["allowed"] = False
+            validation["reason"] = "zone_full"
+            validation["evidence"].append({
+                "check": "capacity", "passed": False, "value": current, "required": zone.get("capacity"),
+            })
+    return {"zone_code": zone["code"], "capacity": zone.get("capacity"), "occupancy": current}
 
-        # requirements for zone
-        zreqs = list(ZonePermissionRequirement.objects.filter(zone=zone).select_related("permission"))
-        zreqs_out = [{"permission_id": r.permission_id, "code": r.permission.code, "required": r.required} for r in zreqs]
-
-        # evaluación
-        eval_out = evaluate_access(personnel, zone)
-
-        payload = {
-            "service_number": personnel.service_number,
-            "badge_id": personnel.badge_id,
-            "first_name": personnel.first_name,
-            "last_name": personnel.last_name,
-            "rank": {
-                "id": personnel.rank.id,
-                "code": personnel.rank.code,
-                "name": personnel.rank.name,
-                "level": personnel.rank.level
-            },
-            "unit": None if not personnel.unit else {
-                "id": personnel.unit.id, "code": personnel.unit.code, "name": personnel.unit.name
-            },
-            "clearance": None if not personnel.clearance else {
-                "id": personnel.clearance.id, "name": personnel.clearance.name, "level_value": personnel.clearance.level_value
-            },
-            "permissions": perms_out,
-            "special_access": eval_out.get("special_access"),
-            "zone": {
-                "id": zone.id, "code": zone.code, "name": zone.name,
-                "min_rank_level": zone.min_rank_level,
-                "required_clearance_name": zone.required_clearance.name if zone.required_clearance else None,
-                "requires_special_permission": zone.requires_special_permission,
-                "permission_requirements": zreqs_out
-            },
-            "validation": {
-                "allowed": eval_out["allowed"],
-                "reason": eval_out["reason"],
-                "evidence": eval_out["evidence"]
-            }
-        }
 
-        # serializar (opcional) para validar formato
-        ser = AccessInfoSerializer(payload)
-        return Response(ser.data, status=status.HTTP_200_OK)
+class AccessInfoBulkView(APIView):
+    """
+    POST /ws/access-info/bulk/
+    {"items": [{"service_number": "SN-20245", "zone_code": "CZ-01"},
+               {"badge_id": "B-1", "zone_code": "CZ-02", "direction": "exit"}, ...]}
+
+    Evalúa un lote de escaneos (hasta ACCESS_INFO_BULK_MAX) en una sola
+    petición. Devuelve {"results": [...]} en el mismo orden, cada uno con
+    "status" (200, 400, 403 o 404) y "data" (lo mismo que devolvería
+    /access-info/ para ese ítem). Un ítem inválido no invalida el lote.
+
+    Con "record_occupancy": true además registra cada escaneo en la ocupación
+    (como /occupancy/entry/ y /occupancy/exit/, con el mismo permiso): una
+    entrada permitida que no encuentra lugar vuelve denegada con reason
+    "zone_full". El resultado trae "occupancy" con {zone_code, capacity, occupancy}.
+    No es idempotente: un lote que se reintenta vuelve a mover los contadores
+    (la ingesta de historial usa /occupancy/bulk/ después de guardar).
+
+    Es un POST que no escribe en MySQL (la ocupación vive en la cache):
+    replica_safe evita que ReadYourWritesMiddleware lo fije a la primaria, y
+    todo el lote se lee de una misma réplica.
+    """
+    replica_safe = True
+
+    def post(self, request, *args, **kwargs):
+        record = isinstance(request.data, dict) and bool(request.data.get("record_occupancy"))
+        if record and not IsServiceOrStaff().has_permission(request, self):
+            self.permission_denied(request, message=IsServiceOrStaff.message)
+        items = request.data.get("items") if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            return Response({"detail": "items (list) required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > ACCESS_INFO_BULK_MAX:
+            return Response({"detail": f"at most {ACCESS_INFO_BULK_MAX} items per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with routers.replica_reads():
+            results = self._evaluate(items, record)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def _evaluate(self, items, record):
+        zones = {}
+        results = []
+        for item in items:
+            if not isinstance(item, dict):
+                item = {}
+            svc = item.get("service_number")
+            badge = item.get("badge_id")
+            zone_code = item.get("zone_code")
+            if not zone_code or (not svc and not badge):
+                results.append({"status": status.HTTP_400_BAD_REQUEST,
+                                "data": {"detail": "zone_code and (service_number or badge_id) required"}})
+                continue
+            code, payload = resolve_access_info(svc, badge, zone_code, item.get("direction"), zones)
+            result = {"status": code, "data": payload}
+            if record and code == status.HTTP_200_OK:
+                result["occupancy"] = _record_occupancy(payload, zones[zone_code], item.get("direction"))
+            results.append(result)
+        return results
 
 
 
@@ -194,8 +303,12 @@ class ZoneListAPI(generics.ListAPIView):
     def list(self, request, *args, **kwargs):
         """
         Sobre-escribimos para inyectar los permission_requirements ya prefetched
-        y así el serializer no haga queries adicionales.
+        y así el serializer no haga queries adicionales. Solo lectura: va a una réplica.
         """
+        with routers.replica_reads():
+            return self._list(request, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         # Prefetch manualmente los requisitos y adjuntarlos en un atributo para que el serializer los use
         zone_ids = [z.id for z in queryset]
@@ -212,4 +325,231 @@ class ZoneListAPI(generics.ListAPIView):
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+
+# bundle de políticas para gates offline (ver ws/bundle.py y ws/offline.py)
+
+class PolicyBundleView(APIView):
+    """
+    GET /ws/policy/bundle/  -> último bundle binario (application/octet-stream)
+    Trae todo el personal: solo gates/servicios con token o staff.
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def get(self, request, *args, **kwargs):
+        version = policy_bundle.latest_version()
+        if version is None:
+            return Response({"detail": "no policy bundle exported yet"}, status=status.HTTP_404_NOT_FOUND)
+        resp = HttpResponse(policy_bundle.read_snapshot(version), content_type="application/octet-stream")
+        resp["X-Policy-Version"] = str(version)
+        resp["Content-Disposition"] = f'attachment; filename="policy-{version}.bin"'
+        return resp
+
+
+class PolicyDeltaView(APIView):
+    """
+    GET /ws/policy/delta/?since=12  -> cambios desde la versión 12 hasta la última
+    Responde 410 si esa versión ya no se conserva (descargar el bundle completo).
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get("since", ""))
+        except ValueError:
+            return Response({"detail": "since (bundle version) required"}, status=status.HTTP_400_BAD_REQUEST)
+        delta = policy_bundle.delta_since(since)
+        if delta is None:
+            return Response({"detail": "version not available, download the full bundle",
+                             "latest_version": policy_bundle.latest_version()}, status=status.HTTP_410_GONE)
+        return Response(delta, status=status.HTTP_200_OK)
+
+
+class PolicyChangesView(APIView):
+    """
+    GET /ws/policy/changes/?since=120&entity=restricted_zones,zone_permission_requirements&limit=500
+    Change feed de audit_policy_changes: los consumidores guardan "version" y
+    la usan como since en la siguiente consulta. Solo gates/servicios o staff:
+    data trae los valores de las filas cambiadas.
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = min(int(request.query_params.get("limit", 1000)), 5000)
+        except ValueError:
+            return Response({"detail": "since and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        entity = request.query_params.get("entity")
+        entities = [e for e in entity.split(",") if e] if entity else None
+        return Response(changelog.changes_since(since, entities, limit), status=status.HTTP_200_OK)
+
+
+
+# subárbol de unidades (tabla de clausura, ver ws/hierarchy.py)
+
+def _get_unit(code):
+    unit = Unit.objects.filter(code=code).first()
+    if unit is None:
+        raise Http404("No Unit matches the given query.")
+    return unit
+
+
+class UnitSubtreeView(APIView):
+    """
+    GET /ws/units/1DIV/subtree/  -> la unidad y todas sus subunidades, con la
+    profundidad relativa (0 = la propia unidad). Una sola consulta.
+    """
+    def get(self, request, code, *args, **kwargs):
+        unit = _get_unit(code)
+        links = UnitClosure.objects.filter(ancestor=unit).select_related("descendant").order_by("depth", "descendant__code")
+        units = [
+            {
+                "id": l.descendant.id,
+                "code": l.descendant.code,
+                "name": l.descendant.name,
+                "parent_unit_id": l.descendant.parent_unit_id,
+                "depth": l.depth,
+            } for l in links
+        ]
+        return Response({
+            "unit": {"id": unit.id, "code": unit.code, "name": unit.name},
+            "units": SubtreeUnitSerializer(units, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+class UnitPersonnelView(generics.ListAPIView):
+    """
+    GET /ws/units/1DIV/personnel/?status=active&limit=100&offset=0
+    Personal de la unidad y de todas sus subunidades (join con unit_closure).
+    """
+    serializer_class = SubtreePersonnelSerializer
+    pagination_class = LimitOffsetPagination
+
+    def get_queryset(self):
+        unit = _get_unit(self.kwargs["code"])
+        qs = hierarchy.subtree_personnel(unit.id).select_related("rank", "unit").order_by("service_number")
+        person_status = self.request.query_params.get("status")
+        if person_status:
+            qs = qs.filter(status=person_status)
+        return qs
+
+
+
+# ocupación de zonas (contadores atómicos, ver ws/occupancy.py)
+
+def _zone_for_occupancy(zone_code):
+    zone = access_cache.get_zone_record(zone_code) if zone_code else None
+    if zone is None:
+        raise Http404("No RestrictedZone matches the given query.")
+    return zone
+
+
+class OccupancyListView(APIView):
+    """
+    GET /ws/occupancy/  -> ocupación y capacidad de las zonas activas
+    """
+    def get(self, request, *args, **kwargs):
+        zones = list(RestrictedZone.objects.filter(active=True).order_by("code").values("id", "code", "capacity"))
+        current = occupancy.get_many([z["id"] for z in zones])
+        return Response([
+            {"zone_code": z["code"], "capacity": z["capacity"], "occupancy": current[z["id"]]} for z in zones
+        ], status=status.HTTP_200_OK)
+
+
+class OccupancyEntryView(APIView):
+    """
+    POST /ws/occupancy/entry/  {"zone_code": "CZ-01"}
+    Reserva un lugar tras un acceso permitido; 409 si la zona se llenó entre
+    la validación y la entrada.
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        zone = _zone_for_occupancy(request.data.get("zone_code"))
+        accepted, current = occupancy.reserve_entry(zone["id"], zone.get("capacity"))
+        data = {"zone_code": zone["code"], "capacity": zone.get("capacity"), "occupancy": current}
+        if not accepted:
+            data["reason"] = "zone_full"
+            return Response(data, status=status.HTTP_409_CONFLICT)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class OccupancyExitView(APIView):
+    """
+    POST /ws/occupancy/exit/  {"zone_code": "CZ-01"}
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        zone = _zone_for_occupancy(request.data.get("zone_code"))
+        current = occupancy.record_exit(zone["id"])
+        return Response({"zone_code": zone["code"], "capacity": zone.get("capacity"), "occupancy": current},
+                        status=status.HTTP_200_OK)
+
+
+class OccupancyBulkView(APIView):
+    """
+    POST /ws/occupancy/bulk/  {"moves": [{"zone_code": "CZ-01", "direction": "entry"}, ...]}
+    Entradas y salidas de un lote ya guardado (ingesta de historial) en una
+    sola petición. Devuelve {"results": [...]} en el mismo orden, como
+    /occupancy/entry/ y /occupancy/exit/: una entrada sin lugar trae
+    reason "zone_full" y no cambia el contador; una zona desconocida, "detail".
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        moves = request.data.get("moves") if isinstance(request.data, dict) else None
+        if not isinstance(moves, list):
+            return Response({"detail": "moves (list) required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(moves) > ACCESS_INFO_BULK_MAX:
+            return Response({"detail": f"at most {ACCESS_INFO_BULK_MAX} moves per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        zones = {}
+        results = []
+        for move in moves:
+            zone_code = move.get("zone_code") if isinstance(move, dict) else None
+            if zone_code not in zones:
+                zones[zone_code] = access_cache.get_zone_record(zone_code) if zone_code else None
+            zone = zones[zone_code]
+            if zone is None:
+                results.append({"zone_code": zone_code, "detail": "No RestrictedZone matches the given query."})
+                continue
+            data = {"zone_code": zone["code"], "capacity": zone.get("capacity")}
+            if move.get("direction") == "exit":
+                data["occupancy"] = occupancy.record_exit(zone["id"])
+            else:
+                accepted, data["occupancy"] = occupancy.reserve_entry(zone["id"], zone.get("capacity"))
+                if not accepted:
+                    data["reason"] = "zone_full"
+            results.append(data)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class OccupancyReconcileView(APIView):
+    """
+    POST /ws/occupancy/reconcile/  {"counts": {"CZ-01": 3, "CZ-02": 0}}
+    Ajusta los contadores a los valores calculados desde el log de intentos.
+    Devuelve la desviación encontrada por zona.
+    """
+    permission_classes = [IsServiceOrStaff]
+
+    def post(self, request, *args, **kwargs):
+        counts = request.data.get("counts")
+        if not isinstance(counts, dict):
+            return Response({"detail": "counts (zone_code -> occupancy) required"}, status=status.HTTP_400_BAD_REQUEST)
+        zones = dict(RestrictedZone.objects.filter(code__in=list(counts)).values_list("code", "id"))
+        current = occupancy.get_many(list(zones.values()))
+        drift = {}
+        for code, zone_id in zones.items():
+            try:
+                value = max(0, int(counts[code]))
+            except (TypeError, ValueError):
+                continue
+            if current[zone_id] != value:
+                drift[code] = {"counter": current[zone_id], "log": value}
+                occupancy.set_occupancy(zone_id, value)
+        return Response({"zones": len(zones), "drift": drift, "unknown": sorted(set(counts) - set(zones))},
+                        status=status.HTTP_200_OK)
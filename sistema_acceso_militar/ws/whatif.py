@@ -0,0 +1,231 @@
+# ws/whatif.py
+"""
+Simulador "qué pasaría si" de cambios de política, sin tocar la BD.
+
+PolicyMatrix carga una vez a todo el personal y lo representa como bitsets
+(un int de Python por condición, bit i = persona i):
+
+  active            status == "active"
+  rank >= L         OR acumulado de las máscaras por nivel de rango
+  clearance >= C    ídem por nivel de clearance
+  permiso P         asignado, activo y sin vencer
+  grants de Z       grant activo y sin vencer para la zona Z
+
+y evalúa una zona para todos a la vez con la misma regla que rules.evaluate
+(sin capacidad, que depende del momento):
+
+  permitidos = grants | (active & rank >= min & clearance >= req & AND(permisos requeridos))
+
+Cada AND/OR recorre palabras de 64 bits en C y int.bit_count() cuenta, así
+que simular un cambio sobre decenas de miles de personas es un puñado de
+operaciones por zona.
+
+Un cambio (simulate()) es un dict con cualquiera de:
+  {"min_rank_level": {"CZ-01": 5, "CZ-02": None},
+   "required_clearance": {"CZ-01": "SECRET", "CZ-03": None},
+   "add_requirements": [["CZ-01", "ACCESS_SENSITIVE_SITE"]],
+   "remove_requirements": [["CZ-02", "NIGHT_SHIFT"]],
+   "revoke_grants": [12, 15],
+   "revoke_zone_grants": ["CZ-04"]}
+"""
+from bisect import bisect_left
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ClearanceLevel, Permission, Personnel, PersonnelPermission, RestrictedZone, SpecialAccessGrant, ZonePermissionRequirement
+
+CHANGE_KEYS = (
+    "min_rank_level", "required_clearance", "add_requirements", "remove_requirements",
+    "revoke_grants", "revoke_zone_grants",
+)
+
+
+def _mask(indices, size):
+    """Bitset con los bits `indices` encendidos (armado en un bytearray: un OR por bit copiaría el int entero)."""
+    buf = bytearray((size + 7) // 8)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+
+class LevelMasks:
+    """Máscaras acumuladas por nivel: at_least(L) = personas con nivel >= L."""
+
+    def __init__(self, levels, everyone):
+        # levels: {nivel: máscara}; se guardan ascendentes con el OR desde cada nivel hacia arriba
+        self.everyone = everyone
+        self.levels = sorted(levels)
+        self.cumulative = [0] * len(self.levels)
+        acc = 0
+        for i in range(len(self.levels) - 1, -1, -1):
+            acc |= levels[self.levels[i]]
+            self.cumulative[i] = acc
+
+    def at_least(self, level):
+        if level is None:
+            return self.everyone
+        i = bisect_left(self.levels, level)
+        return self.cumulative[i] if i < len(self.levels) else 0
+
+
+class PolicyMatrix:
+
+    def __init__(self, people, statuses, rank_levels, clearance_levels, permissions, grants, zones,
+                 clearance_by_name, permission_by_code):
+        """
+        people: [service_number] (el índice es el bit)
+        statuses / rank_levels / clearance_levels: listas paralelas a people
+        permissions: [(índice, permission_id)] vigentes
+        grants: [(grant_id, zone_id, índice)] vigentes
+        zones: {code: {"id", "min_rank_level", "required_clearance_level", "requirements": {permission_id: required}}}
+        """
+        self.people = people
+        self.everyone = (1 << len(people)) - 1
+        active = []
+        ranks = {}
+        clearances = {}
+        for i, (st, rank, cl) in enumerate(zip(statuses, rank_levels, clearance_levels)):
+            if st == Personnel.STATUS_ACTIVE:
+                active.append(i)
+            if rank is not None:
+                ranks.setdefault(rank, []).append(i)
+            if cl is not None:
+                clearances.setdefault(cl, []).append(i)
+        n = len(people)
+        self.active = _mask(active, n)
+        self.ranks = LevelMasks({level: _mask(idx, n) for level, idx in ranks.items()}, self.everyone)
+        self.clearances = LevelMasks({level: _mask(idx, n) for level, idx in clearances.items()}, self.everyone)
+        by_permission = {}
+        for i, perm_id in permissions:
+            by_permission.setdefault(perm_id, []).append(i)
+        self.permission_masks = {perm_id: _mask(idx, n) for perm_id, idx in by_permission.items()}
+        self.grants = {}  # zone_id -> {grant_id: bit}
+        for grant_id, zone_id, i in grants:
+            self.grants.setdefault(zone_id, {})[grant_id] = 1 << i
+        self.zones = zones
+        self.clearance_by_name = clearance_by_name
+        self.permission_by_code = permission_by_code
+
+    @classmethod
+    def load(cls, now=None):
+        """Lee personal, permisos, grants y zonas activas (envolver en routers.replica_reads())."""
+        now = now or timezone.now()
+        rows = list(Personnel.objects.order_by("id").values_list(
+            "id", "service_number", "status", "rank__level", "clearance__level_value"))
+        index = {row[0]: i for i, row in enumerate(rows)}
+        unexpired = Q(expires_at__isnull=True) | Q(expires_at__gt=now)
+        permissions = [
+            (index[pid], perm_id)
+            for pid, perm_id in PersonnelPermission.objects.filter(unexpired, active=True)
+            .values_list("personnel_id", "permission_id").iterator()
+            if pid in index
+        ]
+        grants = [
+            (gid, zone_id, index[pid])
+            for gid, zone_id, pid in SpecialAccessGrant.objects.filter(unexpired, status="active")
+            .values_list("id", "zone_id", "personnel_id").iterator()
+            if pid in index
+        ]
+        zones = {}
+        by_id = {}
+        for zid, code, min_rank, req_cl in RestrictedZone.objects.filter(active=True).order_by("code").values_list(
+                "id", "code", "min_rank_level", "required_clearance__level_value"):
+            zones[code] = by_id[zid] = {
+                "id": zid, "min_rank_level": min_rank, "required_clearance_level": req_cl, "requirements": {},
+            }
+        for zid, perm_id, required in ZonePermissionRequirement.objects.values_list("zone_id", "permission_id", "required"):
+            if zid in by_id:
+                by_id[zid]["requirements"][perm_id] = required
+        return cls(
+            people=[r[1] for r in rows],
+            statuses=[r[2] for r in rows],
+            rank_levels=[r[3] for r in rows],
+            clearance_levels=[r[4] for r in rows],
+            permissions=permissions,
+            grants=grants,
+            zones=zones,
+            clearance_by_name=dict(ClearanceLevel.objects.values_list("name", "level_value")),
+            permission_by_code=dict(Permission.objects.values_list("code", "id")),
+        )
+
+    def allowed(self, zone, revoked_grants=frozenset(), all_grants_revoked=False):
+        """Máscara de quienes pasan rules.evaluate en `zone` (dict de self.zones, quizá modificado)."""
+        mask = self.active & self.ranks.at_least(zone["min_rank_level"]) & self.clearances.at_least(zone["required_clearance_level"])
+        for perm_id, required in zone["requirements"].items():
+            if required:
+                mask &= self.permission_masks.get(perm_id, 0)
+        if not all_grants_revoked:
+            for grant_id, bit in self.grants.get(zone["id"], {}).items():
+                if grant_id not in revoked_grants:
+                    mask |= bit
+        return mask
+
+    def members(self, mask, limit=None):
+        """service_number de las personas de la máscara (las primeras `limit`)."""
+        out = []
+        while mask and (limit is None or len(out) < limit):
+            low = mask & -mask
+            out.append(self.people[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def apply(self, changes):
+        """Copia de self.zones con el cambio aplicado. ValueError si nombra algo que no existe."""
+        unknown = set(changes) - set(CHANGE_KEYS)
+        if unknown:
+            raise ValueError(f"claves de cambio desconocidas: {', '.join(sorted(unknown))}")
+        zones = {code: dict(z, requirements=dict(z["requirements"])) for code, z in self.zones.items()}
+
+        def zone(code):
+            if code not in zones:
+                raise ValueError(f"zona desconocida o inactiva: {code}")
+            return zones[code]
+
+        def permission(code):
+            if code not in self.permission_by_code:
+                raise ValueError(f"permiso desconocido: {code}")
+            return self.permission_by_code[code]
+
+        for code, level in changes.get("min_rank_level", {}).items():
+            zone(code)["min_rank_level"] = None if level is None else int(level)
+        for code, name in changes.get("required_clearance", {}).items():
+            if name is not None and name not in self.clearance_by_name:
+                raise ValueError(f"clearance desconocido: {name}")
+            zone(code)["required_clearance_level"] = None if name is None else self.clearance_by_name[name]
+        for code, perm in changes.get("add_requirements", []):
+            zone(code)["requirements"][permission(perm)] = True
+        for code, perm in changes.get("remove_requirements", []):
+            zone(code)["requirements"].pop(permission(perm), None)
+        for code in changes.get("revoke_zone_grants", []):
+            zone(code)
+        return zones
+
+    def simulate(self, changes, show=0, include_unchanged=False):
+        """
+        Por zona: permitidos antes y después, cuántos ganan y cuántos pierden
+        acceso (y hasta `show` service_number de cada grupo).
+        """
+        after_zones = self.apply(changes)
+        revoked = frozenset(int(g) for g in changes.get("revoke_grants", []))
+        zone_revoked = set(changes.get("revoke_zone_grants", []))
+        out = []
+        for code, zone in self.zones.items():
+            before = self.allowed(zone)
+            after = self.allowed(after_zones[code], revoked, code in zone_revoked)
+            gained = after & ~before
+            lost = before & ~after
+            if not include_unchanged and not gained and not lost:
+                continue
+            row = {
+                "zone": code,
+                "before": before.bit_count(),
+                "after": after.bit_count(),
+                "gained": gained.bit_count(),
+                "lost": lost.bit_count(),
+            }
+            if show:
+                row["gained_sample"] = self.members(gained, show)
+                row["lost_sample"] = self.members(lost, show)
+            out.append(row)
+        return out